@@ -1,3 +1,5 @@
+import copy
+from functools import lru_cache
 from types import FunctionType, GenericAlias
 from typing import (
     Annotated,
@@ -47,6 +49,10 @@ else:
 
 _ModelT = TypeVar("_ModelT", bound=BaseModel)
 
+# the number of models and schemas built by `cast_to_model` and `cast_to_json`
+# that are kept for reuse
+CAST_CACHE_SIZE = 1024
+
 
 def model_dump(model: _ModelT, **kwargs: Any) -> dict[str, Any]:
     if PYDANTIC_V2 and hasattr(model, "model_dump"):
@@ -92,6 +98,12 @@ def model_copy(model: _ModelT, **kwargs: Any) -> _ModelT:
     return model.copy(**kwargs)  # type: ignore
 
 
+def model_construct(model: type[_ModelT], **kwargs: Any) -> _ModelT:
+    if PYDANTIC_V2 and hasattr(model, "model_construct"):
+        return model.model_construct(**kwargs)  # type: ignore
+    return model.construct(**kwargs)  # type: ignore
+
+
 def cast_callable_to_model(
     function: Callable[..., Any],
     name: Optional[str] = None,
@@ -124,6 +136,41 @@ def cast_type_or_alias_to_model(
     return response
 
 
+def _cache_key(
+    function_or_type: Any,
+    name: Optional[str],
+    description: Optional[str],
+    field_name: Optional[str],
+) -> Optional[tuple[Any, ...]]:
+    """
+    The key that casts are cached by, or None if it is unhashable. The name and
+    docstring are part of the key because callers may change them.
+    """
+    key = (
+        function_or_type,
+        name,
+        description,
+        field_name,
+        getattr(function_or_type, "__name__", None),
+        getattr(function_or_type, "__doc__", None),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+@lru_cache(maxsize=CAST_CACHE_SIZE)
+def _cached_cast_to_model(key: tuple[Any, ...]) -> type[BaseModel]:
+    return _cast_to_model(*key[:4])
+
+
+@lru_cache(maxsize=CAST_CACHE_SIZE)
+def _cached_cast_to_json(key: tuple[Any, ...]) -> dict[str, Any]:
+    return model_json_schema(_cached_cast_to_model(key))
+
+
 def cast_to_model(
     function_or_type: Union[type, type[BaseModel], GenericAlias, Callable[..., Any]],
     name: Optional[str] = None,
@@ -131,8 +178,20 @@ def cast_to_model(
     field_name: Optional[str] = None,
 ) -> type[BaseModel]:
     """
-    Casts a type or callable to a Pydantic model.
+    Casts a type or callable to a Pydantic model. Models are cached, so casting
+    the same type or callable with the same arguments returns the same model.
     """
+    if (key := _cache_key(function_or_type, name, description, field_name)) is None:
+        return _cast_to_model(function_or_type, name, description, field_name)
+    return _cached_cast_to_model(key)
+
+
+def _cast_to_model(
+    function_or_type: Union[type, type[BaseModel], GenericAlias, Callable[..., Any]],
+    name: Optional[str] = None,
+    description: Optional[str] = None,
+    field_name: Optional[str] = None,
+) -> type[BaseModel]:
     origin = get_origin(function_or_type) or function_or_type
 
     response = BaseModel
@@ -160,7 +219,8 @@ def cast_to_model(
         else:
             pass
 
-        response = cast_to_model(
+        # not cached, since the model's docstring is changed below
+        response = _cast_to_model(
             function_or_type.__origin__,  # type: ignore
             name=name,
             description=annotated_field_description,
@@ -199,6 +259,12 @@ def cast_to_json(
     description: Optional[str] = None,
     field_name: Optional[str] = None,
 ) -> dict[str, Any]:
-    return model_json_schema(
-        cast_to_model(function_or_type, name, description, field_name)
-    )
+    """
+    Casts a type or callable to the JSON schema of a function that returns
+    it. Schemas are cached; each call returns a copy.
+    """
+    if (key := _cache_key(function_or_type, name, description, field_name)) is None:
+        return model_json_schema(
+            _cast_to_model(function_or_type, name, description, field_name)
+        )
+    return copy.deepcopy(_cached_cast_to_json(key))
@@ -1,17 +1,31 @@
-import asyncio
 import inspect
+import math
 from enum import Enum, EnumMeta  # noqa
-from functools import partial
-from typing import Any, Callable, Literal, Optional, TypeVar
+from functools import lru_cache, partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 from typing_extensions import ParamSpec, Self
 
 from marvin._compat import BaseModel, Field
 from marvin.core.ChatCompletion import ChatCompletion
 from marvin.core.ChatCompletion.abstract import AbstractChatCompletion
+from marvin.core.ChatCompletion.usage import get_tiktoken_encoding
 from marvin.prompts import Prompt, prompt_fn
-from marvin.utilities.async_utils import run_sync
+from marvin.settings import settings
+from marvin.utilities import mapping
+from marvin.utilities.async_utils import iterate_sync, run_sync
+from marvin.utilities.local_classifier import LocalClassifier
 from marvin.utilities.logging import get_logger
+from marvin.utilities.strings import count_tokens
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -19,14 +33,34 @@ A = TypeVar("A", bound=Any)
 
 P = ParamSpec("P")
 
+ClassifierMode = Literal["function", "logit_bias", "hierarchical"]
+
+# the number of compiled classifier plans that are kept for reuse
+PLAN_CACHE_SIZE = 1024
+
+# stands in for the text to classify while a plan's messages are rendered
+TEXT_PLACEHOLDER = "\x00text\x00"
+
+# OpenAI accepts a logit bias for at most this many tokens
+MAX_LOGIT_BIAS_TOKENS = 300
+
+# labels are chosen from the numbers below this
+MAX_LABEL = 10_000
+
+# OpenAI returns the log probabilities of at most this many tokens
+MAX_TOP_LOGPROBS = 20
+
 
 def ai_classifier_prompt(
     enum: Enum,
     ctx: Optional[dict[str, Any]] = None,
+    labels: Optional[list[str]] = None,
     **kwargs: Any,
 ) -> Callable[P, Prompt[P]]:
+    labels = labels or [str(i) for i in range(1, len(enum) + 1)]  # type: ignore
+
     @prompt_fn(
-        ctx={"ctx": ctx or {}, "enum": enum, "inspect": inspect},
+        ctx={"ctx": ctx or {}, "enum": enum, "labels": labels, "inspect": inspect},
         response_model=int,  # type: ignore
         response_model_name="Index",
         response_model_description="The index of the most likely class.",
@@ -63,7 +97,7 @@ def ai_classifier_prompt(
         The user will provide text to classify, you will use your expertise
         to choose the best option below based on it:
         {% for option in enum %}
-            {{ loop.index }}. {{option.name}} ({{option.value}})
+            {{ labels[loop.index0] }}. {{option.name}} ({{option.value}})
         {% endfor %}
         {% set context = ctx.get('context_fn')(text).items() if ctx.get('context_fn') %}
         {% if context %}
@@ -78,11 +112,263 @@ def ai_classifier_prompt(
     return prompt_wrapper  # type: ignore
 
 
+def ai_classifier_packed_prompt(
+    enum: Enum,
+    ctx: Optional[dict[str, Any]] = None,
+    **kwargs: Any,
+) -> Callable[[list[Any]], Prompt[Any]]:
+    """
+    A prompt for classifying a batch of texts at once. Its response model has
+    a list of the index of each text's class, named `indexes`.
+    """
+
+    @prompt_fn(
+        ctx={"ctx": ctx or {}, "enum": enum},
+        response_model=list[int],  # type: ignore
+        response_model_name="Indexes",
+        response_model_description="The index of the most likely class of each text.",
+        response_model_field_name="indexes",
+        serialize_on_call=False,
+        **kwargs,
+    )
+    def prompt_wrapper(texts: list[Any]) -> None:  # type: ignore # noqa
+        """
+        System: You are an expert classifier that always chooses correctly
+        {{ '(note, however: ' + ctx.get('instructions') + ')' if ctx.get('instructions') }}
+
+        {{ 'Also note that: ' + enum.__doc__ if enum.__doc__ }}
+
+        The user will provide a numbered list of texts to classify, you will
+        use your expertise to choose the best option below for each of them:
+        {% for option in enum %}
+            {{ loop.index }}. {{option.name}} ({{option.value}})
+        {% endfor %}
+
+        Respond with the index of the best option for each text, in the same
+        order as the texts.
+
+        User: Classify these {{ texts|length }} texts:
+        {% for text in texts %}
+        {{ loop.index }}. {{ text }}
+        {% endfor %}
+        """  # noqa
+
+    return prompt_wrapper  # type: ignore
+
+
+class ClassifierPlan(BaseModel):
+    """
+    The parts of a classification request that do not depend on the text
+    being classified: the options, the rendered messages with a placeholder
+    for the text, and the rest of the request (the logit bias, or the
+    response model). Classifying a text only fills the placeholder.
+
+    If the messages depend on the text, because the context has a
+    `context_fn`, `messages` is None and the prompt is rendered for each text.
+    """
+
+    mode: Optional[ClassifierMode]
+    options: list[Any]
+    labels: list[str]
+    prompt: Callable[..., Any]
+    messages: Optional[list[dict[str, Any]]]
+    request: dict[str, Any]
+
+    def render_messages(self, text: Any) -> list[dict[str, Any]]:
+        if self.messages is None:
+            return self.prompt(text).to_dict()["messages"]
+        return [
+            {
+                "role": message["role"],
+                "content": inspect.cleandoc(
+                    message["content"].replace(TEXT_PLACEHOLDER, str(text)).strip()
+                ),
+            }
+            if TEXT_PLACEHOLDER in message["content"]
+            else message
+            for message in self.messages
+        ]
+
+    def to_dict(self, text: Any) -> dict[str, Any]:
+        return {"messages": self.render_messages(text), **self.request}
+
+    def parse_label(self, label: str) -> int:
+        """
+        Return the index, counting from 1, of the option with a label.
+        """
+        return self.labels.index(label.strip()) + 1
+
+    def parse_logprobs(self, logprobs: Optional[dict[str, Any]]) -> list[float]:
+        """
+        Return the probability of each option, given the log probabilities of
+        the most likely tokens of a response. Options whose labels aren't
+        among them have a probability of 0.
+        """
+        if not logprobs or not logprobs.get("content"):
+            raise ValueError("The response has no log probabilities.")
+        probabilities = [0.0] * len(self.labels)
+        for candidate in logprobs["content"][0].get("top_logprobs", []):
+            label = candidate["token"].strip()
+            if label in self.labels:
+                probabilities[self.labels.index(label)] += math.exp(
+                    candidate["logprob"]
+                )
+        total = sum(probabilities)
+        if not total:
+            raise ValueError("None of the most likely tokens is a label.")
+        return [probability / total for probability in probabilities]
+
+
+def single_token_labels(encoder: Any, count: int) -> tuple[list[str], list[int]]:
+    """
+    Choose labels for `count` options that the encoder encodes as distinct
+    single tokens, so that a classifier only has to generate one token: the
+    smallest numbers that are single tokens. Returns the labels and their
+    tokens.
+    """
+    if count > MAX_LOGIT_BIAS_TOKENS:
+        raise ValueError(
+            f"Logit bias classifiers support at most {MAX_LOGIT_BIAS_TOKENS}"
+            f" options, but {count} were provided. Use the `hierarchical` or"
+            " `function` mode instead."
+        )
+    labels: list[str] = []
+    tokens: list[int] = []
+    for number in range(1, MAX_LABEL):
+        if len(labels) == count:
+            break
+        encoded = encoder.encode(str(number))
+        if len(encoded) == 1 and encoded[0] not in tokens:
+            labels.append(str(number))
+            tokens.append(encoded[0])
+    if len(labels) < count:
+        raise ValueError(
+            f"The tokenizer only has {len(labels)} single-token labels, but"
+            f" {count} options were provided. Use the `hierarchical` or"
+            " `function` mode instead."
+        )
+    return labels, tokens
+
+
+def build_classifier_plan(
+    enum: type[Enum],
+    ctx: dict[str, Any],
+    mode: Optional[ClassifierMode],
+    model: Optional[str] = None,
+) -> ClassifierPlan:
+    if mode == "logit_bias":
+        labels, tokens = single_token_labels(get_tiktoken_encoding(model), len(enum))
+        request: dict[str, Any] = {
+            "logit_bias": {token: 100 for token in tokens},
+            "max_tokens": 1,
+        }
+    else:
+        labels = [str(i) for i in range(1, len(enum) + 1)]
+    prompt = ai_classifier_prompt(enum, ctx=ctx, labels=labels)  # type: ignore
+    if mode != "logit_bias":
+        request = {
+            "functions": None,
+            "function_call": None,
+            "response_model": prompt(TEXT_PLACEHOLDER).response_model,
+        }
+    messages = None
+    if not ctx.get("context_fn"):
+        messages = prompt(TEXT_PLACEHOLDER).to_dict()["messages"]
+    return ClassifierPlan(
+        mode=mode,
+        options=list(enum),
+        labels=labels,
+        prompt=prompt,
+        messages=messages,
+        request=request,
+    )
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_classifier_plan(
+    enum: type[Enum],
+    instructions: Optional[str],
+    mode: Optional[ClassifierMode],
+    model: Optional[str] = None,
+) -> ClassifierPlan:
+    """
+    Build the plan of a classifier without any context besides its
+    instructions. Plans are cached, since building one renders the whole
+    prompt and loads the tokenizer.
+    """
+    return build_classifier_plan(enum, {"instructions": instructions}, mode, model)
+
+
+class ClassifierNode(BaseModel):
+    """
+    A node of a hierarchical classifier: an enum that chooses between the
+    node's children, which are either nodes or members of the classified enum.
+    """
+
+    enum: Any
+    children: list[Any]
+
+
+def build_classifier_tree(
+    enum: type["AIEnum"], members: list[Any], group_size: int
+) -> ClassifierNode:
+    """
+    Build a tree of enums whose leaves are the members, with at most
+    `group_size` children per node. Members are grouped in order, so related
+    members should be declared next to each other.
+    """
+    if group_size < 2:
+        raise ValueError("A hierarchical classifier needs a group size of 2 or more.")
+    if len(members) <= group_size:
+        children: list[Any] = members
+        options = {member.name: member.value for member in members}
+    else:
+        # computed with integers, since float logarithms of exact powers of
+        # the group size can round up and put every member in one child
+        depth = 1
+        while group_size**depth < len(members):
+            depth += 1
+        size = group_size ** (depth - 1)
+        children = [
+            build_classifier_tree(enum, members[i : i + size], group_size)
+            for i in range(0, len(members), size)
+        ]
+        options = {
+            f"GROUP_{i}": "one of: " + ", ".join(_leaf_names(child))
+            for i, child in enumerate(children, start=1)
+        }
+    node_enum = AIEnum(enum.__name__, options)  # type: ignore
+    node_enum.__metadata__ = AIEnumMetaData(  # type: ignore
+        model=enum.__metadata__.model,
+        ctx=enum.__metadata__.ctx,
+        instructions=enum.__metadata__.instructions,
+        mode="logit_bias",
+    )
+    node_enum.__doc__ = enum.__doc__
+    return ClassifierNode(enum=node_enum, children=children)
+
+
+def _leaf_names(node: ClassifierNode) -> list[str]:
+    return [
+        name
+        for child in node.children
+        for name in (
+            _leaf_names(child) if isinstance(child, ClassifierNode) else [child.name]
+        )
+    ]
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_classifier_tree(enum: type["AIEnum"], group_size: int) -> ClassifierNode:
+    return build_classifier_tree(enum, list(enum), group_size)
+
+
 class AIEnumMetaData(BaseModel):
     model: Any = Field(default_factory=ChatCompletion)
     ctx: Optional[dict[str, Any]] = None
     instructions: Optional[str] = None
-    mode: Optional[Literal["function", "logit_bias"]] = "logit_bias"
+    mode: Optional[ClassifierMode] = "logit_bias"
+    local: Any = None
 
 
 class AIEnumMeta(EnumMeta):
@@ -109,24 +395,46 @@ class AIEnumMeta(EnumMeta):
         model: Optional[str] = None,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
         **model_kwargs: Any,
     ) -> type[Enum]:
-        cls.__metadata__ = AIEnumMetaData(
-            model=ChatCompletion(model=model, **model_kwargs),
+        if names is not None:
+            cls.__metadata__ = AIEnumMetaData(
+                model=ChatCompletion(model=model, **model_kwargs),
+                ctx=ctx,
+                instructions=instructions,
+                mode=mode,
+            )
+            return super().__call__(
+                value,
+                names,  # type: ignore
+                *args,
+                module=module,
+                qualname=qualname,
+                type=type,
+                start=start,
+            )
+
+        if not (model or model_kwargs or ctx or instructions or mode):
+            return super().__call__(value)
+
+        # a lookup with its own settings passes them to `call` rather than
+        # changing the classifier's, which other calls may be using
+        for member in cls:  # type: ignore
+            if member.value == value:
+                return member
+        index = cls.call(  # type: ignore
+            value,
             ctx=ctx,
             instructions=instructions,
             mode=mode,
+            chat_completion=(
+                ChatCompletion(model=model, **model_kwargs)
+                if model or model_kwargs
+                else None
+            ),
         )
-        return super().__call__(
-            value,
-            names,  # type: ignore
-            *args,
-            module=module,
-            qualname=qualname,
-            type=type,
-            start=start,
-        )
+        return list(cls)[index - 1]  # type: ignore
 
 
 class AIEnum(Enum, metaclass=AIEnumMeta):
@@ -155,6 +463,46 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         ctx["instructions"] = instructions or ctx.get("instructions", None)
         return ai_classifier_prompt(cls, ctx=ctx, **kwargs)  # type: ignore # noqa
 
+    @classmethod
+    def get_plan(
+        cls,
+        *,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        mode: Optional[ClassifierMode] = None,
+        chat_completion: Optional[Any] = None,
+    ) -> ClassifierPlan:
+        """
+        Get the plan for classifying texts with this enum. Plans are built
+        once per enum, instructions, mode and model, unless the context has
+        other keys. `chat_completion` overrides the classifier's model.
+        """
+        ctx = dict(ctx or cls.__metadata__.ctx or {})
+        instructions = instructions or cls.__metadata__.instructions
+        ctx["instructions"] = instructions or ctx.get("instructions", None)
+        mode = mode or cls.__metadata__.mode
+        if mode == "hierarchical":
+            # the plan of the first step
+            return cls.get_tree().enum.get_plan(
+                ctx=ctx,
+                instructions=instructions,
+                mode="logit_bias",
+                chat_completion=chat_completion,
+            )
+        model = (chat_completion or cls.__metadata__.model).defaults.get("model")
+        if set(ctx) == {"instructions"}:
+            return compile_classifier_plan(cls, ctx["instructions"], mode, model)
+        return build_classifier_plan(cls, ctx, mode, model)
+
+    @classmethod
+    def get_tree(cls) -> ClassifierNode:
+        """
+        Get the tree of enums that classifies texts with this enum in
+        hierarchical mode, which has at most `settings.ai_classifier_group_size`
+        options per step.
+        """
+        return compile_classifier_tree(cls, settings.ai_classifier_group_size)
+
     @classmethod
     def as_prompt(
         cls,
@@ -162,29 +510,16 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         *,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
         model: Optional[str] = None,
         **model_kwargs: Any,
     ) -> dict[str, Any]:
         ctx = ctx or cls.__metadata__.ctx or {}
         instructions = instructions or cls.__metadata__.instructions
         ctx["instructions"] = instructions or ctx.get("instructions", None)
-        mode = mode or cls.__metadata__.mode
-        response = cls.get_prompt(instructions=instructions, ctx=ctx)(value).serialize(
-            model=cls.__metadata__.model,
-        )
-        if mode == "logit_bias":
-            import tiktoken
-
-            response.pop("functions", None)
-            response.pop("function_call", None)
-            response.pop("response_model", None)
-            encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
-            response["logit_bias"] = {
-                encoder.encode(str(j))[0]: 100 for j in range(1, len(cls) + 1)
-            }
-            response["max_tokens"] = 1
-        return response
+        return cls.__metadata__.model(
+            **cls.as_dict(value, ctx=ctx, instructions=instructions, mode=mode)
+        )._serialize_request()
 
     @classmethod
     def as_dict(
@@ -192,28 +527,15 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         value: Any,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
         **kwargs: Any,
     ) -> dict[str, Any]:
         ctx = ctx or cls.__metadata__.ctx or {}
         instructions = instructions or cls.__metadata__.instructions
         ctx["instructions"] = instructions or ctx.get("instructions", None)
-        mode = mode or cls.__metadata__.mode
-
-        response = cls.get_prompt(ctx=ctx, instructions=instructions)(value).to_dict()
-        if mode == "logit_bias":
-            import tiktoken
-
-            response.pop("functions", None)
-            response.pop("function_call", None)
-            response.pop("response_model", None)
-            encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
-            response["logit_bias"] = {
-                encoder.encode(str(j))[0]: 100 for j in range(1, len(cls) + 1)
-            }
-            response["max_tokens"] = 1
-
-        return response
+        return cls.get_plan(ctx=ctx, instructions=instructions, mode=mode).to_dict(
+            value
+        )
 
     @classmethod
     def as_chat_completion(
@@ -221,7 +543,7 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         value: Any,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
     ) -> AbstractChatCompletion[T]:  # type: ignore # noqa
         ctx = ctx or cls.__metadata__.ctx or {}
         instructions = instructions or cls.__metadata__.instructions
@@ -237,22 +559,41 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         value: Any,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
+        chat_completion: Optional[Any] = None,
     ) -> Any:
         get_logger("marvin.AIClassifier").debug_kv(
             f"Calling `AIEnum` {cls.__name__!r}", f" with value {value!r}."
         )
-
-        ctx = ctx or cls.__metadata__.ctx or {}
-        instructions = instructions or cls.__metadata__.instructions
-        ctx["instructions"] = instructions or ctx.get("instructions", None)
-        mode = mode or cls.__metadata__.mode
-        chat_completion = cls.as_chat_completion(  # type: ignore # noqa
-            value, ctx=ctx, instructions=instructions, mode=mode
+        overridden = ctx or instructions or mode or chat_completion
+        if cls.__metadata__.local and not overridden:
+            return run_sync(cls.acall(value))
+
+        if (mode or cls.__metadata__.mode) == "hierarchical":
+            node = cls.get_tree()
+            while isinstance(node, ClassifierNode):
+                index = 1
+                if len(node.children) > 1:
+                    index = node.enum.call(
+                        value,
+                        ctx=ctx,
+                        instructions=instructions,
+                        chat_completion=chat_completion,
+                    )
+                node = node.children[index - 1]
+            return list(cls).index(node) + 1
+
+        plan = cls.get_plan(
+            ctx=ctx,
+            instructions=instructions,
+            mode=mode,
+            chat_completion=chat_completion,
         )
-        if cls.__metadata__.mode == "logit_bias":
-            return int(chat_completion.create().response.choices[0].message.content)  # type: ignore # noqa
-        return getattr(chat_completion.create().to_model(), "index")  # type: ignore
+        model = chat_completion or cls.__metadata__.model
+        turn = model(**plan.to_dict(value)).create()
+        if plan.mode == "logit_bias":
+            return plan.parse_label(turn.response.choices[0].message.content)  # type: ignore # noqa
+        return getattr(turn.to_model(), "index")  # type: ignore
 
     @classmethod
     async def acall(
@@ -260,35 +601,232 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         value: Any,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = None,
+        mode: Optional[ClassifierMode] = None,
+        chat_completion: Optional[Any] = None,
     ) -> Any:
         get_logger("marvin.AIClassifier").debug_kv(
             f"Calling `AIEnum` {cls.__name__!r}", f" with value {value!r}."
         )
-        ctx = ctx or cls.__metadata__.ctx or {}
-        instructions = instructions or cls.__metadata__.instructions
-        ctx["instructions"] = instructions or ctx.get("instructions", None)
-        mode = mode or cls.__metadata__.mode
-        chat_completion = cls.as_chat_completion(  # type: ignore # noqa
-            value, ctx=ctx, instructions=instructions, mode=mode
+        overridden = ctx or instructions or mode or chat_completion
+        if cls.__metadata__.local and not overridden:
+            members = list(cls)
+
+            async def classify(text: str) -> str:
+                return members[await cls._acall_llm(text) - 1].name
+
+            label = await cls.__metadata__.local.aclassify(str(value), classify)
+            return members.index(cls[label]) + 1
+
+        return await cls._acall_llm(value, ctx, instructions, mode, chat_completion)
+
+    @classmethod
+    async def _acall_llm(
+        cls,
+        value: Any,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        mode: Optional[ClassifierMode] = None,
+        chat_completion: Optional[Any] = None,
+    ) -> Any:
+        if (mode or cls.__metadata__.mode) == "hierarchical":
+            node = cls.get_tree()
+            while isinstance(node, ClassifierNode):
+                index = 1
+                if len(node.children) > 1:
+                    index = await node.enum.acall(
+                        value,
+                        ctx=ctx,
+                        instructions=instructions,
+                        chat_completion=chat_completion,
+                    )
+                node = node.children[index - 1]
+            return list(cls).index(node) + 1
+
+        plan = cls.get_plan(
+            ctx=ctx,
+            instructions=instructions,
+            mode=mode,
+            chat_completion=chat_completion,
+        )
+        model = chat_completion or cls.__metadata__.model
+        turn = await model(**plan.to_dict(value)).acreate()
+        if plan.mode == "logit_bias":
+            return plan.parse_label(turn.response.choices[0].message.content)  # type: ignore # noqa
+        return getattr(turn.to_model(), "index")  # type: ignore
+
+    @classmethod
+    def predict_proba(
+        cls,
+        value: Any,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        top_k: Optional[int] = None,
+    ) -> dict[Any, float]:
+        """
+        Return the probability of each member for a value. See
+        `apredict_proba`.
+        """
+        return run_sync(
+            cls.apredict_proba(value, ctx=ctx, instructions=instructions, top_k=top_k)
         )
-        if cls.__metadata__.mode == "logit_bias":
-            return int((await chat_completion.acreate()).response.choices[0].message.content)  # type: ignore # noqa
-        return getattr((await chat_completion.acreate()).to_model(), "index")  # type: ignore # noqa
+
+    @classmethod
+    async def apredict_proba(
+        cls,
+        value: Any,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        top_k: Optional[int] = None,
+    ) -> dict[Any, float]:
+        """
+        Return the probability of each member for a value, from the log
+        probabilities of the single token that a logit bias classifier
+        generates. This takes one request, like `acall`.
+
+        The probabilities of the `top_k` most likely members are returned
+        (all of them by default, and at most 20) are normalized to add up to
+        1, and the other members have a probability of 0. Requires an OpenAI model
+        that returns log probabilities.
+        """
+        plan = cls.get_plan(ctx=ctx, instructions=instructions, mode="logit_bias")
+        top_k = min(top_k or len(plan.options), MAX_TOP_LOGPROBS)
+        chat_completion = cls.__metadata__.model(
+            **plan.to_dict(value), logprobs=True, top_logprobs=top_k
+        )
+        turn = await chat_completion.acreate()
+        probabilities = plan.parse_logprobs(turn.response.choices[0].logprobs)
+        return dict(zip(plan.options, probabilities))
 
     @classmethod
     def map(cls, items: list[str], **kwargs: Any) -> list[Any]:
         """
         Map the classifier over a list of items.
         """
-        coros = [cls.acall(item, **kwargs) for item in items]
+        return run_sync(cls.amap(items, **kwargs))
+
+    @classmethod
+    async def amap(cls, items: list[str], **kwargs: Any) -> list[Any]:
+        return [member async for member in cls.amap_iter(items, **kwargs)]
+
+    @classmethod
+    async def amap_iter(
+        cls,
+        items: mapping.Inputs[Any],
+        *,
+        ordered: bool = True,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        on_progress: Optional[Callable[[mapping.MapProgress], Any]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """
+        Classify each item of an iterable or async iterable, and yield the
+        classes as they are ready. Any other keyword arguments are passed to
+        every call of `acall`.
+
+        Items are read lazily and at most `max_concurrency` calls run at once
+        (`settings.map_max_concurrency` by default). Classes are yielded in
+        order, or as `(index, class)` pairs as soon as each call finishes if
+        `ordered` is False. If `return_exceptions` is True, a failed call
+        yields its exception instead of stopping the map. `on_progress` is
+        called with a `MapProgress` after each call.
+        """
+        members = list(cls)
+
+        async def classify(item: Any) -> Any:
+            return members[await cls.acall(item, **kwargs) - 1]
+
+        options: dict[str, Any] = dict(
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+            on_progress=on_progress,
+        )
+        if ordered:
+            async for member in mapping.amap_ordered(classify, items, **options):
+                yield member
+        else:
+            async for index, member in mapping.amap_as_completed(
+                classify, items, **options
+            ):
+                yield index, member
+
+    @classmethod
+    def map_iter(cls, items: mapping.Inputs[Any], **kwargs: Any) -> Iterator[Any]:
+        """
+        Iterate over a map of the classifier synchronously. See `amap_iter`.
+        """
+        return iterate_sync(cls.amap_iter(items, **kwargs))
+
+    @classmethod
+    def map_packed(cls, items: list[Any], **kwargs: Any) -> list[Any]:
+        """
+        Classify many items with few requests. See `amap_packed`.
+        """
+        return run_sync(cls.amap_packed(items, **kwargs))
+
+    @classmethod
+    async def amap_packed(
+        cls,
+        items: list[Any],
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+    ) -> list[Any]:
+        """
+        Classify a list of items like `amap`, but pack as many items as fit
+        into each request, so the options and instructions are sent once per
+        batch instead of once per item.
+
+        A batch holds at most `settings.map_packed_max_inputs` items whose
+        texts add up to at most `settings.map_packed_max_tokens` tokens. The
+        classes are returned in the order of the items. If a batch's response
+        doesn't have one valid index per item, its invalid items are
+        classified on their own.
+        """
+        ctx = ctx or cls.__metadata__.ctx or {}
+        instructions = instructions or cls.__metadata__.instructions
+        ctx["instructions"] = instructions or ctx.get("instructions", None)
+        if ctx.get("context_fn"):
+            # each item has its own context, so it needs its own prompt
+            return await cls.amap(items, ctx=ctx, instructions=instructions)
+
+        members = list(cls)
+        prompt = ai_classifier_packed_prompt(cls, ctx=ctx)
+        results: list[Any] = [None] * len(items)
+        unpacked: list[int] = []
+
+        async def classify_packed(batch: list[int]) -> None:
+            request = prompt([items[i] for i in batch]).to_dict()
+            turn = await cls.__metadata__.model(**request).acreate()
+            try:
+                indexes = turn.get_function_call()[0][1]["indexes"]
+                if not isinstance(indexes, list) or len(indexes) != len(batch):
+                    raise ValueError(
+                        f"Expected {len(batch)} indexes, but got {indexes!r}."
+                    )
+            except (KeyError, ValueError) as exc:
+                get_logger("marvin.AIClassifier").warning_kv(
+                    f"Packed call of `AIEnum` {cls.__name__!r} failed",
+                    f"{exc} Classifying each of its {len(batch)} items instead.",
+                    key_style="yellow",
+                )
+                unpacked.extend(batch)
+                return
+            for item, index in zip(batch, indexes):
+                if type(index) is int and 1 <= index <= len(members):
+                    results[item] = members[index - 1]
+                else:
+                    unpacked.append(item)
+
+        await mapping.amap(
+            classify_packed, mapping.pack([count_tokens(str(i)) for i in items])
+        )
 
-        # gather returns a future, but run_sync requires a coroutine
-        async def gather_coros() -> list[Any]:
-            return await asyncio.gather(*coros)
+        async def classify(item: int) -> None:
+            index = await cls.acall(items[item], ctx=ctx, instructions=instructions)
+            results[item] = members[index - 1]
 
-        results = run_sync(gather_coros())
-        return [list(cls)[result - 1] for result in results]
+        await mapping.amap(classify, sorted(unpacked))
+        return results
 
     @classmethod
     def as_decorator(
@@ -296,8 +834,9 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
         enum: Optional[Enum] = None,
         ctx: Optional[dict[str, Any]] = None,
         instructions: Optional[str] = None,
-        mode: Optional[Literal["function", "logit_bias"]] = "logit_bias",
+        mode: Optional[ClassifierMode] = "logit_bias",
         model: Optional[str] = None,
+        local: Union[bool, LocalClassifier, None] = None,
         **model_kwargs: Any,
     ) -> Self:
         if not enum:
@@ -307,6 +846,7 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
                 instructions=instructions,
                 mode=mode,
                 model=model,
+                local=local,
                 **model_kwargs,
             )  # type: ignore
         response = cls(
@@ -321,6 +861,7 @@ class AIEnum(Enum, metaclass=AIEnumMeta):
                 ctx=ctx,
                 instructions=instructions,
                 mode=mode,
+                local=LocalClassifier() if local is True else local or None,
             ),
         )
 
@@ -1,16 +1,39 @@
-import asyncio
+import hashlib
 import inspect
+import json
 from functools import partial
-from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 from typing_extensions import ParamSpec, Self
 
-from marvin._compat import BaseModel, Field
+from marvin._compat import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+    cast_to_model,
+    model_dump_json,
+    model_schema,
+)
 from marvin.core.ChatCompletion import ChatCompletion
 from marvin.core.ChatCompletion.abstract import AbstractChatCompletion
+from marvin.core.ChatCompletion.cache import NON_KEY_PARAMS
 from marvin.prompts import Prompt, prompt_fn
-from marvin.utilities.async_utils import run_sync
+from marvin.utilities import mapping
+from marvin.utilities.async_utils import iterate_sync, run_sync
 from marvin.utilities.logging import get_logger
+from marvin.utilities.memoization import CacheStore, get_cache_store
+from marvin.utilities.semantic_cache import SemanticCache, get_semantic_cache
+from marvin.utilities.strings import count_tokens
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -24,11 +47,13 @@ def ai_fn_prompt(
     ctx: Optional[dict[str, Any]] = None,
     **kwargs: Any,
 ) -> Callable[P, Prompt[P]]:
-    return_annotation: Any = inspect.signature(func).return_annotation
+    signature = inspect.signature(func)
+    # read once, since `inspect.getsource` goes through the file system
+    source = "def" + "".join(inspect.getsource(func).split("def")[1:])
 
     @prompt_fn(
-        ctx={"ctx": ctx or {}, "func": func, "inspect": inspect},
-        response_model=return_annotation,
+        ctx={"ctx": ctx or {}, "signature": signature, "source": source},
+        response_model=signature.return_annotation,
         serialize_on_call=False,
         **kwargs,
     )
@@ -39,14 +64,13 @@ def ai_fn_prompt(
         Your job is to generate likely outputs for a Python function with the
         following signature and docstring:
 
-        {{'def' + ''.join(inspect.getsource(func).split('def')[1:])}}
+        {{ source }}
 
         The user will provide function inputs (if any) and you must respond with
         the most likely result, which must be valid, double-quoted JSON.
 
         User: The function was called with the following inputs:
-        {% set sig = inspect.signature(func) %}
-        {% set binds = sig.bind(*args, **kwargs) %}
+        {% set binds = signature.bind(*args, **kwargs) %}
         {% set defaults = binds.apply_defaults() %}
         {% set params = binds.arguments %}
         {%for (arg, value) in params.items()%}
@@ -59,6 +83,55 @@ def ai_fn_prompt(
     return prompt_wrapper  # type: ignore
 
 
+def ai_fn_packed_prompt(
+    func: Callable[P, Any],
+    ctx: Optional[dict[str, Any]] = None,
+    response_model_field_name: Optional[str] = None,
+    **kwargs: Any,
+) -> Callable[[list[dict[str, Any]]], Prompt[Any]]:
+    """
+    A prompt for a batch of calls to `func` at once. It is called with the
+    bound arguments of each call, and its response model has a list of
+    outputs named `outputs` (so `response_model_field_name` is ignored).
+    """
+    return_annotation = inspect.signature(func).return_annotation
+    source = "def" + "".join(inspect.getsource(func).split("def")[1:])
+
+    @prompt_fn(
+        ctx={"ctx": ctx or {}, "source": source},
+        response_model=list[return_annotation],  # type: ignore
+        response_model_field_name="outputs",
+        serialize_on_call=False,
+        **kwargs,
+    )
+    def prompt_wrapper(calls: list[dict[str, Any]]) -> None:  # type: ignore # noqa
+        """
+        System: {{ctx.get('instructions') if ctx.get('instructions')}}
+
+        Your job is to generate likely outputs for a Python function with the
+        following signature and docstring:
+
+        {{ source }}
+
+        The user will provide a numbered list of function inputs and you must
+        respond with the most likely result for each of them, in the same
+        order. Each result must be valid, double-quoted JSON.
+
+        User: The function was called {{ calls|length }} times, with the
+        following inputs:
+        {% for params in calls %}
+        {{ loop.index }}.
+        {% for (arg, value) in params.items() %}
+        - {{ arg }}: {{ value }}
+        {% endfor %}
+        {% endfor %}
+
+        What are its {{ calls|length }} outputs?
+        """
+
+    return prompt_wrapper  # type: ignore
+
+
 class AIFunction(BaseModel, Generic[P, T]):
     fn: Callable[P, Any]
     ctx: Optional[dict[str, Any]] = None
@@ -66,6 +139,15 @@ class AIFunction(BaseModel, Generic[P, T]):
     response_model_name: Optional[str] = Field(default=None, exclude=True)
     response_model_description: Optional[str] = Field(default=None, exclude=True)
     response_model_field_name: Optional[str] = Field(default=None, exclude=True)
+    # a CacheStore to memoize results in, or True for the process-wide one
+    cache: Any = Field(default=None, exclude=True)
+    # a SemanticCache, or True for the process-wide one
+    semantic_cache: Any = Field(default=None, exclude=True)
+
+    # compiled prompts by name, with the fields they were compiled from
+    _prompts: dict[str, tuple[tuple[Any, ...], Callable[..., Prompt[Any]]]] = (
+        PrivateAttr(default_factory=dict)
+    )
 
     def __call__(
         self,
@@ -79,16 +161,50 @@ class AIFunction(BaseModel, Generic[P, T]):
 
         return self.call(*args, **kwargs)
 
+    def _compile(
+        self, name: str, prompt: Callable[..., Callable[..., Prompt[Any]]]
+    ) -> Callable[..., Prompt[Any]]:
+        """
+        Compile one of the function's prompts on first use, and reuse it until
+        the function's fields change.
+        """
+        key = (
+            self.fn,
+            self.ctx,
+            self.response_model_name,
+            self.response_model_description,
+            self.response_model_field_name,
+        )
+        if name not in self._prompts or self._prompts[name][0] != key:
+            self._prompts[name] = (
+                key,
+                prompt(
+                    self.fn,
+                    ctx=self.ctx,
+                    response_model_name=self.response_model_name,
+                    response_model_description=self.response_model_description,
+                    response_model_field_name=self.response_model_field_name,
+                ),
+            )
+        return self._prompts[name][1]
+
     def get_prompt(
         self,
     ) -> Callable[P, Prompt[P]]:
-        return ai_fn_prompt(
-            self.fn,
-            ctx=self.ctx,
-            response_model_name=self.response_model_name,
-            response_model_description=self.response_model_description,
-            response_model_field_name=self.response_model_field_name,
-        )
+        """
+        Get the function's prompt. The prompt is compiled on first use and
+        reused until the function's fields change, so that each call only
+        renders the arguments.
+        """
+        return self._compile("call", ai_fn_prompt)
+
+    def get_packed_prompt(
+        self,
+    ) -> Callable[[list[dict[str, Any]]], Prompt[Any]]:
+        """
+        Get the prompt for a batch of calls, see `amap_packed`.
+        """
+        return self._compile("packed", ai_fn_packed_prompt)
 
     def as_prompt(
         self,
@@ -113,12 +229,124 @@ class AIFunction(BaseModel, Generic[P, T]):
     ) -> AbstractChatCompletion[T]:
         return self.model(**self.as_dict(*args, **kwargs))
 
+    def get_response_model(self) -> type[BaseModel]:
+        return cast_to_model(
+            inspect.signature(self.fn).return_annotation,
+            name=self.response_model_name,
+            description=self.response_model_description,
+            field_name=self.response_model_field_name,
+        )
+
+    def _get_cache(self) -> Optional[CacheStore]:
+        if self.cache is True:
+            return get_cache_store()
+        return self.cache or None
+
+    def _get_semantic_cache(self) -> Optional[SemanticCache]:
+        if self.semantic_cache is True:
+            return get_semantic_cache()
+        return self.semantic_cache or None
+
+    def _version(self) -> str:
+        """
+        A hash of the function's signature, docstring and context, so cached
+        results are invalidated when they change.
+        """
+        return hashlib.sha256(
+            f"{inspect.signature(self.fn)}{self.fn.__doc__}{self.ctx}".encode()
+        ).hexdigest()[:12]
+
+    def _semantic_cache_namespace(self) -> str:
+        """
+        Results are cached separately for each function, model and version of
+        the function's signature and docstring.
+        """
+        model = getattr(self.model, "defaults", {}).get("model")
+        return (
+            f"{self.fn.__module__}.{self.fn.__qualname__}:"
+            f"{getattr(self.model, 'provider', None)}/{model}:{self._version()}"
+        )
+
+    def _cache_key(self, *args: P.args, **kwargs: P.kwargs) -> str:
+        """
+        The key a call's result is memoized by: the function, the version of
+        its signature and docstring, the model and its parameters, and the
+        bound arguments.
+        """
+        bound = inspect.signature(self.fn).bind(*args, **kwargs)
+        bound.apply_defaults()
+        payload = json.dumps(
+            {
+                "function": f"{self.fn.__module__}.{self.fn.__qualname__}",
+                "version": self._version(),
+                "provider": getattr(self.model, "provider", None),
+                "model": {
+                    k: v
+                    for k, v in getattr(self.model, "defaults", {}).items()
+                    if k not in NON_KEY_PARAMS
+                },
+                "arguments": bound.arguments,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _arguments_text(self, *args: P.args, **kwargs: P.kwargs) -> str:
+        bound = inspect.signature(self.fn).bind(*args, **kwargs)
+        bound.apply_defaults()
+        return "\n".join(f"- {arg}: {value}" for arg, value in bound.arguments.items())
+
+    def _get_model(self, *args: P.args, **kwargs: P.kwargs) -> BaseModel:
+        if (store := self._get_cache()) is not None:
+            key = self._cache_key(*args, **kwargs)
+            if (cached := store.get(key)) is not None:
+                return self.get_response_model()(**json.loads(cached))
+
+        chat_completion = self.as_chat_completion(*args, **kwargs)
+        if (semantic_cache := self._get_semantic_cache()) is None:
+            model_instance = chat_completion.create().to_model()
+        else:
+            namespace = self._semantic_cache_namespace()
+            text = self._arguments_text(*args, **kwargs)
+            vector = run_sync(semantic_cache.aembed(text))
+            if (cached := semantic_cache.get(namespace, vector)) is not None:
+                return self.get_response_model()(**json.loads(cached))
+            model_instance = chat_completion.create().to_model()
+            semantic_cache.set(namespace, vector, model_dump_json(model_instance))
+
+        if store is not None:
+            store.set(key, model_dump_json(model_instance))
+        return model_instance
+
+    async def _aget_model(self, *args: P.args, **kwargs: P.kwargs) -> BaseModel:
+        if (store := self._get_cache()) is not None:
+            key = self._cache_key(*args, **kwargs)
+            if (cached := store.get(key)) is not None:
+                return self.get_response_model()(**json.loads(cached))
+
+        chat_completion = self.as_chat_completion(*args, **kwargs)
+        if (semantic_cache := self._get_semantic_cache()) is None:
+            model_instance = (await chat_completion.acreate()).to_model()
+        else:
+            namespace = self._semantic_cache_namespace()
+            text = self._arguments_text(*args, **kwargs)
+            vector = await semantic_cache.aembed(text)
+            if (cached := semantic_cache.get(namespace, vector)) is not None:
+                return self.get_response_model()(**json.loads(cached))
+            model_instance = (await chat_completion.acreate()).to_model()
+            semantic_cache.set(namespace, vector, model_dump_json(model_instance))
+
+        if store is not None:
+            store.set(key, model_dump_json(model_instance))
+        return model_instance
+
     def call(
         self,
         *args: P.args,
         **kwargs: P.kwargs,
     ) -> Any:
-        model_instance = self.as_chat_completion(*args, **kwargs).create().to_model()
+        model_instance = self._get_model(*args, **kwargs)
         response_model_field_name = self.response_model_field_name or "output"
 
         if (output := getattr(model_instance, response_model_field_name, None)) is None:
@@ -131,9 +359,7 @@ class AIFunction(BaseModel, Generic[P, T]):
         *args: P.args,
         **kwargs: P.kwargs,
     ) -> Any:
-        model_instance = (
-            await self.as_chat_completion(*args, **kwargs).acreate()
-        ).to_model()
+        model_instance = await self._aget_model(*args, **kwargs)
 
         response_model_field_name = self.response_model_field_name or "output"
 
@@ -142,6 +368,66 @@ class AIFunction(BaseModel, Generic[P, T]):
 
         return output
 
+    async def astream(
+        self,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> AsyncIterator[Any]:
+        """
+        Call the function like `acall`, but yield its output as it streams.
+
+        If the function returns a list, each item is yielded as soon as it is
+        complete. Otherwise, progressively more complete outputs are yielded
+        and the last one is the validated result.
+        """
+        chat_completion = self.as_chat_completion(*args, **kwargs)
+        response_model = chat_completion.defaults["response_model"]
+        response_model_field_name = self.response_model_field_name or "output"
+        field_schema = (
+            model_schema(response_model)
+            .get("properties", {})
+            .get(response_model_field_name)
+        )
+
+        if field_schema is None:
+            async for model_instance in chat_completion.astream_model():
+                yield model_instance
+            return
+
+        if field_schema.get("type") != "array":
+            async for model_instance in chat_completion.astream_model():
+                if (
+                    output := getattr(model_instance, response_model_field_name, None)
+                ) is not None:
+                    yield output
+            return
+
+        # the last item of a list that is still streaming may be incomplete,
+        # so items are only yielded once the next item starts or the list ends
+        completed = 0
+        items: list[Any] = []
+        async for model_instance in chat_completion.astream_model():
+            items = getattr(model_instance, response_model_field_name, None) or []
+            for item in items[completed:-1]:
+                yield getattr(
+                    response_model(**{response_model_field_name: [item]}),
+                    response_model_field_name,
+                )[0]
+            completed = max(completed, len(items) - 1)
+        for item in items[completed:]:
+            yield item
+
+    def stream(
+        self,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> Iterator[Any]:
+        """
+        Iterate over the function's output synchronously as it streams. See
+        `astream`.
+        """
+        return iterate_sync(self.astream(*args, **kwargs))
+
     def map(self, *map_args: list[Any], **map_kwargs: list[Any]):
         """
         Map the AI function over a sequence of arguments. Runs concurrently.
@@ -159,22 +445,141 @@ class AIFunction(BaseModel, Generic[P, T]):
         return run_sync(self.amap(*map_args, **map_kwargs))
 
     async def amap(self, *map_args: list[Any], **map_kwargs: list[Any]) -> list[Any]:
-        tasks: list[Any] = []
-        if map_args:
-            max_length = max(len(arg) for arg in map_args)
-        else:
-            max_length = max(len(v) for v in map_kwargs.values())
-
-        for i in range(max_length):
-            call_args = [arg[i] if i < len(arg) else None for arg in map_args]
-            call_kwargs = (
-                {k: v[i] if i < len(v) else None for k, v in map_kwargs.items()}
-                if map_kwargs
-                else {}
+        return await mapping.amap(
+            lambda call: self.acall(*call[0], **call[1]),
+            mapping.map_calls(map_args, map_kwargs),
+        )
+
+    def map_packed(self, *map_args: list[Any], **map_kwargs: list[Any]) -> list[Any]:
+        """
+        Map the AI function like `map`, but send many calls in each request.
+        See `amap_packed`.
+
+        This method should be called synchronously.
+        """
+        return run_sync(self.amap_packed(*map_args, **map_kwargs))
+
+    async def amap_packed(
+        self, *map_args: list[Any], **map_kwargs: list[Any]
+    ) -> list[Any]:
+        """
+        Map the AI function like `amap`, but pack as many calls as fit into
+        each request, so the instructions and function source are sent once
+        per batch instead of once per call.
+
+        A batch holds at most `settings.map_packed_max_inputs` calls whose
+        inputs add up to at most `settings.map_packed_max_tokens` tokens.
+        The outputs are returned in the order of the inputs. Calls whose
+        output is missing or invalid are retried on their own.
+        """
+        signature = inspect.signature(self.fn)
+        calls = list(mapping.map_calls(map_args, map_kwargs))
+        arguments: list[dict[str, Any]] = []
+        for args, kwargs in calls:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments.append(bound.arguments)
+
+        batches = mapping.pack(
+            [
+                count_tokens(
+                    "\n".join(f"- {arg}: {value}" for arg, value in params.items())
+                )
+                for params in arguments
+            ]
+        )
+
+        response_model = self.get_response_model()
+        response_model_field_name = self.response_model_field_name or "output"
+        # models are returned whole, like `call` does
+        has_output_field = response_model_field_name in model_schema(
+            response_model
+        ).get("properties", {})
+        outputs: list[Any] = [None] * len(calls)
+        unpacked: list[int] = []
+
+        def validate(output: Any) -> Any:
+            if not has_output_field:
+                return response_model(**output)
+            return getattr(
+                response_model(**{response_model_field_name: output}),
+                response_model_field_name,
             )
-            tasks.append(self.acall(*call_args, **call_kwargs))
 
-        return await asyncio.gather(*tasks)
+        async def call_packed(batch: list[int]) -> None:
+            prompt = self.get_packed_prompt()([arguments[i] for i in batch])
+            turn = await self.model(**prompt.to_dict()).acreate()
+            try:
+                batch_outputs = turn.get_function_call()[0][1]["outputs"]
+                if not isinstance(batch_outputs, list):
+                    raise ValueError("The outputs are not a list.")
+            except (KeyError, ValueError) as exc:
+                get_logger("marvin.AIFunction").warning_kv(
+                    f"Packed call of `ai_fn` {self.fn.__name__!r} failed",
+                    f"{exc}. Calling each of its {len(batch)} inputs instead.",
+                    key_style="yellow",
+                )
+                unpacked.extend(batch)
+                return
+            for position, index in enumerate(batch):
+                try:
+                    outputs[index] = validate(batch_outputs[position])
+                except (IndexError, TypeError, ValueError):
+                    unpacked.append(index)
+
+        await mapping.amap(call_packed, batches)
+
+        async def call(index: int) -> None:
+            outputs[index] = await self.acall(*calls[index][0], **calls[index][1])
+
+        await mapping.amap(call, sorted(unpacked))
+        return outputs
+
+    async def amap_iter(
+        self,
+        inputs: mapping.Inputs[Any],
+        *,
+        ordered: bool = True,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        on_progress: Optional[Callable[[mapping.MapProgress], Any]] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Map the AI function over an iterable or async iterable of inputs,
+        passing each input as the function's only argument, and yield the
+        outputs as they are ready.
+
+        Inputs are read lazily and at most `max_concurrency` calls run at once
+        (`settings.map_max_concurrency` by default), so this is suitable for
+        very large inputs. Outputs are yielded in order, or as `(index,
+        output)` pairs as soon as each call finishes if `ordered` is False. If
+        `return_exceptions` is True, a failed call yields its exception instead
+        of stopping the map. `on_progress` is called with a `MapProgress`
+        after each call.
+        """
+        options: dict[str, Any] = dict(
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+            on_progress=on_progress,
+        )
+        if ordered:
+            async for output in mapping.amap_ordered(self.acall, inputs, **options):
+                yield output
+        else:
+            async for index, output in mapping.amap_as_completed(
+                self.acall, inputs, **options
+            ):
+                yield index, output
+
+    def map_iter(
+        self,
+        inputs: mapping.Inputs[Any],
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        """
+        Iterate over a map of the AI function synchronously. See `amap_iter`.
+        """
+        return iterate_sync(self.amap_iter(inputs, **kwargs))
 
     @classmethod
     def as_decorator(
@@ -186,6 +591,8 @@ class AIFunction(BaseModel, Generic[P, T]):
         response_model_description: Optional[str] = None,
         response_model_field_name: Optional[str] = None,
         model: Optional[str] = None,
+        cache: Union[bool, CacheStore, None] = None,
+        semantic_cache: Union[bool, SemanticCache, None] = None,
         **model_kwargs: Any,
     ) -> Union[Callable[P, T], Callable[P, Awaitable[T]]]:
         if not fn:
@@ -197,6 +604,8 @@ class AIFunction(BaseModel, Generic[P, T]):
                 response_model_description=response_model_description,
                 response_model_field_name=response_model_field_name,
                 model=model,
+                cache=cache,
+                semantic_cache=semantic_cache,
                 **model_kwargs,
             )  # type: ignore
 
@@ -208,6 +617,8 @@ class AIFunction(BaseModel, Generic[P, T]):
                 response_model_description=response_model_description,
                 response_model_field_name=response_model_field_name,
                 model=ChatCompletion(model=model, **model_kwargs),
+                cache=cache,
+                semantic_cache=semantic_cache,
             )
         else:
             return AsyncAIFunction[P, T](
@@ -217,6 +628,8 @@ class AIFunction(BaseModel, Generic[P, T]):
                 response_model_description=response_model_description,
                 response_model_field_name=response_model_field_name,
                 model=ChatCompletion(model=model, **model_kwargs),
+                cache=cache,
+                semantic_cache=semantic_cache,
             )
 
 
@@ -1,16 +1,28 @@
-import asyncio
 import inspect
 from functools import partial
-from typing import Any, Callable, Optional, TypeVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 from typing_extensions import ParamSpec, Self
 
-from marvin._compat import BaseModel
+from marvin._compat import BaseModel, model_dump, model_dump_json
 from marvin.core.ChatCompletion import ChatCompletion
 from marvin.core.ChatCompletion.abstract import AbstractChatCompletion
+from marvin.core.ChatCompletion.providers.openai import CONTEXT_SIZES
 from marvin.prompts import Prompt, prompt_fn
-from marvin.utilities.async_utils import run_sync
+from marvin.settings import settings
+from marvin.utilities import mapping
+from marvin.utilities.async_utils import iterate_sync, run_sync
 from marvin.utilities.logging import get_logger
+from marvin.utilities.strings import count_tokens, split_tokens
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -18,6 +30,117 @@ A = TypeVar("A", bound=Any)
 
 P = ParamSpec("P")
 
+# tokens of an extraction prompt that are kept for its instructions and schema
+PROMPT_TOKENS = 500
+# the fewest tokens of text that an extraction prompt is allowed to hold
+MIN_DOCUMENT_TOKENS = 1000
+
+# how `map` returns its results
+MapOutput = Literal["models", "columns", "arrow"]
+
+# merges the models parsed from the windows of a long text into one
+Reducer = Union[Literal["union", "first", "llm"], Callable[[list[Any]], Any]]
+
+CONSOLIDATION_INSTRUCTIONS = (
+    "The text is a list of partial results, as JSON, that were each parsed from"
+    " one section of a long document. Consolidate them into a single result for"
+    " the whole document, combining their details and resolving conflicts."
+)
+
+
+def import_pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "The pyarrow package is required for `output='arrow'`. Please install"
+            " it with `pip install pyarrow`."
+        )
+    return pyarrow
+
+
+def add_row(columns: dict[str, list[Any]], _model: BaseModel) -> None:
+    """
+    Append the fields of a model to columns of values, one per field.
+    """
+    for name, value in model_dump(_model).items():
+        columns.setdefault(name, []).append(value)
+
+
+def check_map_output(output: str) -> None:
+    if output not in ("models", "columns", "arrow"):
+        raise ValueError(
+            f"Unknown output {output!r}; expected 'models', 'columns' or 'arrow'."
+        )
+
+
+def format_columns(columns: dict[str, list[Any]], output: MapOutput) -> Any:
+    return columns if output == "columns" else import_pyarrow().table(columns)
+
+
+def get_document_limit(model: Optional[str] = None) -> Optional[int]:
+    """
+    Return the most tokens of text that one extraction prompt for `model` can
+    hold, leaving room for the prompt and the response, or None if the
+    context size of the model is unknown.
+    """
+    name = (model or settings.llm_model).split("/")[-1]
+    if name not in CONTEXT_SIZES:
+        return None
+    limit = CONTEXT_SIZES[name] - settings.llm_max_tokens - PROMPT_TOKENS
+    # a large `llm_max_tokens` must not shrink windows to nothing
+    return max(limit, MIN_DOCUMENT_TOKENS, 2 * settings.ai_model_chunk_overlap)
+
+
+def exceeds_document_limit(text: str, model: Optional[str] = None) -> bool:
+    """
+    Whether a text is too long for one extraction prompt. Texts are never too
+    long for models whose context size is unknown.
+    """
+    limit = get_document_limit(model)
+    if limit is None:
+        return False
+    # a token is at least one byte, so short texts are never tokenized
+    return len(text.encode()) > limit and count_tokens(text) > limit
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or (isinstance(value, (str, list, dict)) and not value)
+
+
+def merge_first(values: list[Any]) -> Any:
+    """
+    Merge the fields of several parsed dicts, keeping the first value of each
+    field that is not null or empty.
+    """
+    present = [value for value in values if not _is_empty(value)]
+    if not present:
+        return values[0] if values else None
+    if all(isinstance(value, dict) for value in present):
+        keys = dict.fromkeys(key for value in present for key in value)
+        return {key: merge_first([value.get(key) for value in present]) for key in keys}
+    return present[0]
+
+
+def merge_union(values: list[Any]) -> Any:
+    """
+    Merge the fields of several parsed dicts: lists are concatenated without
+    duplicates, dicts are merged field by field, and other fields keep their
+    first value that is not null or empty.
+    """
+    present = [value for value in values if not _is_empty(value)]
+    if not present:
+        return values[0] if values else None
+    if all(isinstance(value, dict) for value in present):
+        keys = dict.fromkeys(key for value in present for key in value)
+        return {key: merge_union([value.get(key) for value in present]) for key in keys}
+    if all(isinstance(value, list) for value in present):
+        merged: list[Any] = []
+        for value in present:
+            merged.extend(item for item in value if item not in merged)
+        return merged
+    return present[0]
+
 
 def ai_model_prompt(
     cls: type[BaseModel],
@@ -247,6 +370,20 @@ class AIModel(BaseModel):
     ) -> Self:
         metadata = getattr(cls, "__metadata__", {})
 
+        if exceeds_document_limit(text, model or cls._get_model()):
+            return run_sync(
+                cls.amap_reduce(
+                    text,
+                    ctx=ctx,
+                    instructions=instructions,
+                    response_model_name=response_model_name,
+                    response_model_description=response_model_description,
+                    response_model_field_name=response_model_field_name,
+                    model=model,
+                    **model_kwargs,
+                )
+            )
+
         get_logger("marvin.AIModel").debug_kv(
             f"Calling `ai_model` {cls.__name__!r}",
             f"with {text!r}",
@@ -295,6 +432,32 @@ class AIModel(BaseModel):
         response_model_field_name: Optional[str] = None,
         model: Optional[str] = None,
         **model_kwargs: Any,
+    ) -> Self:
+        kwargs: dict[str, Any] = dict(
+            ctx=ctx,
+            instructions=instructions,
+            response_model_name=response_model_name,
+            response_model_description=response_model_description,
+            response_model_field_name=response_model_field_name,
+            model=model,
+            **model_kwargs,
+        )
+        if exceeds_document_limit(text, model or cls._get_model()):
+            return await cls.amap_reduce(text, **kwargs)
+        return await cls._aparse(text, **kwargs)
+
+    @classmethod
+    async def _aparse(
+        cls: type[Self],
+        text: str,
+        *,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        response_model_name: Optional[str] = None,
+        response_model_description: Optional[str] = None,
+        response_model_field_name: Optional[str] = None,
+        model: Optional[str] = None,
+        **model_kwargs: Any,
     ) -> Self:
         metadata = getattr(cls, "__metadata__", {})
 
@@ -333,38 +496,291 @@ class AIModel(BaseModel):
         return _model  # type: ignore
 
     @classmethod
-    def map(cls, *map_args: list[str], **map_kwargs: list[Any]):
+    def _get_model(cls) -> Optional[str]:
+        return getattr(cls, "__metadata__", {}).get("model")
+
+    @classmethod
+    async def amap_reduce(
+        cls: type[Self],
+        text: str,
+        *,
+        reducer: Optional[Reducer] = None,
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Self:
+        """
+        Parse a text that is too long for one prompt. The text is split into
+        windows of `chunk_tokens` tokens that overlap by `overlap_tokens`, the
+        windows are parsed concurrently (at most `max_concurrency` at once),
+        and the partial models are merged by `reducer`:
+
+        - "union": lists are concatenated without duplicates, and other fields
+          keep their first value that is not null or empty
+        - "first": every field keeps its first value that is not null or empty
+        - "llm": the partial models are consolidated by one more prompt
+        - a function, possibly async, that merges a list of models into one
+
+        Other keyword arguments are passed to every call of `acall`. `acall`
+        uses this automatically for texts that exceed the context size of
+        the model, if that size is known, with the `ai_model_*` settings as
+        defaults.
+        """
+        reducer = reducer or settings.ai_model_reducer
+        if isinstance(reducer, str) and reducer not in ("union", "first", "llm"):
+            raise ValueError(
+                f"Unknown reducer {reducer!r}; expected 'union', 'first', 'llm' or a"
+                " function."
+            )
+        limit = get_document_limit(kwargs.get("model") or cls._get_model())
+        chunk_tokens = chunk_tokens or settings.ai_model_chunk_tokens
+        if limit is not None:
+            chunk_tokens = min(chunk_tokens, limit)
+        if overlap_tokens is None:
+            overlap_tokens = min(settings.ai_model_chunk_overlap, chunk_tokens // 2)
+        chunks = split_tokens(text, chunk_tokens, overlap_tokens)
+
+        get_logger("marvin.AIModel").debug_kv(
+            f"Map-reducing `ai_model` {cls.__name__!r}",
+            f"over {len(chunks)} windows of {chunk_tokens} tokens",
+        )
+
+        async def parse(chunk: str) -> Self:
+            return await cls._aparse(chunk, **kwargs)
+
+        models = await mapping.amap(parse, chunks, max_concurrency=max_concurrency)
+        if len(models) == 1:
+            return models[0]
+        if reducer == "union":
+            return cls(**merge_union([model_dump(_model) for _model in models]))
+        if reducer == "first":
+            return cls(**merge_first([model_dump(_model) for _model in models]))
+        if reducer == "llm":
+            drafts = "[" + ", ".join(model_dump_json(_model) for _model in models) + "]"
+            instructions = kwargs.pop("instructions", None)
+            instructions = "\n".join(
+                filter(None, [instructions, CONSOLIDATION_INSTRUCTIONS])
+            )
+            return await cls._aparse(drafts, instructions=instructions, **kwargs)
+        merged = reducer(models)
+        if inspect.isawaitable(merged):
+            merged = await merged
+        return merged
+
+    @classmethod
+    def map_reduce(cls: type[Self], text: str, **kwargs: Any) -> Self:
+        """
+        Parse a text that is too long for one prompt synchronously. See
+        `amap_reduce`.
+        """
+        return run_sync(cls.amap_reduce(text, **kwargs))
+
+    @classmethod
+    async def astream(
+        cls: type[Self],
+        text: str,
+        *,
+        ctx: Optional[dict[str, Any]] = None,
+        instructions: Optional[str] = None,
+        response_model_name: Optional[str] = None,
+        response_model_description: Optional[str] = None,
+        response_model_field_name: Optional[str] = None,
+        model: Optional[str] = None,
+        **model_kwargs: Any,
+    ) -> AsyncIterator[Self]:
+        """
+        Parse the text like `acall`, but yield progressively more complete
+        instances of the model as its fields stream in. Partial instances are
+        not validated and fields that have not started streaming are unset;
+        the last instance yielded is the validated result.
+        """
+        get_logger("marvin.AIModel").debug_kv(
+            f"Streaming `ai_model` {cls.__name__!r}",
+            f"with {text!r}",
+        )
+
+        async for _model in cls.as_chat_completion(
+            text,
+            ctx=ctx,
+            instructions=instructions,
+            response_model_name=response_model_name,
+            response_model_description=response_model_description,
+            response_model_field_name=response_model_field_name,
+            model=model,
+            **model_kwargs,
+        ).astream_model(cls):
+            yield _model  # type: ignore
+
+    @classmethod
+    def stream(cls: type[Self], text: str, **kwargs: Any) -> Iterator[Self]:
         """
-        Map the AI function over a sequence of arguments. Runs concurrently.
+        Iterate over progressively more complete instances of the model
+        synchronously. See `astream`.
+        """
+        return iterate_sync(cls.astream(text, **kwargs))
+
+    @classmethod
+    def map(cls, *map_args: list[str], **map_kwargs: Any):
+        """
+        Map the AI model over a sequence of texts. Runs concurrently.
 
-        Arguments should be provided as if calling the function normally, but
-        each argument must be a list. The function is called once for each item
-        in the list, and the results are returned in a list.
+        Arguments should be provided as if calling the model normally, but
+        each text must be in a list. The model is called once for each item
+        in the list, and the results are returned in a list. Keyword
+        arguments that are lists (or other sequences besides strings) are
+        indexed the same way; any other keyword argument is passed to every
+        call.
 
         This method should be called synchronously.
 
-        For example, fn.map([1, 2]) is equivalent to [fn(1), fn(2)].
+        For example, Model.map(['a', 'b']) is equivalent to
+        [Model('a'), Model('b')], and Model.map(['a', 'b'], instructions=['x',
+        'y']) is equivalent to [Model.call('a', instructions='x'),
+        Model.call('b', instructions='y')].
 
-        fn.map([1, 2], x=['a', 'b']) is equivalent to [fn(1, x='a'), fn(2, x='b')].
+        See `amap` for the options that control concurrency and output.
         """
         return run_sync(cls.amap(*map_args, **map_kwargs))
 
     @classmethod
-    async def amap(cls, *map_args: list[str], **map_kwargs: list[Any]) -> list[Any]:
-        tasks: list[Any] = []
-        if map_args:
-            max_length = max(len(arg) for arg in map_args)
-        else:
-            max_length = max(len(v) for v in map_kwargs.values())
+    async def amap(
+        cls,
+        *map_args: list[str],
+        max_concurrency: Optional[int] = None,
+        on_progress: Optional[Callable[[mapping.MapProgress], Any]] = None,
+        output: MapOutput = "models",
+        **map_kwargs: Any,
+    ) -> Any:
+        """
+        Map the AI model over a sequence of texts concurrently; see `map`.
+
+        At most `max_concurrency` calls run at once
+        (`settings.map_max_concurrency` by default), and `on_progress` is
+        called with a `MapProgress` after each call. `output` chooses how the
+        results are returned:
+
+        - "models": a list of models
+        - "columns": a dict that maps each field to a list of its values.
+          Each model is converted to a row as soon as it is parsed, so only
+          the calls in flight hold model instances.
+        - "arrow": the columns as a `pyarrow.Table` (requires pyarrow)
+        """
+        check_map_output(output)
+
+        async def parse(call: tuple[list[Any], dict[str, Any]]) -> Any:
+            args, kwargs = call
+            return await cls.acall(*args, **kwargs)
+
+        results = mapping.amap_ordered(
+            parse,
+            mapping.map_calls(map_args, map_kwargs, broadcast=True),
+            max_concurrency=max_concurrency,
+            on_progress=on_progress,
+        )
+        if output == "models":
+            return [_model async for _model in results]
+
+        columns: dict[str, list[Any]] = {}
+        async for _model in results:
+            add_row(columns, _model)
+        return format_columns(columns, output)
+
+    @classmethod
+    async def amap_chunks(
+        cls,
+        texts: mapping.Inputs[str],
+        *,
+        chunk_size: int = 1000,
+        output: MapOutput = "columns",
+        max_concurrency: Optional[int] = None,
+        on_progress: Optional[Callable[[mapping.MapProgress], Any]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """
+        Parse an iterable or async iterable of texts that may be too large to
+        hold in memory, and yield the results of every `chunk_size` texts in
+        order, in the form chosen by `output` (see `amap`). Texts are read
+        lazily, and any other keyword arguments are passed to every call of
+        `acall`.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1.")
+        check_map_output(output)
+
+        def collect(models: list[Any]) -> Any:
+            if output == "models":
+                return models
+            columns: dict[str, list[Any]] = {}
+            for _model in models:
+                add_row(columns, _model)
+            return format_columns(columns, output)
+
+        chunk: list[Any] = []
+        async for _model in cls.amap_iter(
+            texts, max_concurrency=max_concurrency, on_progress=on_progress, **kwargs
+        ):
+            chunk.append(_model)
+            if len(chunk) == chunk_size:
+                yield collect(chunk)
+                chunk = []
+        if chunk:
+            yield collect(chunk)
+
+    @classmethod
+    def map_chunks(cls, texts: mapping.Inputs[str], **kwargs: Any) -> Iterator[Any]:
+        """
+        Iterate over the chunks of a map synchronously. See `amap_chunks`.
+        """
+        return iterate_sync(cls.amap_chunks(texts, **kwargs))
+
+    @classmethod
+    async def amap_iter(
+        cls: type[Self],
+        texts: mapping.Inputs[str],
+        *,
+        ordered: bool = True,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        on_progress: Optional[Callable[[mapping.MapProgress], Any]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """
+        Parse each text of an iterable or async iterable, and yield the
+        models as they are ready. Any other keyword arguments are passed to
+        every call of `acall`.
+
+        Texts are read lazily and at most `max_concurrency` calls run at once
+        (`settings.map_max_concurrency` by default). Models are yielded in
+        order, or as `(index, model)` pairs as soon as each call finishes if
+        `ordered` is False. If `return_exceptions` is True, a failed call
+        yields its exception instead of stopping the map. `on_progress` is
+        called with a `MapProgress` after each call.
+        """
 
-        for i in range(max_length):
-            call_args: list[str] = [
-                arg[i] if i < len(arg) else None for arg in map_args
-            ]  # type: ignore
+        async def parse(text: str) -> Self:
+            return await cls.acall(text, **kwargs)
 
-            tasks.append(cls.acall(*call_args, **map_kwargs))
+        options: dict[str, Any] = dict(
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+            on_progress=on_progress,
+        )
+        if ordered:
+            async for _model in mapping.amap_ordered(parse, texts, **options):
+                yield _model
+        else:
+            async for index, _model in mapping.amap_as_completed(
+                parse, texts, **options
+            ):
+                yield index, _model
 
-        return await asyncio.gather(*tasks)
+    @classmethod
+    def map_iter(cls: type[Self], texts: mapping.Inputs[str], **kwargs: Any):
+        """
+        Iterate over a map of the model synchronously. See `amap_iter`.
+        """
+        return iterate_sync(cls.amap_iter(texts, **kwargs))
 
     @classmethod
     def as_decorator(
@@ -1,11 +1,41 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Generic, Optional, TypeVar
+from collections.abc import Sequence
+from typing import (
+    Any,
+    AsyncIterator,
+    Generic,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+    overload,
+)
 
-from marvin._compat import BaseModel, Field, model_copy, model_dump
+from marvin._compat import BaseModel, Field, model_construct, model_copy, model_dump
+from marvin.settings import settings
+from marvin.utilities.async_utils import iterate_sync
+from marvin.utilities.logging import get_logger
 from marvin.utilities.messages import Message
+from marvin.utilities.partial_json import parse_partial_json
 from typing_extensions import Self
 
-from .handlers import Request, Response, Turn
+from .cache import cache_key, get_response_cache
+from .coalesce import single_flight
+from .handlers import (
+    FunctionCallDelta,
+    Request,
+    Response,
+    StreamComplete,
+    StreamEvent,
+    Turn,
+    partial_model,
+    response_to_events,
+)
+from .rate_limit import RateLimiter, estimate_tokens, get_rate_limiter
+from .retry import call_with_retries, call_with_retries_async
+from .usage import count_openai_tokens, count_usage
+from .utils import with_timeout
 
 T = TypeVar(
     "T",
@@ -13,64 +43,142 @@ T = TypeVar(
 )
 
 
+class ConversationTurn(BaseModel, Generic[T], arbitrary_types_allowed=True):
+    """
+    A turn of a conversation, stored by reference: the messages it added are
+    the `start:end` range of the conversation's message log, and its request
+    sent the first `end` messages of the log.
+    """
+
+    params: dict[str, Any]
+    start: int
+    end: int
+    response: Optional[Response[T]] = None
+
+
+class ConversationTurns(Sequence[Turn[T]]):
+    """
+    The turns of a conversation whose responses were kept. Each turn is only
+    built when it is accessed.
+    """
+
+    def __init__(self, conversation: "Conversation[T]"):
+        self.conversation = conversation
+        self.records = [
+            record for record in conversation.records if record.response is not None
+        ]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @overload
+    def __getitem__(self, key: int) -> Turn[T]:
+        ...
+
+    @overload
+    def __getitem__(self, key: slice) -> list[Turn[T]]:
+        ...
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Turn[T], list[Turn[T]]]:
+        if isinstance(key, slice):
+            return [self.conversation._to_turn(record) for record in self.records[key]]
+        return self.conversation._to_turn(self.records[key])
+
+
 class Conversation(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
-    turns: list[Turn[T]]
+    """
+    A series of turns with a model.
+
+    Messages are stored once, in an append-only log, and each turn references
+    the range of the log that it added, so memory grows linearly with the
+    length of the conversation. Set `max_responses` to only keep the raw
+    responses of the last N turns; older turns are then dropped from `turns`,
+    but their messages remain in the log.
+    """
+
     model: Any
+    messages: list[Message] = Field(default_factory=list)
+    max_responses: Optional[int] = None
+    records: list[ConversationTurn[T]] = Field(default_factory=list)
+
+    def _to_turn(self, record: ConversationTurn[T]) -> Turn[T]:
+        # the logged messages were validated when they were sent, so the
+        # request references them instead of validating copies
+        return Turn(
+            request=model_construct(
+                Request, **record.params, messages=self.messages[: record.end]
+            ),
+            response=record.response,
+        )
+
+    @property
+    def turns(self) -> ConversationTurns[T]:
+        return ConversationTurns(self)
 
     def __getitem__(self, key: int) -> Turn[T]:
         return self.turns[key]
 
     @property
     def last_turn(self) -> Turn[T]:
-        return self.turns[-1]
+        return self._to_turn(self.records[-1])
 
     @property
     def last_request(self) -> Optional[Request[T]]:
-        return self.turns[-1][0] if self.turns else None
+        return self.last_turn.request if self.records else None
 
     @property
     def last_response(self) -> Optional[Response[T]]:
-        return self.turns[-1][1] if self.turns else None
+        return self.records[-1].response if self.records else None
 
     @property
     def history(self) -> list[Message]:
-        response: list[Message] = []
-        if not self.turns:
-            return response
-        if self.last_request:
-            response = self.last_request.messages or []
-            if self.last_response:
-                response.append(self.last_response.choices[0].message)
-        return response
+        return list(self.messages)
+
+    def _get_params(self, **kwargs: Any) -> dict[str, Any]:
+        if not self.records:
+            return kwargs
+        return (
+            model_dump(Request(**self.records[-1].params), exclude={"messages"})
+            | kwargs
+        )
 
-    def send(self, messages: list[Message], **kwargs: Any) -> Turn[T]:
-        params = kwargs
-        if self.last_request:
-            params = model_dump(self.last_request, exclude={"messages"}) | kwargs
+    def _record(self, turn: Turn[T]) -> None:
+        """
+        Append a turn's new messages and its reply to the message log, and
+        keep a reference to the turn.
+        """
+        start = len(self.messages)
+        self.messages.extend((turn.request.messages or [])[start:])
+        self.records.append(
+            ConversationTurn(
+                params={k: v for k, v in turn.request if k != "messages"},
+                start=start,
+                end=len(self.messages),
+                response=turn.response,
+            )
+        )
+        if turn.response.choices:
+            self.messages.append(turn.response.choices[0].message)
+
+        # the last response is always kept, since it drives `chain`
+        if self.max_responses is not None:
+            for record in self.records[: -max(self.max_responses, 1)]:
+                record.response = None
 
+    def send(self, messages: list[Message], **kwargs: Any) -> Turn[T]:
         turn = self.model.create(
-            **params,
-            messages=[
-                *self.history,
-                *messages,
-            ],
+            **self._get_params(**kwargs),
+            messages=[*self.messages, *messages],
         )
-        self.turns.append(turn)
+        self._record(turn)
         return turn
 
     async def asend(self, messages: list[Message], **kwargs: Any) -> Turn[T]:
-        params = kwargs
-        if self.last_request:
-            params = model_dump(self.last_request, exclude={"messages"}) | kwargs
-
         turn = await self.model.acreate(
-            **params,
-            messages=[
-                *self.history,
-                *messages,
-            ],
+            **self._get_params(**kwargs),
+            messages=[*self.messages, *messages],
         )
-        self.turns.append(turn)
+        self._record(turn)
         return turn
 
 
@@ -83,6 +191,7 @@ class AbstractChatCompletion(
     """
 
     defaults: dict[str, Any] = Field(default_factory=dict, exclude=True)
+    provider: Optional[str] = Field(default=None, exclude=True)
 
     def __call__(self: Self, **kwargs: Any) -> Self:
         """
@@ -91,6 +200,8 @@ class AbstractChatCompletion(
         """
         copy = model_copy(self)
         copy.defaults = self.defaults | kwargs
+        # excluded fields are not copied
+        copy.provider = self.provider
         return copy
 
     @abstractmethod
@@ -140,18 +251,28 @@ class AbstractChatCompletion(
         """
         pass
 
-    def create(
-        self, response_model: Optional[type[T]] = None, **kwargs: Any
-    ) -> Turn[T]:
+    async def _stream_request_async(
+        self, **serialized_request: Any
+    ) -> AsyncIterator[StreamEvent]:
         """
-        Create a completion synchronously.
-        Derived classes can override this if they need to change the core logic.
+        Send the serialized request and yield stream events as they arrive.
+        Derived classes that support native streaming should override this; by
+        default the complete response is replayed as events.
         """
-        request = self._create_request(**kwargs, response_model=response_model)
-        serialized_request = self._serialize_request(request=request)
-        response_data = self._send_request(**serialized_request)
-        response = self._parse_response(response_data)
-
+        serialized_request.pop("stream_handler", None)
+        response = self._parse_response(
+            await self._send_request_async(**serialized_request)
+        )
+        for event in response_to_events(response):
+            yield event
+
+    def _create_turn(
+        self,
+        request: Request[T],
+        serialized_request: dict[str, Any],
+        response: Response[T],
+        response_model: Optional[type[T]] = None,
+    ) -> Turn[T]:
         return Turn(
             request=Request(
                 **serialized_request
@@ -162,49 +283,289 @@ class AbstractChatCompletion(
             response=response,
         )
 
+    def _cache_key(
+        self, serialized_request: dict[str, Any], cache: Optional[bool] = None
+    ) -> Optional[str]:
+        """
+        Return the response cache key for a request, or None if the request
+        should not be served from (or stored in) the cache.
+        """
+        if not (settings.llm_cache_enabled if cache is None else cache):
+            return None
+        return cache_key(type(self).__name__, serialized_request)
+
+    def _coalesce_key(
+        self, serialized_request: dict[str, Any], cache: Optional[bool] = None
+    ) -> Optional[str]:
+        """
+        Return the key used to share one in-flight request between concurrent
+        identical callers, or None if the request should not be coalesced.
+        Requests that may be served from the cache are always coalesced.
+        """
+        cache_enabled = settings.llm_cache_enabled if cache is None else cache
+        if not (settings.llm_coalesce_requests or cache_enabled):
+            return None
+        return cache_key(type(self).__name__, serialized_request, exclude=set())
+
+    def _get_rate_limiter(
+        self, serialized_request: dict[str, Any]
+    ) -> tuple[Optional[RateLimiter], int]:
+        """
+        Return the rate limiter for this request's provider and model, if any,
+        along with the number of tokens the request is expected to use.
+        """
+        if not self.provider:
+            return None, 0
+        rate_limiter = get_rate_limiter(self.provider, serialized_request.get("model"))
+        if rate_limiter is None or not rate_limiter.limits_tokens:
+            return rate_limiter, 0
+        return rate_limiter, estimate_tokens(serialized_request)
+
+    def _count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        """
+        Count the tokens in a text with the provider's tokenizer. Derived
+        classes for providers that do not use OpenAI's tokenizers should
+        override this.
+        """
+        return count_openai_tokens(text, model=model)
+
+    def _with_usage(
+        self, serialized_request: dict[str, Any], response: Response[T]
+    ) -> Response[T]:
+        """
+        Fill in the usage of a response whose provider did not report it by
+        counting its tokens locally.
+        """
+        if response.usage.total_tokens:
+            return response
+        model = serialized_request.get("model")
+        try:
+            response.usage = count_usage(
+                serialized_request,
+                response,
+                count_tokens=lambda text: self._count_tokens(text, model=model),
+            )
+        except Exception as exc:
+            get_logger("ChatCompletion.usage").warning_kv(
+                "Usage",
+                f"Could not count the tokens of a {model!r} response: {exc}",
+                key_style="yellow",
+            )
+        return response
+
+    def _send_and_parse(self, serialized_request: dict[str, Any]) -> Response[T]:
+        rate_limiter, tokens = self._get_rate_limiter(serialized_request)
+
+        def attempt(timeout: Optional[float]) -> Response[T]:
+            if rate_limiter:
+                rate_limiter.acquire(tokens)
+            response = self._with_usage(
+                serialized_request,
+                self._parse_response(
+                    self._send_request(**with_timeout(serialized_request, timeout))
+                ),
+            )
+            if rate_limiter:
+                rate_limiter.reconcile(tokens, response.usage.total_tokens)
+            return response
+
+        return call_with_retries(attempt, key=self.provider or type(self).__name__)
+
+    async def _send_and_parse_async(
+        self, serialized_request: dict[str, Any]
+    ) -> Response[T]:
+        rate_limiter, tokens = self._get_rate_limiter(serialized_request)
+
+        async def attempt(timeout: Optional[float]) -> Response[T]:
+            if rate_limiter:
+                await rate_limiter.aacquire(tokens)
+            response = self._with_usage(
+                serialized_request,
+                self._parse_response(
+                    await asyncio.wait_for(
+                        self._send_request_async(**serialized_request),
+                        timeout=timeout,
+                    )
+                ),
+            )
+            if rate_limiter:
+                rate_limiter.reconcile(tokens, response.usage.total_tokens)
+            return response
+
+        return await call_with_retries_async(
+            attempt, key=self.provider or type(self).__name__
+        )
+
+    def create(
+        self,
+        response_model: Optional[type[T]] = None,
+        cache: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> Turn[T]:
+        """
+        Create a completion synchronously.
+        Derived classes can override this if they need to change the core logic.
+
+        Pass `cache=True` or `cache=False` to override `settings.llm_cache_enabled`
+        for this call.
+        """
+        request = self._create_request(**kwargs, response_model=response_model)
+        serialized_request = self._serialize_request(request=request)
+        key = self._cache_key(serialized_request, cache=cache)
+        if key and (cached := get_response_cache().get(key)) is not None:
+            response = Response(**cached)
+        else:
+            response = self._send_and_parse(serialized_request)
+            if key:
+                get_response_cache().set(key, model_dump(response))
+
+        return self._create_turn(request, serialized_request, response, response_model)
+
     async def acreate(
-        self, response_model: Optional[type[T]] = None, **kwargs: Any
+        self,
+        response_model: Optional[type[T]] = None,
+        cache: Optional[bool] = None,
+        **kwargs: Any,
     ) -> Turn[T]:
         """
         Create a completion asynchronously.
         Similar to the synchronous version but for async implementations.
+
+        Concurrent calls with identical requests share a single provider call
+        when `settings.llm_coalesce_requests` is enabled or the call may be
+        cached; each caller receives its own copy of the response.
         """
         request = self._create_request(**kwargs, response_model=response_model)
         serialized_request = self._serialize_request(request=request)
-        response_data = await self._send_request_async(**serialized_request)
-        response = self._parse_response(response_data)
-        return Turn(
-            request=Request(
-                **serialized_request
-                | self.defaults
-                | model_dump(request, exclude_none=True)
-                | ({"response_model": response_model} if response_model else {})
-            ),
-            response=response,
+        key = self._cache_key(serialized_request, cache=cache)
+        if key and (cached := get_response_cache().get(key)) is not None:
+            response = Response(**cached)
+        elif flight_key := self._coalesce_key(serialized_request, cache=cache):
+            response = await single_flight.do(
+                flight_key,
+                lambda: self._send_and_parse_async(serialized_request),
+                copy_result=lambda response: model_copy(response, deep=True),
+            )
+            if key:
+                get_response_cache().set(key, model_dump(response))
+        else:
+            response = await self._send_and_parse_async(serialized_request)
+            if key:
+                get_response_cache().set(key, model_dump(response))
+
+        return self._create_turn(request, serialized_request, response, response_model)
+
+    async def astream(
+        self, response_model: Optional[type[T]] = None, **kwargs: Any
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Create a completion and yield it as a stream of events: `ContentDelta`
+        and `FunctionCallDelta` events as the provider produces them, followed
+        by a single `StreamComplete` event with the assembled response and its
+        usage. Nothing is buffered; the provider is only read as fast as the
+        consumer iterates.
+        """
+        request = self._create_request(**kwargs, response_model=response_model)
+        serialized_request = self._serialize_request(request=request)
+        serialized_request.pop("stream_handler", None)
+
+        rate_limiter, tokens = self._get_rate_limiter(serialized_request)
+        if rate_limiter:
+            await rate_limiter.aacquire(tokens)
+
+        async for event in self._stream_request_async(**serialized_request):
+            if isinstance(event, StreamComplete):
+                event.response = self._with_usage(serialized_request, event.response)
+                event.usage = event.response.usage
+                if rate_limiter:
+                    rate_limiter.reconcile(tokens, event.usage.total_tokens)
+            yield event
+
+    def stream(
+        self, response_model: Optional[type[T]] = None, **kwargs: Any
+    ) -> Iterator[StreamEvent]:
+        """
+        Create a completion and iterate over its stream events synchronously.
+        See `astream`.
+        """
+        return iterate_sync(self.astream(response_model=response_model, **kwargs))
+
+    async def astream_model(
+        self, model_cls: Optional[type[T]] = None, **kwargs: Any
+    ) -> AsyncIterator[T]:
+        """
+        Create a completion and yield progressively more complete instances of
+        the response model as the function call's arguments stream in. Partial
+        instances are not validated if their arguments are not yet valid; the
+        last instance is the validated result, as returned by `Turn.to_model`.
+
+        `model_cls` defaults to the request's response model, and any other
+        arguments are passed to `astream`.
+        """
+        model = (
+            model_cls
+            or kwargs.get("response_model")
+            or self.defaults.get("response_model")
         )
+        if not model:
+            raise ValueError("No model found.")
+
+        arguments, data = "", None
+        async for event in self.astream(**kwargs):
+            if isinstance(event, FunctionCallDelta) and event.index == 0:
+                arguments += event.arguments
+                partial_data = parse_partial_json(arguments)
+                if partial_data is not None and partial_data != data:
+                    data = partial_data
+                    yield partial_model(model, data)
+            elif isinstance(event, StreamComplete):
+                yield Turn(
+                    request=Request(response_model=model), response=event.response
+                ).to_model()
+
+    def stream_model(
+        self, model_cls: Optional[type[T]] = None, **kwargs: Any
+    ) -> Iterator[T]:
+        """
+        Create a completion and iterate over partial instances of the response
+        model synchronously. See `astream_model`.
+        """
+        return iterate_sync(self.astream_model(model_cls=model_cls, **kwargs))
 
-    def chain(self, **kwargs: Any) -> Conversation[T]:
+    def chain(
+        self, max_responses: Optional[int] = None, **kwargs: Any
+    ) -> Conversation[T]:
         """
         Create a new Conversation object.
+
+        Pass `max_responses` to only keep the raw responses of the last N
+        turns, e.g. for long-running loops of function calls.
         """
         with self as conversation:
+            conversation.max_responses = max_responses
             conversation.send(**kwargs)
-            while conversation.last_turn.has_function_call():
-                message = conversation.last_turn.call_function()
+            while (turn := conversation.last_turn).has_function_call():
+                message = turn.call_function()
                 conversation.send(
                     message if isinstance(message, list) else [message],
                 )
 
             return conversation
 
-    async def achain(self, **kwargs: Any) -> Conversation[T]:
+    async def achain(
+        self, max_responses: Optional[int] = None, **kwargs: Any
+    ) -> Conversation[T]:
         """
         Create a new Conversation object asynchronously.
+
+        Pass `max_responses` to only keep the raw responses of the last N
+        turns, e.g. for long-running loops of function calls.
         """
         with self as conversation:
+            conversation.max_responses = max_responses
             await conversation.asend(**kwargs)
-            while conversation.last_turn.has_function_call():
-                message = conversation.last_turn.call_function()
+            while (turn := conversation.last_turn).has_function_call():
+                message = await turn.acall_function()
                 await conversation.asend(
                     message if isinstance(message, list) else [message],
                 )
@@ -215,7 +576,7 @@ class AbstractChatCompletion(
         """
         Enter a context manager.
         """
-        return Conversation(turns=[], model=self)
+        return Conversation(model=self)
 
     def __exit__(self: Self, *args: Any) -> None:
         """
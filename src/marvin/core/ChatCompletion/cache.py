@@ -0,0 +1,100 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from marvin.settings import settings
+from marvin.utilities.memoization import (
+    CacheStore,
+    MemoryCacheStore,
+    SQLiteCacheStore,
+    TieredCacheStore,
+)
+from marvin.utilities.singletons import SettingsSingleton
+
+# Parameters that never change the content of a completion and must never be
+# persisted (credentials) or cannot be serialized (callbacks).
+NON_KEY_PARAMS = {
+    "api_key",
+    "organization",
+    "request_timeout",
+    "timeout",
+    "stream_handler",
+}
+
+
+def cache_key(
+    namespace: str,
+    serialized_request: dict[str, Any],
+    exclude: Union[set[str], frozenset[str]] = frozenset(NON_KEY_PARAMS),
+) -> Optional[str]:
+    """
+    Compute a stable key for a serialized request. Returns None if the request
+    can not be cached, e.g. because it streams or is not JSON-serializable.
+    """
+    if serialized_request.get("stream_handler") or serialized_request.get("stream"):
+        return None
+    try:
+        payload = json.dumps(
+            {k: v for k, v in serialized_request.items() if k not in exclude},
+            sort_keys=True,
+        )
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(f"{namespace}:{payload}".encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    A two-tier cache for completion responses.
+
+    Responses are stored as JSON in a bounded, in-memory LRU and, if a path is
+    provided, in a SQLite database that survives restarts. Entries older than
+    `ttl_seconds` are treated as missing.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[Union[str, Path]] = None,
+    ):
+        self.path = Path(path) if path else None
+        self.store: CacheStore = (
+            TieredCacheStore(
+                SQLiteCacheStore(self.path, ttl_seconds=ttl_seconds), max_size
+            )
+            if self.path
+            else MemoryCacheStore(max_size, ttl_seconds)
+        )
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        response = self.store.get(key)
+        return None if response is None else json.loads(response)
+
+    def set(self, key: str, response: dict[str, Any]) -> None:
+        self.store.set(key, json.dumps(response, default=str))
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def close(self) -> None:
+        self.store.close()
+
+
+_response_cache = SettingsSingleton(
+    lambda: (
+        settings.llm_cache_max_size,
+        settings.llm_cache_ttl_seconds,
+        settings.home / "llm_cache.sqlite" if settings.llm_cache_persist else None,
+    ),
+    ResponseCache,
+)
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide response cache, rebuilding it if the cache
+    settings have changed since it was created.
+    """
+    return _response_cache.get()
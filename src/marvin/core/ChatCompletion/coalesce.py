@@ -0,0 +1,59 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single in-flight call.
+
+    The first caller for a key (the leader) starts the call; callers that
+    arrive while it is running (followers) await the same task and receive a
+    copy of its result. The underlying task is shielded, so cancelling one
+    caller does not cancel the call for everyone else; it is only cancelled
+    once every caller has been.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[tuple[int, str], asyncio.Future[Any]] = {}
+        # the number of callers awaiting each task
+        self._waiters: dict[asyncio.Future[Any], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        copy_result: Optional[Callable[[T], T]] = None,
+    ) -> T:
+        # futures are bound to an event loop, so calls are only coalesced
+        # with other calls on the same loop
+        flight_key = (id(asyncio.get_running_loop()), key)
+
+        if (task := self._inflight.get(flight_key)) is not None:
+            result = await self._wait(task)
+            return (copy_result or copy.deepcopy)(result)
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[flight_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        return await self._wait(task)
+
+    async def _wait(self, task: "asyncio.Future[T]") -> T:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # nobody is left to use the result, so stop spending on it
+                if not task.done():
+                    task.cancel()
+
+
+single_flight = SingleFlight()
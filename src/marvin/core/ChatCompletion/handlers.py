@@ -1,10 +1,14 @@
+import asyncio
 import inspect
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from types import FunctionType
 from typing import (
     Any,
     Callable,
     Generic,
+    Iterator,
     Literal,
     Optional,
     TypeVar,
@@ -12,10 +16,18 @@ from typing import (
     overload,
 )
 
-from marvin._compat import BaseModel, Field, cast_to_json, model_dump
+from marvin._compat import (
+    BaseModel,
+    Field,
+    cast_to_json,
+    model_construct,
+    model_dump,
+)
+from marvin.settings import settings
 from marvin.utilities.async_utils import run_sync
 from marvin.utilities.logging import get_logger
 from marvin.utilities.messages import Message, Role
+from marvin.utilities.singletons import SettingsSingleton
 from typing_extensions import ParamSpec
 
 from .utils import parse_raw
@@ -28,6 +40,23 @@ T = TypeVar(
 P = ParamSpec("P")
 
 
+_function_executor = SettingsSingleton(
+    lambda: (settings.function_call_max_workers,),
+    lambda max_workers: ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="marvin-function"
+    ),
+    close=lambda executor: executor.shutdown(wait=False),
+)
+
+
+def get_function_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool that synchronous functions called by
+    `Turn.acall_function` run in, sized by `settings.function_call_max_workers`.
+    """
+    return _function_executor.get()
+
+
 class Request(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
     messages: Optional[list[Message]] = Field(default=None)
     functions: Optional[list[Union[Callable[..., Any], dict[str, Any]]]] = Field(
@@ -82,6 +111,7 @@ class Choice(BaseModel):
     message: Message
     index: int
     finish_reason: str
+    logprobs: Optional[dict[str, Any]] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -102,6 +132,60 @@ class Response(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=Tru
     choices: list[Choice] = Field(default_factory=list)
 
 
+class StreamEvent(BaseModel):
+    type: str
+    index: int = 0
+
+
+class ContentDelta(StreamEvent):
+    type: Literal["content"] = "content"
+    content: str
+
+
+class FunctionCallDelta(StreamEvent):
+    type: Literal["function_call"] = "function_call"
+    name: Optional[str] = None
+    arguments: str = ""
+
+
+class StreamComplete(StreamEvent):
+    type: Literal["complete"] = "complete"
+    response: Response[Any]
+    usage: Usage
+
+
+def response_to_events(response: Response[T]) -> Iterator[StreamEvent]:
+    """
+    Replay a complete response as stream events, for providers that do not
+    stream natively.
+    """
+    for choice in response.choices:
+        if choice.message.content:
+            yield ContentDelta(index=choice.index, content=choice.message.content)
+        if choice.message.function_call:
+            yield FunctionCallDelta(
+                index=choice.index,
+                name=choice.message.function_call.name,
+                arguments=choice.message.function_call.arguments,
+            )
+    yield StreamComplete(response=response, usage=response.usage)
+
+
+def partial_model(model: type[T], data: Any) -> T:
+    """
+    Build an instance of `model` from the arguments of a function call that
+    is still streaming. The instance is validated if the arguments are already
+    valid; otherwise it is constructed without validation, and fields that
+    have not started streaming are left unset.
+    """
+    if not isinstance(data, dict):
+        data = {"output": data}
+    try:
+        return model(**data)
+    except ValueError:  # ValidationError is a subclass of ValueError
+        return model_construct(model, **data)
+
+
 class Turn(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
     request: Request[T]
     response: Response[T]
@@ -139,23 +223,28 @@ class Turn(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
                 )
         return pairs
 
-    def call_function(self) -> Union[Message, list[Message]]:
+    def _get_functions(
+        self,
+    ) -> list[tuple[str, FunctionType, dict[str, Any]]]:
         if not self.has_function_call():
             raise ValueError("No function call found.")
 
-        pairs: list[tuple[str, dict[str, Any]]] = self.get_function_call()
         function_registry: dict[str, FunctionType] = self.request.function_registry()
-        evaluations: list[Any] = []
-
-        logger = get_logger("ChatCompletion.handlers")
-
-        for pair in pairs:
-            name, argument = pair
+        functions: list[tuple[str, FunctionType, dict[str, Any]]] = []
+        for name, argument in self.get_function_call():
             if name not in function_registry:
                 raise ValueError(
                     f"Function {name} not found in {function_registry=!r}."
                 )
+            functions.append((name, function_registry[name], argument))
+        return functions
+
+    def call_function(self) -> Union[Message, list[Message]]:
+        logger = get_logger("ChatCompletion.handlers")
+        functions = self._get_functions()
+        evaluations: list[Any] = []
 
+        for name, function, argument in functions:
             logger.debug_kv(
                 "Function call",
                 (
@@ -165,7 +254,7 @@ class Turn(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
                 key_style="green",
             )
 
-            function_result = function_registry[name](**argument)
+            function_result = function(**argument)
 
             if inspect.isawaitable(function_result):
                 function_result = run_sync(function_result)
@@ -177,23 +266,84 @@ class Turn(BaseModel, Generic[T], extra="allow", arbitrary_types_allowed=True):
             )
 
             evaluations.append(function_result)
-        if len(evaluations) != 1:
-            return [
-                Message(
-                    name=pairs[j][0],
-                    role=Role.FUNCTION_RESPONSE,
-                    content=str(evaluations[j]),
-                    function_call=None,
+
+        return self._to_function_messages(
+            [name for name, _, _ in functions], evaluations
+        )
+
+    async def acall_function(
+        self, timeout: Optional[float] = None
+    ) -> Union[Message, list[Message]]:
+        """
+        Evaluate the turn's function calls concurrently. Coroutine functions
+        are awaited on the running event loop and synchronous functions run in
+        a bounded thread pool (see `settings.function_call_max_workers`).
+
+        Each call is limited to `timeout` seconds, which defaults to
+        `settings.function_call_timeout_seconds`. A synchronous function that
+        times out keeps its worker thread until it returns.
+        """
+        logger = get_logger("ChatCompletion.handlers")
+        functions = self._get_functions()
+        if timeout is None:
+            timeout = settings.function_call_timeout_seconds
+
+        async def evaluate(
+            name: str, function: FunctionType, argument: dict[str, Any]
+        ) -> Any:
+            logger.debug_kv(
+                "Function call",
+                (
+                    f"Calling function {name!r} with payload:"
+                    f" {json.dumps(argument, indent=2)}"
+                ),
+                key_style="green",
+            )
+
+            async def call() -> Any:
+                if inspect.iscoroutinefunction(function):
+                    return await function(**argument)
+                function_result = await asyncio.get_running_loop().run_in_executor(
+                    get_function_executor(), partial(function, **argument)
                 )
-                for j in range(len(evaluations))
-            ]
-        else:
-            return Message(
-                name=pairs[0][0],
+                if inspect.isawaitable(function_result):
+                    function_result = await function_result
+                return function_result
+
+            try:
+                function_result = await asyncio.wait_for(call(), timeout=timeout)
+            except asyncio.TimeoutError as exc:
+                raise asyncio.TimeoutError(
+                    f"Function {name!r} did not return within {timeout}s."
+                ) from exc
+
+            logger.debug_kv(
+                "Function call",
+                f"Function {name!r} returned: {function_result}",
+                key_style="green",
+            )
+            return function_result
+
+        evaluations = await asyncio.gather(
+            *(evaluate(*function) for function in functions)
+        )
+        return self._to_function_messages(
+            [name for name, _, _ in functions], list(evaluations)
+        )
+
+    def _to_function_messages(
+        self, names: list[str], evaluations: list[Any]
+    ) -> Union[Message, list[Message]]:
+        messages = [
+            Message(
+                name=name,
                 role=Role.FUNCTION_RESPONSE,
-                content=str(evaluations[0]),
+                content=str(evaluation),
                 function_call=None,
             )
+            for name, evaluation in zip(names, evaluations)
+        ]
+        return messages if len(messages) != 1 else messages[0]
 
     def to_model(self, model_cls: Optional[type[T]] = None) -> T:
         model = model_cls or self.request.response_model
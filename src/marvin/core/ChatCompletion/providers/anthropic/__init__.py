@@ -1,17 +1,133 @@
-from typing import Any, TypeVar, Callable, Awaitable, Optional
+import asyncio
+import atexit
 import inspect
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from pydantic import BaseModel
+
 from marvin._compat import cast_to_json, model_dump
 from marvin.settings import settings
-from pydantic import BaseModel
-from .prompt import render_anthropic_functions_prompt, handle_anthropic_response
+from marvin.utilities.async_utils import on_running_loop_shutdown
+
 from ...abstract import AbstractChatCompletion
 from ...handlers import Request, Response
+from .prompt import handle_anthropic_response, render_anthropic_functions_prompt
 
 T = TypeVar(
     "T",
     bound=BaseModel,
 )
 
+# Clients are cached by their constructor kwargs so that requests with the
+# same credentials share one client and its HTTP connection pool. Async
+# clients are additionally scoped to the event loop that created them, keyed
+# by the loop's id along with the loop and the generator that closes them
+# when it shuts down.
+_CLIENTS: dict[str, Any] = {}
+_ASYNC_CLIENTS: dict[int, tuple[asyncio.AbstractEventLoop, dict[str, Any], Any]] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# accepted by both the client constructor and each request; sent per request
+# so that per-attempt timeouts do not create a new client for every call
+REQUEST_OPTIONS = {"timeout"}
+
+
+@lru_cache(maxsize=None)
+def get_client_parameters(client_cls: type) -> frozenset[str]:
+    """
+    Get the names of the parameters accepted by an Anthropic client constructor.
+    """
+    return frozenset(inspect.signature(client_cls).parameters)
+
+
+def split_client_kwargs(
+    client_cls: type, kwargs: dict[str, Any]
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Split kwargs into those accepted by the client constructor and the rest.
+    """
+    params = get_client_parameters(client_cls) - REQUEST_OPTIONS
+    return (
+        {k: v for k, v in kwargs.items() if k in params},
+        {k: v for k, v in kwargs.items() if k not in params},
+    )
+
+
+def _client_key(client_kwargs: dict[str, Any]) -> str:
+    return json.dumps(client_kwargs, sort_keys=True, default=repr)
+
+
+def get_anthropic_client(**client_kwargs: Any) -> Any:
+    """
+    Get a cached `anthropic.Anthropic` client for the given constructor kwargs.
+    """
+    import anthropic
+
+    key = _client_key(client_kwargs)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None or client.is_closed():
+            client = _CLIENTS[key] = anthropic.Anthropic(**client_kwargs)
+    return client
+
+
+def get_anthropic_async_client(**client_kwargs: Any) -> Any:
+    """
+    Get a cached `anthropic.AsyncAnthropic` client for the given constructor
+    kwargs and the running event loop. The loop's clients are closed when it
+    shuts down.
+    """
+    import anthropic
+
+    loop = asyncio.get_running_loop()
+    # forget loops that were closed without shutting down
+    for other, (other_loop, _, _) in list(_ASYNC_CLIENTS.items()):
+        if other_loop.is_closed():
+            del _ASYNC_CLIENTS[other]
+
+    if id(loop) not in _ASYNC_CLIENTS:
+        clients: dict[str, Any] = {}
+
+        async def close() -> None:
+            entry = _ASYNC_CLIENTS.get(id(loop))
+            if entry is not None and entry[1] is clients:
+                del _ASYNC_CLIENTS[id(loop)]
+            for client in clients.values():
+                if not client.is_closed():
+                    await client.close()
+
+        _ASYNC_CLIENTS[id(loop)] = (loop, clients, on_running_loop_shutdown(close))
+
+    clients = _ASYNC_CLIENTS[id(loop)][1]
+    key = _client_key(client_kwargs)
+    client = clients.get(key)
+    if client is None or client.is_closed():
+        client = clients[key] = anthropic.AsyncAnthropic(**client_kwargs)
+    return client
+
+
+async def close_anthropic_async_clients() -> None:
+    """
+    Close the cached async clients for the running event loop. This happens
+    automatically when the loop shuts down.
+    """
+    _, clients, _ = _ASYNC_CLIENTS.pop(id(asyncio.get_running_loop()), (None, {}, None))
+    for client in clients.values():
+        if not client.is_closed():
+            await client.close()
+
+
+@atexit.register
+def _close_anthropic_clients() -> None:
+    with _CLIENTS_LOCK:
+        for client in _CLIENTS.values():
+            if not client.is_closed():
+                client.close()
+        _CLIENTS.clear()
+
 
 def get_anthropic_create(**kwargs: Any) -> tuple[Callable[..., Any], dict[str, Any]]:
     """
@@ -20,11 +136,8 @@ def get_anthropic_create(**kwargs: Any) -> tuple[Callable[..., Any], dict[str, A
     """
     import anthropic
 
-    params = dict(inspect.signature(anthropic.Anthropic).parameters)
-
-    return anthropic.Anthropic(
-        **{k: v for k, v in kwargs.items() if k in params.keys()}
-    ).completions.create, {k: v for k, v in kwargs.items() if k not in params.keys()}
+    client_kwargs, params = split_client_kwargs(anthropic.Anthropic, kwargs)
+    return get_anthropic_client(**client_kwargs).completions.create, params
 
 
 def get_anthropic_acreate(
@@ -36,10 +149,8 @@ def get_anthropic_acreate(
     """
     import anthropic
 
-    params = dict(inspect.signature(anthropic.AsyncAnthropic).parameters)
-    return anthropic.AsyncAnthropic(
-        **{k: v for k, v in kwargs.items() if k in params.keys()}
-    ).completions.create, {k: v for k, v in kwargs.items() if k not in params.keys()}
+    client_kwargs, params = split_client_kwargs(anthropic.AsyncAnthropic, kwargs)
+    return get_anthropic_async_client(**client_kwargs).completions.create, params
 
 
 class AnthropicChatCompletion(AbstractChatCompletion[T]):
@@ -53,12 +164,11 @@ class AnthropicChatCompletion(AbstractChatCompletion[T]):
         """
         import anthropic
 
-        kwargs = {
-            k: v
-            for k, v in kwargs.items()
-            if k not in dict(inspect.signature(anthropic.Anthropic).parameters).keys()
-        }
-        super().__init__(defaults=settings.get_defaults("anthropic") | kwargs)
+        _, kwargs = split_client_kwargs(anthropic.Anthropic, kwargs)
+        super().__init__(
+            defaults=settings.get_defaults("anthropic") | kwargs,
+            provider="anthropic",
+        )
 
     def _serialize_request(
         self, request: Optional[Request[T]] = None
@@ -126,6 +236,13 @@ class AnthropicChatCompletion(AbstractChatCompletion[T]):
         """
         return Request(**kwargs)
 
+    def _count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        """
+        Count tokens with Anthropic's tokenizer, since completions do not
+        report their usage.
+        """
+        return get_anthropic_client().count_tokens(text)
+
     def _parse_response(self, response: Any) -> Response[T]:
         """
         Parse the response received from OpenAI.
@@ -151,6 +268,7 @@ class AnthropicChatCompletion(AbstractChatCompletion[T]):
                         },
                     }
                 ],
+                # completions do not report usage; it is counted locally
                 "usage": {
                     "prompt_tokens": 0,
                     "completion_tokens": 0,
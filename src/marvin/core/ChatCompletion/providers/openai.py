@@ -1,22 +1,52 @@
+import asyncio
+import atexit
 import inspect
-from typing import Any, AsyncGenerator, Callable, Optional, TypeVar, Union
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 from marvin._compat import BaseModel, cast_to_json, model_dump
 from marvin.settings import settings
 from marvin.types import Function
-from marvin.utilities.async_utils import create_task, run_sync
-from marvin.utilities.messages import Message
+from marvin.utilities.async_utils import on_running_loop_shutdown, run_sync
+from marvin.utilities.messages import FunctionCall, Message
 from marvin.utilities.streaming import StreamHandler
 from openai.openai_object import OpenAIObject
 
 from ..abstract import AbstractChatCompletion
-from ..handlers import Request, Response, Usage
+from ..handlers import (
+    ContentDelta,
+    FunctionCallDelta,
+    Request,
+    Response,
+    StreamComplete,
+    StreamEvent,
+    Usage,
+)
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
 
 T = TypeVar(
     "T",
     bound=BaseModel,
 )
 
+# aiohttp sessions can only be used on the loop that created them, so the
+# pool keeps one keep-alive session per running event loop, keyed by the id of
+# the loop. Each entry holds the loop, so its id is not reused while the entry
+# exists, its session, and the generator that closes the session when the loop
+# shuts down. (A session references its loop, so weak keys would never expire.)
+_SESSIONS: dict[int, tuple[asyncio.AbstractEventLoop, "ClientSession", Any]] = {}
+
 CONTEXT_SIZES = {
     "gpt-3.5-turbo-16k-0613": 16384,
     "gpt-3.5-turbo-16k": 16384,
@@ -36,6 +66,77 @@ def get_context_size(model: str) -> int:
     return CONTEXT_SIZES.get(model, 2048)
 
 
+def get_openai_session() -> "ClientSession":
+    """
+    Return the pooled aiohttp session for the running event loop, creating it
+    (sized by `settings.openai.pool_*`) if necessary. The session is closed
+    when the loop shuts down.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    # forget loops that were closed without shutting down
+    for key, (other_loop, _, _) in list(_SESSIONS.items()):
+        if other_loop.is_closed():
+            del _SESSIONS[key]
+
+    entry = _SESSIONS.get(id(loop))
+    if entry is not None and not entry[1].closed:
+        return entry[1]
+
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=settings.openai.pool_max_connections,
+            limit_per_host=settings.openai.pool_max_connections_per_host,
+            keepalive_timeout=settings.openai.pool_keepalive_seconds,
+        )
+    )
+
+    async def close() -> None:
+        entry = _SESSIONS.get(id(loop))
+        if entry is not None and entry[1] is session:
+            del _SESSIONS[id(loop)]
+        if not session.closed:
+            await session.close()
+
+    _SESSIONS[id(loop)] = (loop, session, on_running_loop_shutdown(close))
+    return session
+
+
+@contextmanager
+def openai_session() -> Iterator["ClientSession"]:
+    """
+    Route async `openai` requests made in this context through the pooled
+    session for the running event loop.
+    """
+    import openai
+
+    session = get_openai_session()
+    token = openai.aiosession.set(session)
+    try:
+        yield session
+    finally:
+        openai.aiosession.reset(token)
+
+
+async def close_openai_session() -> None:
+    """
+    Close the pooled session for the running event loop, if any. This happens
+    automatically when the loop shuts down.
+    """
+    _, session, _ = _SESSIONS.pop(id(asyncio.get_running_loop()), (None,) * 3)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@atexit.register
+def _close_openai_sessions() -> None:
+    for loop, session, _ in list(_SESSIONS.values()):
+        if not session.closed and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(session.close())
+    _SESSIONS.clear()
+
+
 def serialize_function_or_callable(
     function_or_callable: Union[Function, Callable[..., Any]],
     name: Optional[str] = None,
@@ -57,61 +158,133 @@ def serialize_function_or_callable(
         )
 
 
-class OpenAIStreamHandler(StreamHandler):
-    async def handle_streaming_response(
-        self,
-        api_response: AsyncGenerator[OpenAIObject, None],
-    ) -> OpenAIObject:
-        final_chunk = {}
-        accumulated_content = ""
+class OpenAIStreamAccumulator:
+    """
+    Converts streamed chat completion chunks into stream events, and
+    accumulates them into the complete response. Content and function-call
+    deltas are accumulated separately for every choice.
+    """
+
+    def __init__(self) -> None:
+        self.metadata: dict[str, Any] = {}
+        self.roles: dict[int, str] = {}
+        self.contents: dict[int, list[str]] = {}
+        self.function_names: dict[int, str] = {}
+        self.function_arguments: dict[int, list[str]] = {}
+        self.finish_reasons: dict[int, str] = {}
+        self.usage: Optional[Usage] = None
+
+    def add(self, chunk: OpenAIObject) -> list[StreamEvent]:
+        data = chunk.to_dict_recursive()
+        self.metadata.update(
+            {k: data[k] for k in ("id", "created", "model") if k in data}
+        )
+        if usage := data.get("usage"):
+            self.usage = Usage(**usage)
+        events: list[StreamEvent] = []
+        for choice in data.get("choices", []):
+            index = choice.get("index", 0)
+            delta = choice.get("delta") or {}
+            self.contents.setdefault(index, [])
+            if finish_reason := choice.get("finish_reason"):
+                self.finish_reasons[index] = finish_reason
+            if role := delta.get("role"):
+                self.roles[index] = role
+            if content := delta.get("content"):
+                self.contents[index].append(content)
+                events.append(ContentDelta(index=index, content=content))
+            if function_call := delta.get("function_call"):
+                if name := function_call.get("name"):
+                    self.function_names[index] = name
+                arguments = function_call.get("arguments") or ""
+                self.function_arguments.setdefault(index, []).append(arguments)
+                events.append(
+                    FunctionCallDelta(index=index, name=name, arguments=arguments)
+                )
+        return events
 
-        async for r in api_response:
-            final_chunk.update(r.to_dict_recursive())
+    def function_call(self, index: int) -> Optional[dict[str, str]]:
+        if index not in self.function_names and index not in self.function_arguments:
+            return None
+        return {
+            "name": self.function_names.get(index, ""),
+            "arguments": "".join(self.function_arguments.get(index, [])),
+        }
 
-            delta = r.choices[0].delta if r.choices and r.choices[0] else None
+    def message(self, index: int) -> dict[str, Any]:
+        return {
+            "role": self.roles.get(index, "assistant"),
+            "content": "".join(self.contents[index]) or None,
+            "function_call": self.function_call(index),
+        }
 
-            if delta is None:
+    def response(self) -> Response[Any]:
+        choices = []
+        for index in sorted(self.contents):
+            message = self.message(index)
+            finish_reason = self.finish_reasons.get(index) or (
+                "function_call" if message["function_call"] else "stop"
+            )
+            if message["content"] is None and not message["function_call"]:
+                message["content"] = ""
+            choices.append(
+                {"index": index, "message": message, "finish_reason": finish_reason}
+            )
+        return Response(
+            id=self.metadata.get("id", ""),
+            object="chat.completion",
+            created=self.metadata.get("created", 0),
+            model=self.metadata.get("model", ""),
+            choices=choices,
+            # streamed responses only include usage if the request asked for it;
+            # otherwise it is counted locally once the stream completes
+            usage=self.usage
+            or Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0),
+        )
+
+
+class OpenAIStreamHandler(StreamHandler):
+    """
+    Adapts stream events to the `stream_handler` callback, which receives the
+    content accumulated so far after every event. Awaitable callbacks are
+    awaited before the next chunk is read.
+    """
+
+    async def handle_streaming_response(
+        self,
+        api_response: AsyncIterator[StreamEvent],
+    ) -> Optional[Response[Any]]:
+        content = ""
+        function_call: Optional[FunctionCall] = None
+        response = None
+
+        async for event in api_response:
+            if isinstance(event, StreamComplete):
+                response = event.response
                 continue
 
-            if "content" in delta:
-                accumulated_content += delta.content or ""
+            if event.index == 0 and isinstance(event, ContentDelta):
+                content += event.content
+            elif event.index == 0 and isinstance(event, FunctionCallDelta):
+                name = event.name or (function_call.name if function_call else "")
+                arguments = function_call.arguments if function_call else ""
+                function_call = FunctionCall(
+                    name=name, arguments=arguments + event.arguments
+                )
 
             if self.callback:
                 callback_result = self.callback(
                     Message(
-                        content=accumulated_content, role="assistant", data=final_chunk
+                        content=content,
+                        role="assistant",
+                        function_call=function_call,
+                        data=model_dump(event),
                     )
                 )
                 if inspect.isawaitable(callback_result):
-                    create_task(callback_result)
-
-        if "choices" in final_chunk and len(final_chunk["choices"]) > 0:
-            final_chunk["choices"][0]["content"] = accumulated_content
-
-        final_chunk["object"] = "chat.completion"
-
-        return OpenAIObject.construct_from(
-            {
-                "id": final_chunk["id"],
-                "object": "chat.completion",
-                "created": final_chunk["created"],
-                "model": final_chunk["model"],
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": accumulated_content,
-                        },
-                        "finish_reason": "stop",
-                    }
-                ],
-                # TODO: Figure out how to get the usage from the streaming response
-                "usage": Usage.parse_obj(
-                    {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-                ),
-            }
-        )
+                    await callback_result
+
+        return response
 
 
 class OpenAIChatCompletion(AbstractChatCompletion[T]):
@@ -120,7 +293,10 @@ class OpenAIChatCompletion(AbstractChatCompletion[T]):
     """
 
     def __init__(self, provider: str, **kwargs: Any):
-        super().__init__(defaults=settings.get_defaults(provider or "openai") | kwargs)
+        super().__init__(
+            defaults=settings.get_defaults(provider or "openai") | kwargs,
+            provider=provider or "openai",
+        )
 
     def _serialize_request(
         self, request: Optional[Request[T]] = None
@@ -186,18 +362,25 @@ class OpenAIChatCompletion(AbstractChatCompletion[T]):
         Parse the response received from OpenAI.
         """
         # Convert OpenAI's response into a standard format or object
+        if isinstance(response, Response):
+            return response
         return Response(**response.to_dict_recursive())  # type: ignore
 
     def _send_request(self, **serialized_request: Any) -> Any:
         """
         Send the serialized request to OpenAI's endpoint/service.
         """
-        # Use openai's library functions to send the request and get a response
-        # Example:
+        import openai
 
-        return run_sync(
-            self._send_request_async(**serialized_request),
-        )
+        if serialized_request.get("stream_handler"):
+            return run_sync(
+                self._send_request_async(**serialized_request),
+            )
+
+        serialized_request.pop("stream_handler", None)
+
+        # the synchronous client reuses a keep-alive session per thread
+        return openai.ChatCompletion.create(**serialized_request)  # type: ignore
 
     async def _send_request_async(self, **serialized_request: Any) -> Response[T]:
         """
@@ -206,13 +389,35 @@ class OpenAIChatCompletion(AbstractChatCompletion[T]):
         import openai
 
         if handler_fn := serialized_request.pop("stream_handler", {}):
-            serialized_request["stream"] = True
-
-        response = await openai.ChatCompletion.acreate(**serialized_request)  # type: ignore # noqa
-
-        if handler_fn:
-            response = await OpenAIStreamHandler(
+            return await OpenAIStreamHandler(
                 callback=handler_fn,
-            ).handle_streaming_response(response)
+            ).handle_streaming_response(
+                self._stream_request_async(**serialized_request)
+            )
+
+        with openai_session():
+            response = await openai.ChatCompletion.acreate(**serialized_request)  # type: ignore # noqa
 
         return response
+
+    async def _stream_request_async(
+        self, **serialized_request: Any
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Stream the serialized request from OpenAI's endpoint.
+        """
+        import openai
+
+        serialized_request.pop("stream_handler", None)
+        serialized_request["stream"] = True
+
+        with openai_session():
+            chunks = await openai.ChatCompletion.acreate(**serialized_request)  # type: ignore # noqa
+
+        accumulator = OpenAIStreamAccumulator()
+        async for chunk in chunks:
+            for event in accumulator.add(chunk):
+                yield event
+
+        response = accumulator.response()
+        yield StreamComplete(response=response, usage=response.usage)
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from typing import Any, Optional
+
+from marvin.settings import settings
+from marvin.utilities.logging import get_logger
+
+# tokens added per message by the chat format, see
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb # noqa
+TOKENS_PER_MESSAGE = 4
+
+
+class TokenBucket:
+    """
+    A bucket that holds up to `capacity` units and refills continuously at
+    `capacity` units per minute.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = float(capacity)
+        self.available = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity,
+            self.available + (now - self.updated) * self.capacity / 60,
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` units are available. Requests larger than the
+        bucket only wait for it to be full, so they can never block forever.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Enforces requests-per-minute and tokens-per-minute budgets. A limiter is
+    safe to share between threads and event loops.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        if requests_per_minute:
+            self.requests = TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+
+    @property
+    def limits_tokens(self) -> bool:
+        return self.tokens is not None
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        Consume one request and `tokens` tokens if both are available and
+        return 0, otherwise return the number of seconds to wait.
+        """
+        with self._lock:
+            wait = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            )
+            if wait == 0:
+                if self.requests:
+                    self.requests.consume(1)
+                if self.tokens:
+                    self.tokens.consume(tokens)
+            return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Correct the token budget once the provider has reported actual usage.
+        """
+        if self.tokens is None or actual_tokens <= 0:
+            return
+        with self._lock:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+
+
+def estimate_tokens(serialized_request: dict[str, Any]) -> int:
+    """
+    Estimate the number of tokens a request will use, counting the prompt
+    locally and assuming the completion uses its full `max_tokens` budget.
+    """
+    from marvin.utilities.strings import count_tokens
+
+    from .usage import count_prompt_tokens
+
+    tokens = count_prompt_tokens(serialized_request, count_tokens)
+    tokens += (
+        serialized_request.get("max_tokens")
+        or serialized_request.get("max_tokens_to_sample")
+        or 0
+    )
+    return tokens
+
+
+_rate_limiters: dict[tuple[str, str, str], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: Optional[str]) -> Optional[RateLimiter]:
+    """
+    Return the process-wide rate limiter for a provider and model, configured
+    by `settings.llm_rate_limits`. Limits set for `{provider}/{model}` take
+    precedence over limits set for `{provider}`, which are shared by all of
+    that provider's models.
+    """
+    for scope in (f"{provider}/{model}", provider):
+        if (limits := settings.llm_rate_limits.get(scope)) is not None:
+            break
+    else:
+        return None
+
+    key = (
+        scope,
+        str(limits.get("requests_per_minute")),
+        str(limits.get("tokens_per_minute")),
+    )
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            get_logger("ChatCompletion.rate_limit").debug_kv(
+                "Rate limit", f"Limiting {scope!r} to {limits}"
+            )
+            _rate_limiters[key] = RateLimiter(
+                requests_per_minute=limits.get("requests_per_minute"),
+                tokens_per_minute=limits.get("tokens_per_minute"),
+            )
+        return _rate_limiters[key]
@@ -0,0 +1,292 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from marvin.settings import settings
+from marvin.utilities.logging import get_logger
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+# provider exceptions that signal a transient failure but carry no status code
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "ServiceUnavailableError",
+    "Timeout",
+    "TryAgain",
+}
+
+# counts of retry events by (provider, event), for tuning retry settings
+retry_stats: Counter[tuple[str, str]] = Counter()
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of sending a request while a provider's circuit is open.
+    """
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    """
+    The HTTP status of the provider's response to a failed request, if the
+    provider responded.
+    """
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Whether an exception raised by a provider is transient and worth retrying.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = get_status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return type(exc).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """
+    The number of seconds the provider asked us to wait, if any.
+    """
+    headers = getattr(exc, "headers", None) or getattr(
+        getattr(exc, "response", None), "headers", None
+    )
+    if not headers:
+        return None
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+    if (value := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive transient failures. Once
+    `reset_seconds` have passed, a single trial request is let through; if it
+    succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_request(self) -> None:
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if (
+                time.monotonic() - self.opened_at < self.reset_seconds
+                or self._trial_in_progress
+            ):
+                raise CircuitOpenError(
+                    f"Circuit is open after {self.failures} consecutive failures;"
+                    f" retrying in at most {self.reset_seconds}s."
+                )
+            self._trial_in_progress = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def release_trial(self) -> None:
+        """
+        Give up a trial request without an outcome, e.g. because it was
+        cancelled, so that the next request can be the trial.
+        """
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.threshold > 0 and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers: dict[tuple[str, int, float], CircuitBreaker] = {}
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    """
+    Return the process-wide circuit breaker for a provider and the current
+    `settings.llm_circuit_breaker_*` settings.
+    """
+    threshold = settings.llm_circuit_breaker_threshold
+    reset_seconds = settings.llm_circuit_breaker_reset_seconds
+    breaker_key = (key, threshold, reset_seconds)
+    if breaker_key not in _circuit_breakers:
+        _circuit_breakers[breaker_key] = CircuitBreaker(
+            threshold=threshold, reset_seconds=reset_seconds
+        )
+    return _circuit_breakers[breaker_key]
+
+
+class Retrier:
+    """
+    Tracks the state of one logical request across its attempts: the
+    backoff schedule, the overall deadline and the provider's circuit.
+
+    The overall deadline is `settings.llm_request_timeout_seconds`; each
+    attempt is additionally bounded by `settings.llm_attempt_timeout_seconds`.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.breaker = get_circuit_breaker(key)
+        self.max_retries = settings.llm_max_retries
+        self.attempt = 0
+        self.logger = get_logger("ChatCompletion.retry")
+        timeout = settings.llm_request_timeout_seconds
+        self.deadline: Optional[float] = (
+            time.monotonic() + timeout if isinstance(timeout, (int, float)) else None
+        )
+
+    def attempt_timeout(self) -> Optional[float]:
+        """
+        The timeout for the next attempt: `settings.llm_attempt_timeout_seconds`,
+        capped at the time left before the deadline, or None if it is not set.
+        """
+        timeout = settings.llm_attempt_timeout_seconds
+        if timeout is None or self.deadline is None:
+            return timeout
+        return min(timeout, max(0.0, self.deadline - time.monotonic()))
+
+    def before_attempt(self) -> None:
+        self.attempt += 1
+        retry_stats[(self.key, "attempts")] += 1
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError:
+            retry_stats[(self.key, "rejected")] += 1
+            raise
+
+    def on_success(self) -> None:
+        self.breaker.record_success()
+
+    def on_abort(self) -> None:
+        """
+        Record an attempt that was interrupted before it had an outcome.
+        """
+        self.breaker.release_trial()
+
+    def on_failure(self, exc: BaseException) -> float:
+        """
+        Record a failed attempt. Returns the number of seconds to wait before
+        the next attempt, or re-raises if the request should not be retried.
+        """
+        if not is_retryable(exc):
+            if get_status_code(exc) is not None:
+                # the provider answered, so it is up even if the request was bad
+                self.breaker.record_success()
+            else:
+                # a local error, e.g. parsing the response, says nothing about
+                # whether the provider is up
+                self.breaker.release_trial()
+            raise exc
+        self.breaker.record_failure()
+        retry_stats[(self.key, "failures")] += 1
+
+        delay = get_retry_after(exc)
+        if delay is None:
+            cap = min(
+                settings.llm_retry_max_backoff_seconds,
+                settings.llm_retry_initial_backoff_seconds * 2 ** (self.attempt - 1),
+            )
+            delay = random.uniform(0, cap)
+
+        if self.attempt > self.max_retries or self.breaker.is_open:
+            raise exc
+        if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+            raise exc
+
+        retry_stats[(self.key, "retries")] += 1
+        self.logger.warning_kv(
+            "Retrying request",
+            (
+                f"Attempt {self.attempt} of {self.max_retries + 1} to {self.key!r}"
+                f" failed with {type(exc).__name__}: {exc}. Retrying in"
+                f" {delay:.2f}s."
+            ),
+            key_style="yellow",
+        )
+        return delay
+
+
+def call_with_retries(fn: Callable[[Optional[float]], T], key: str) -> T:
+    """
+    Call `fn` until it succeeds or fails with a non-retryable error. `fn`
+    receives the timeout for the attempt, in seconds.
+    """
+    retrier = Retrier(key)
+    while True:
+        retrier.before_attempt()
+        try:
+            result = fn(retrier.attempt_timeout())
+        except Exception as exc:
+            time.sleep(retrier.on_failure(exc))
+        except BaseException:
+            # e.g. a cancelled task, which must not hold the circuit's trial
+            retrier.on_abort()
+            raise
+        else:
+            retrier.on_success()
+            return result
+
+
+async def call_with_retries_async(
+    fn: Callable[[Optional[float]], Awaitable[T]], key: str
+) -> T:
+    """
+    Await `fn` until it succeeds or fails with a non-retryable error. `fn`
+    receives the timeout for the attempt, in seconds.
+    """
+    retrier = Retrier(key)
+    while True:
+        retrier.before_attempt()
+        try:
+            result = await fn(retrier.attempt_timeout())
+        except Exception as exc:
+            await asyncio.sleep(retrier.on_failure(exc))
+        except BaseException:
+            # e.g. a cancelled task, which must not hold the circuit's trial
+            retrier.on_abort()
+            raise
+        else:
+            retrier.on_success()
+            return result
+
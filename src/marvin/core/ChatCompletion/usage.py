@@ -0,0 +1,84 @@
+import json
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from .handlers import Response, Usage
+from .rate_limit import TOKENS_PER_MESSAGE
+
+# every reply is primed with <|start|>assistant<|message|>, see
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb # noqa
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def get_tiktoken_encoding(model: Optional[str] = None) -> Any:
+    """
+    Get the tiktoken encoding for an OpenAI model, falling back to the
+    encoding of gpt-3.5-turbo for models tiktoken does not know.
+    """
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model or "gpt-3.5-turbo")
+    except KeyError:
+        return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+
+def count_openai_tokens(text: str, model: Optional[str] = None) -> int:
+    return len(get_tiktoken_encoding(model).encode(text))
+
+
+def count_prompt_tokens(
+    serialized_request: dict[str, Any], count_tokens: Callable[[str], int]
+) -> int:
+    """
+    Count the tokens of a serialized request's prompt: its messages (or text
+    prompt) and function definitions.
+    """
+    tokens = 0
+    if messages := serialized_request.get("messages"):
+        tokens += TOKENS_PER_REPLY
+    for message in messages or []:
+        tokens += TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "")
+        if name := message.get("name"):
+            tokens += count_tokens(name)
+        if function_call := message.get("function_call"):
+            tokens += count_tokens(json.dumps(function_call))
+    if prompt := serialized_request.get("prompt"):
+        tokens += count_tokens(prompt)
+    if functions := serialized_request.get("functions"):
+        tokens += count_tokens(json.dumps(functions))
+    return tokens
+
+
+def count_completion_tokens(
+    response: Response[Any], count_tokens: Callable[[str], int]
+) -> int:
+    """
+    Count the tokens generated for all of a response's choices.
+    """
+    tokens = 0
+    for choice in response.choices:
+        tokens += count_tokens(choice.message.content or "")
+        if function_call := choice.message.function_call:
+            tokens += count_tokens(function_call.name)
+            tokens += count_tokens(function_call.arguments)
+    return tokens
+
+
+def count_usage(
+    serialized_request: dict[str, Any],
+    response: Response[Any],
+    count_tokens: Callable[[str], int],
+) -> Usage:
+    """
+    Compute the usage of a completion locally, for responses whose provider
+    did not report it.
+    """
+    prompt_tokens = count_prompt_tokens(serialized_request, count_tokens)
+    completion_tokens = count_completion_tokens(response, count_tokens)
+    return Usage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
@@ -1,6 +1,6 @@
 import json
 from ast import literal_eval
-from typing import Any
+from typing import Any, Optional
 
 
 def parse_raw(raw: str) -> dict[str, Any]:
@@ -13,3 +13,19 @@ def parse_raw(raw: str) -> dict[str, Any]:
     except Exception:
         pass
     return {}
+
+
+def with_timeout(
+    serialized_request: dict[str, Any], timeout: Optional[float]
+) -> dict[str, Any]:
+    """
+    Cap the provider's own request timeout (`request_timeout` for OpenAI,
+    `timeout` for Anthropic) at `timeout` seconds.
+    """
+    if timeout is None:
+        return serialized_request
+    request = dict(serialized_request)
+    for key in ("request_timeout", "timeout"):
+        if isinstance(request.get(key), (int, float)):
+            request[key] = min(request[key], timeout)
+    return request
@@ -7,6 +7,7 @@ import openai.openai_object
 
 import marvin
 import marvin.utilities.types
+from marvin.core.ChatCompletion.providers.openai import openai_session
 from marvin.utilities.async_utils import create_task
 from marvin.utilities.logging import get_logger
 from marvin.utilities.messages import Message, Role
@@ -173,13 +174,14 @@ class OpenAIChatLLM(ChatLLM):
         kwargs.setdefault("temperature", self.temperature)
         kwargs.setdefault("max_tokens", self.max_tokens)
 
-        response = await openai.ChatCompletion.acreate(
-            model=self.model,
-            messages=prompt,
-            stream=True if stream_handler else False,
-            request_timeout=marvin.settings.llm_request_timeout_seconds,
-            **kwargs,
-        )
+        with openai_session():
+            response = await openai.ChatCompletion.acreate(
+                model=self.model,
+                messages=prompt,
+                stream=True if stream_handler else False,
+                request_timeout=marvin.settings.llm_request_timeout_seconds,
+                **kwargs,
+            )
 
         if stream_handler:
             handler = OpenAIStreamHandler(callback=stream_handler)
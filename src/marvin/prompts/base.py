@@ -1,6 +1,6 @@
 import abc
 import inspect
-from functools import partial, wraps
+from functools import lru_cache, partial, wraps
 from typing import (
     Any,
     Callable,
@@ -13,12 +13,12 @@ from typing import (
     Union,
 )
 
-from jinja2 import Environment
+from jinja2 import Environment, Template
 from pydantic import BaseModel, Field
 from typing_extensions import ParamSpec, Self
 
 import marvin
-from marvin._compat import cast_to_json, cast_to_model, model_dump, model_json_schema
+from marvin._compat import cast_to_json, cast_to_model, model_dump
 from marvin.core.ChatCompletion import ChatCompletion
 from marvin.core.ChatCompletion.abstract import AbstractChatCompletion
 from marvin.utilities.messages import Message, Role
@@ -27,6 +27,18 @@ from marvin.utilities.strings import count_tokens, jinja_env
 T = TypeVar("T")
 P = ParamSpec("P")
 
+# the number of compiled prompt templates that are kept for reuse
+TEMPLATE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(content: str) -> Template:
+    """
+    Compile a prompt template. Templates are cached, since compiling is much
+    slower than rendering.
+    """
+    return jinja_env.from_string(inspect.cleandoc(content))
+
 
 class MessageList(list[Message]):
     def render(
@@ -142,9 +154,7 @@ class BasePrompt(BaseModel, abc.ABC):
         """
         Helper function for rendering any jinja2 template with runtime render kwargs
         """
-        return jinja_env.from_string(inspect.cleandoc(content)).render(
-            **(render_kwargs or {})
-        )
+        return compile_template(content).render(**(render_kwargs or {}))
 
     def __or__(self: Self, other: Union[Self, list[Self]]) -> PromptList:
         """
@@ -231,9 +241,7 @@ class Prompt(BasePrompt, Generic[P], extra="allow", arbitrary_types_allowed=True
         response["messages"] = _dict["messages"]
 
         if _dict.get("response_model", None):
-            response["functions"] = [
-                model_json_schema(cast_to_model(_dict["response_model"]))
-            ]
+            response["functions"] = [cast_to_json(_dict["response_model"])]
             response["function_call"] = {"name": response["functions"][0]["name"]}
         elif _dict.get("functions", None):
             response["functions"] = [
@@ -269,22 +277,37 @@ class Prompt(BasePrompt, Generic[P], extra="allow", arbitrary_types_allowed=True
         Callable[[Callable[P, None]], Callable[P, Self]],
         Callable[P, Self],
     ]:
-        def wrapper(func: Callable[P, Any], *args: P.args, **kwargs: P.kwargs) -> Self:
+        @lru_cache(maxsize=None)
+        def compile_prompt(
+            func: Callable[P, Any]
+        ) -> tuple[inspect.Signature, type[Self], type[BaseModel]]:
+            """
+            Build the parts of the prompt that do not depend on its arguments
+            once per function: its signature, class and response model.
+            """
             signature = inspect.signature(func)
+            return (
+                signature,
+                type(getattr(cls, "__name__", ""), (cls,), {}),
+                cast_to_model(
+                    response_model or signature.return_annotation,
+                    name=response_model_name,
+                    description=response_model_description,
+                    field_name=response_model_field_name,
+                ),
+            )
+
+        def wrapper(func: Callable[P, Any], *args: P.args, **kwargs: P.kwargs) -> Self:
+            signature, prompt_cls, prompt_response_model = compile_prompt(func)
             params = signature.bind(*args, **kwargs)
             params.apply_defaults()
-            response = type(getattr(cls, "__name__", ""), (cls,), {})(
+            response = prompt_cls(
                 __params__=params.arguments,
                 **params.arguments,
                 **ctx or {},
                 functions=functions,
                 function_call=function_call,
-                response_model=cast_to_model(
-                    response_model or signature.return_annotation,
-                    name=response_model_name,
-                    description=response_model_description,
-                    field_name=response_model_field_name,
-                ),
+                response_model=prompt_response_model,
                 response_model_name=response_model_name,
                 response_model_description=response_model_description,
                 response_model_field_name=response_model_field_name,
@@ -35,6 +35,11 @@ class OpenAISettings(MarvinBaseSettings):
     api_base: Optional[str] = None
     api_version: Optional[str] = None
 
+    # connection pool shared by all async OpenAI requests on an event loop
+    pool_max_connections: int = 100
+    pool_max_connections_per_host: int = 0
+    pool_keepalive_seconds: float = 30.0
+
     def get_defaults(self, settings: "Settings") -> dict[str, Any]:
         import os
 
@@ -76,6 +81,8 @@ class AnthropicSettings(MarvinBaseSettings):
         response["api_key"] = self.api_key and self.api_key.get_secret_value()
         response["temperature"] = settings.llm_temperature
         response["timeout"] = settings.llm_request_timeout_seconds
+        # retries are handled by marvin, see marvin.core.ChatCompletion.retry
+        response["max_retries"] = 0
         if os.environ.get("MARVIN_ANTHROPIC_API_KEY"):
             response["api_key"] = os.environ["MARVIN_ANTHROPIC_API_KEY"]
         if os.environ.get("ANTHROPIC_API_KEY"):
@@ -145,6 +152,56 @@ class Settings(MarvinBaseSettings):
     llm_temperature: float = 0.8
     llm_request_timeout_seconds: Union[float, list[float]] = 600.0
 
+    # LLM RESPONSE CACHE
+    llm_cache_enabled: bool = False
+    llm_cache_max_size: int = 1024
+    llm_cache_ttl_seconds: Optional[float] = None
+    llm_cache_persist: bool = False
+    llm_coalesce_requests: bool = False
+
+    # LLM RETRIES
+    llm_max_retries: int = 3
+    llm_retry_initial_backoff_seconds: float = 1.0
+    llm_retry_max_backoff_seconds: float = 60.0
+    llm_attempt_timeout_seconds: Optional[float] = None
+    llm_circuit_breaker_threshold: int = 5
+    llm_circuit_breaker_reset_seconds: float = 30.0
+
+    # LLM RATE LIMITS
+    # maps "{provider}/{model}" or "{provider}" to a dict with optional
+    # "requests_per_minute" and "tokens_per_minute" budgets
+    llm_rate_limits: dict[str, dict[str, int]] = {}
+
+    # FUNCTION CALLS
+    function_call_timeout_seconds: Optional[float] = None
+    function_call_max_workers: int = 8
+
+    # MEMOIZATION
+    memoization_max_size: int = 1024
+    memoization_ttl_seconds: Optional[float] = None
+
+    # SEMANTIC CACHE
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_size: int = 10_000
+    semantic_cache_persist: bool = False
+
+    # MAPPING
+    # the number of calls that `map` runs at once; None means no limit
+    map_max_concurrency: Optional[int] = 32
+    # the size of each request of `map_packed`
+    map_packed_max_inputs: int = 20
+    map_packed_max_tokens: int = 2000
+
+    # AI CLASSIFIERS
+    # the most options that each classifier of a hierarchical classifier chooses from
+    ai_classifier_group_size: int = 20
+
+    # AI MODELS
+    # texts too long for one prompt are parsed in overlapping windows
+    ai_model_chunk_tokens: int = 2000
+    ai_model_chunk_overlap: int = 200
+    ai_model_reducer: Literal["union", "first", "llm"] = "union"
+
     # AI APPLICATIONS
     ai_application_max_iterations: Optional[int] = None
 
@@ -1,13 +1,48 @@
 import asyncio
 import functools
 from concurrent.futures import ThreadPoolExecutor
-from typing import Awaitable, TypeVar
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    TypeVar,
+)
 
 T = TypeVar("T")
 
 BACKGROUND_TASKS = set()
 
 
+def on_running_loop_shutdown(
+    hook: Callable[[], Awaitable[None]],
+) -> AsyncIterator[None]:
+    """
+    Registers a coroutine function to be awaited when the running event loop
+    shuts down its async generators, which `asyncio.run` (and so `run_sync`)
+    does for every loop it creates before closing it.
+
+    Returns the async generator that waits for the shutdown; event loops only
+    hold weak references to it, so the caller must keep it alive.
+    """
+
+    async def wait_for_shutdown() -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            await hook()
+
+    waiter = wait_for_shutdown()
+    # the first step registers the generator with the running loop and runs
+    # it to its `yield` without suspending
+    try:
+        waiter.__anext__().send(None)  # type: ignore
+    except StopIteration:
+        pass
+    return waiter
+
+
 def create_task(coro):
     """
     Creates async background tasks in a way that is safe from garbage
@@ -67,3 +102,34 @@ def run_sync(coroutine: Awaitable[T]) -> T:
             return asyncio.run(coroutine)
     except RuntimeError:
         return asyncio.run(coroutine)
+
+
+def iterate_sync(aiterable: AsyncIterable[T]) -> Iterator[T]:
+    """
+    Iterates an async iterable from a synchronous context. Items are produced
+    one at a time, only when requested, on a private event loop that runs in
+    a worker thread so this also works when the calling thread already has a
+    running loop.
+    """
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    iterator = aiterable.__aiter__()
+
+    def step(coroutine: Awaitable[T]) -> T:
+        return executor.submit(loop.run_until_complete, coroutine).result()
+
+    async def close() -> None:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+        await loop.shutdown_asyncgens()
+
+    try:
+        while True:
+            try:
+                yield step(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        step(close())
+        executor.submit(loop.close).result()
+        executor.shutdown()
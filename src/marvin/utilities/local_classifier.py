@@ -0,0 +1,191 @@
+import random
+import sqlite3
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Union
+
+from marvin.utilities.logging import get_logger
+from marvin.utilities.semantic_cache import Embedder, embed_text, import_numpy
+
+if TYPE_CHECKING:
+    import numpy
+
+
+class LabelStore:
+    """
+    The labeled texts that a local classifier learns from, with their
+    embeddings. If a `path` is provided, labels are stored in a SQLite
+    database there, so they survive restarts.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        self.path = Path(path) if path else None
+        self.texts: list[str] = []
+        self.labels: list[str] = []
+        self.vectors: list["numpy.ndarray"] = []
+        self._connection: Optional[sqlite3.Connection] = None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS labels (text TEXT NOT NULL, label TEXT NOT"
+                " NULL, vector BLOB NOT NULL)"
+            )
+            self._connection.commit()
+            numpy = import_numpy()
+            for text, label, vector in self._connection.execute(
+                "SELECT text, label, vector FROM labels ORDER BY rowid"
+            ):
+                self.texts.append(text)
+                self.labels.append(label)
+                self.vectors.append(numpy.frombuffer(vector, dtype=numpy.float32))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def add(self, text: str, label: str, vector: "numpy.ndarray") -> None:
+        self.texts.append(text)
+        self.labels.append(label)
+        self.vectors.append(vector)
+        if self._connection is not None:
+            self._connection.execute(
+                "INSERT INTO labels VALUES (?, ?, ?)",
+                (text, label, vector.astype("float32").tobytes()),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class LocalClassifier:
+    """
+    A classifier that learns from the labels of a slower classifier, such as
+    an LLM, and answers in its place when it is confident.
+
+    Texts are embedded, and each label is represented by the centroid of the
+    embeddings of its texts. A text's label probabilities are a softmax of its
+    cosine similarity to each centroid, divided by `temperature`. Once
+    `min_examples` texts with at least two labels have been learned,
+    predictions with a probability of at least `threshold` are answered
+    locally, and all other texts are escalated to the slower classifier,
+    whose label is learned.
+
+    To monitor accuracy, a `sample_rate` share of confident predictions is
+    escalated anyway and compared to the slower classifier's label. If the
+    share of the last `window` checks that agreed falls below
+    `min_accuracy`, every text is escalated until it recovers. Local
+    answers, escalations, checks and disagreements are counted in `stats`.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Embedder] = None,
+        threshold: float = 0.9,
+        min_examples: int = 20,
+        temperature: float = 0.05,
+        sample_rate: float = 0.05,
+        min_accuracy: float = 0.9,
+        window: int = 100,
+        path: Optional[Union[str, Path]] = None,
+    ):
+        if embed is None:
+            from marvin.utilities.embeddings import create_openai_embeddings
+
+            embed = create_openai_embeddings
+        self.embed = embed
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.temperature = temperature
+        self.sample_rate = sample_rate
+        self.min_accuracy = min_accuracy
+        self.store = LabelStore(path)
+        self.checks: deque[bool] = deque(maxlen=window)
+        self.stats: Counter[str] = Counter()
+        self._sums: dict[str, "numpy.ndarray"] = {}
+        self._centroids: Optional[tuple[list[str], "numpy.ndarray"]] = None
+        self._lock = threading.Lock()
+        for label, vector in zip(self.store.labels, self.store.vectors):
+            self._add_to_centroid(label, vector)
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """
+        The share of the last checked predictions that were right, or None
+        before the first check.
+        """
+        if not self.checks:
+            return None
+        return sum(self.checks) / len(self.checks)
+
+    def _add_to_centroid(self, label: str, vector: "numpy.ndarray") -> None:
+        if label in self._sums:
+            self._sums[label] = self._sums[label] + vector
+        else:
+            self._sums[label] = vector.astype("float32")
+        self._centroids = None
+
+    def learn(self, text: str, label: str, vector: "numpy.ndarray") -> None:
+        """
+        Learn the label of an embedded text.
+        """
+        with self._lock:
+            self.store.add(text, label, vector)
+            self._add_to_centroid(label, vector)
+
+    def predict(self, vector: "numpy.ndarray") -> tuple[Optional[str], float]:
+        """
+        Return the most likely label of an embedded text and its probability,
+        or no label if too few texts have been learned.
+        """
+        numpy = import_numpy()
+        with self._lock:
+            if len(self.store) < self.min_examples or len(self._sums) < 2:
+                return None, 0.0
+            if self._centroids is None:
+                labels = list(self._sums)
+                centroids = numpy.stack([self._sums[label] for label in labels])
+                centroids /= numpy.linalg.norm(centroids, axis=1, keepdims=True)
+                self._centroids = (labels, centroids)
+            labels, centroids = self._centroids
+        logits = (centroids @ vector) / self.temperature
+        probabilities = numpy.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return labels[best], float(probabilities[best])
+
+    async def aclassify(
+        self, text: str, classify: Callable[[str], Awaitable[str]]
+    ) -> str:
+        """
+        Label a text locally if possible, and otherwise with `classify`, the
+        slower classifier, whose label is learned.
+        """
+        vector = await embed_text(self.embed, text)
+        label, probability = self.predict(vector)
+        confident = label is not None and probability >= self.threshold
+        accuracy = self.accuracy
+        trusted = accuracy is None or accuracy >= self.min_accuracy
+        if confident and trusted and random.random() >= self.sample_rate:
+            self.stats["local"] += 1
+            return label  # type: ignore
+
+        actual = await classify(text)
+        self.stats["escalated"] += 1
+        if confident:
+            self.checks.append(actual == label)
+            self.stats["checked"] += 1
+            if actual != label:
+                self.stats["disagreed"] += 1
+                get_logger("marvin.LocalClassifier").debug_kv(
+                    "Local prediction was wrong",
+                    f"predicted {label!r} but the label is {actual!r}.",
+                )
+        self.learn(text, actual, vector)
+        return actual
+
+    def close(self) -> None:
+        self.store.close()
@@ -0,0 +1,258 @@
+import asyncio
+import inspect
+from collections.abc import Sequence, Sized
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from marvin._compat import BaseModel
+from marvin.settings import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+Inputs = Union[Iterable[T], AsyncIterable[T]]
+
+
+class MapProgress(BaseModel):
+    """
+    The progress of a map, passed to its `on_progress` callback each time an
+    item finishes. `total` is only known if the inputs have a length.
+    """
+
+    total: Optional[int] = None
+    started: int = 0
+    completed: int = 0
+    failed: int = 0
+
+
+async def _aiter(inputs: Inputs[T]) -> AsyncIterator[T]:
+    if isinstance(inputs, AsyncIterable):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
+
+
+async def _map(
+    fn: Callable[[T], Awaitable[R]],
+    inputs: Inputs[T],
+    max_concurrency: Optional[int],
+    ordered: bool,
+    return_exceptions: bool,
+    on_progress: Optional[Callable[[MapProgress], Any]],
+) -> AsyncIterator[tuple[int, Union[R, BaseException]]]:
+    if max_concurrency is None:
+        max_concurrency = settings.map_max_concurrency
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+
+    progress = MapProgress(total=len(inputs) if isinstance(inputs, Sized) else None)
+    items = _aiter(inputs)
+    exhausted = False
+    pending: dict["asyncio.Future[R]", int] = {}
+    # results that finished before an earlier item, when ordered
+    finished: dict[int, Union[R, BaseException]] = {}
+    next_index = 0
+
+    try:
+        while True:
+            # results waiting for an earlier item count against the limit, so
+            # memory stays bounded however the inputs are ordered
+            while not exhausted and (
+                max_concurrency is None
+                or len(pending) + len(finished) < max_concurrency
+            ):
+                try:
+                    item = await items.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(fn(item))] = progress.started
+                progress.started += 1
+
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=pending.__getitem__):
+                index = pending.pop(task)
+                try:
+                    result: Union[R, BaseException] = task.result()
+                    progress.completed += 1
+                except Exception as exc:
+                    if not return_exceptions:
+                        raise
+                    result = exc
+                    progress.failed += 1
+
+                if on_progress is not None:
+                    if inspect.isawaitable(update := on_progress(progress)):
+                        await update
+
+                if not ordered:
+                    yield index, result
+                    continue
+                finished[index] = result
+                while next_index in finished:
+                    yield next_index, finished.pop(next_index)
+                    next_index += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await items.aclose()
+
+
+async def amap_as_completed(
+    fn: Callable[[T], Awaitable[R]],
+    inputs: Inputs[T],
+    *,
+    max_concurrency: Optional[int] = None,
+    return_exceptions: bool = False,
+    on_progress: Optional[Callable[[MapProgress], Any]] = None,
+) -> AsyncIterator[tuple[int, Union[R, BaseException]]]:
+    """
+    Apply an async function to each input, running at most `max_concurrency`
+    calls at a time (`settings.map_max_concurrency` by default), and yield
+    `(index, result)` pairs as the calls finish.
+
+    Inputs may be any iterable or async iterable, and are only read as calls
+    are started. If `return_exceptions` is True, an item that fails yields its
+    exception as its result; otherwise the first failure is raised and the
+    remaining calls are cancelled. `on_progress` is called with a
+    `MapProgress` each time an item finishes and may be a coroutine function.
+    """
+    async for index, result in _map(
+        fn,
+        inputs,
+        max_concurrency=max_concurrency,
+        ordered=False,
+        return_exceptions=return_exceptions,
+        on_progress=on_progress,
+    ):
+        yield index, result
+
+
+async def amap_ordered(
+    fn: Callable[[T], Awaitable[R]],
+    inputs: Inputs[T],
+    *,
+    max_concurrency: Optional[int] = None,
+    return_exceptions: bool = False,
+    on_progress: Optional[Callable[[MapProgress], Any]] = None,
+) -> AsyncIterator[Union[R, BaseException]]:
+    """
+    Like `amap_as_completed`, but yield the results in the order of the
+    inputs. Results that finish before an earlier one are held until it is
+    done, and count against `max_concurrency` while they wait.
+    """
+    async for _, result in _map(
+        fn,
+        inputs,
+        max_concurrency=max_concurrency,
+        ordered=True,
+        return_exceptions=return_exceptions,
+        on_progress=on_progress,
+    ):
+        yield result
+
+
+async def amap(
+    fn: Callable[[T], Awaitable[R]],
+    inputs: Inputs[T],
+    *,
+    max_concurrency: Optional[int] = None,
+    return_exceptions: bool = False,
+    on_progress: Optional[Callable[[MapProgress], Any]] = None,
+) -> list[Union[R, BaseException]]:
+    """
+    Like `amap_ordered`, but return a list of all results, similar to
+    `asyncio.gather` with bounded concurrency.
+    """
+    return [
+        result
+        async for result in amap_ordered(
+            fn,
+            inputs,
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+            on_progress=on_progress,
+        )
+    ]
+
+
+def map_calls(
+    map_args: tuple[Any, ...], map_kwargs: dict[str, Any], broadcast: bool = False
+) -> Iterator[tuple[list[Any], dict[str, Any]]]:
+    """
+    The positional and keyword arguments of each call of a map, padding
+    shorter lists with None. Every argument must be a list, unless
+    `broadcast` is True, in which case only sequences other than strings are
+    indexed and any other argument is passed to every call.
+    """
+
+    def is_mapped(value: Any) -> bool:
+        return not broadcast or (
+            isinstance(value, Sequence) and not isinstance(value, (str, bytes))
+        )
+
+    # the positional arguments set the number of calls, if there are any
+    lengths = [len(arg) for arg in map_args if is_mapped(arg)] or [
+        len(value) for value in map_kwargs.values() if is_mapped(value)
+    ]
+    if not lengths:
+        raise ValueError("At least one argument of a map must be a sequence.")
+
+    def pick(value: Any, i: int) -> Any:
+        if not is_mapped(value):
+            return value
+        return value[i] if i < len(value) else None
+
+    # built lazily, as the calls start
+    return (
+        (
+            [pick(arg, i) for arg in map_args],
+            {key: pick(value, i) for key, value in map_kwargs.items()},
+        )
+        for i in range(max(lengths))
+    )
+
+
+def pack(
+    tokens: list[int],
+    max_inputs: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+) -> list[list[int]]:
+    """
+    Split inputs into batches of consecutive indices, given the number of
+    tokens of each input. A batch holds at most `max_inputs` inputs
+    (`settings.map_packed_max_inputs` by default) whose tokens add up to at
+    most `max_tokens` (`settings.map_packed_max_tokens` by default), except
+    that an input with more tokens gets a batch of its own.
+    """
+    max_inputs = max_inputs or settings.map_packed_max_inputs
+    max_tokens = max_tokens or settings.map_packed_max_tokens
+    batches: list[list[int]] = []
+    batch_tokens = 0
+    for index, count in enumerate(tokens):
+        if (
+            not batches
+            or len(batches[-1]) >= max_inputs
+            or batch_tokens + count > max_tokens
+        ):
+            batches.append([])
+            batch_tokens = 0
+        batches[-1].append(index)
+        batch_tokens += count
+    return batches
@@ -0,0 +1,257 @@
+import abc
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from marvin.settings import settings
+from marvin.utilities.singletons import SettingsSingleton
+
+
+class CacheStore(abc.ABC):
+    """
+    Storage for memoized results. Keys and values are strings. Entries older
+    than `ttl_seconds` are treated as missing, and once a store holds more
+    than `max_size` entries the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = 1024, ttl_seconds: Optional[float] = None
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def _is_expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    @abc.abstractmethod
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        """
+        Return the value stored for a key and the time it was stored.
+        """
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        """
+        Store a value, as of `created` (by default, now).
+        """
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryCacheStore(CacheStore):
+    """
+    Stores results in an in-memory LRU.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = 1024, ttl_seconds: Optional[float] = None
+    ):
+        super().__init__(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            created, value = self._entries[key]
+            if self._is_expired(created):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, created
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() if created is None else created, value)
+            self._entries.move_to_end(key)
+            while self.max_size is not None and len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheStore(CacheStore):
+    """
+    Stores results in a SQLite database, which survives restarts and can be
+    shared between processes.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        super().__init__(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT"
+            " NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if expired := self._is_expired(created):
+                self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            else:
+                self._connection.execute(
+                    "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+            self._connection.commit()
+            return None if expired else (value, created)
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, value, now if created is None else created, now),
+            )
+            if self.max_size is not None:
+                self._connection.execute(
+                    "DELETE FROM results WHERE key NOT IN (SELECT key FROM results"
+                    " ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_size,),
+                )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM results")
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class JSONDirectoryCacheStore(CacheStore):
+    """
+    Stores each result in a JSON file in a directory, which is easy to
+    inspect, diff and sync. Files are named by a hash of their key, and their
+    modification time tracks when they were last used.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        super().__init__(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        file = self._file(key)
+        with self._lock:
+            try:
+                entry = json.loads(file.read_text())
+            except (OSError, ValueError):
+                return None
+            if entry.get("key") != key:
+                return None
+            if self._is_expired(entry["created"]):
+                file.unlink(missing_ok=True)
+                return None
+            now = time.time()
+            os.utime(file, (now, now))
+            return entry["value"], entry["created"]
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        file = self._file(key)
+        now = time.time()
+        created = now if created is None else created
+        entry = {"key": key, "value": value, "created": created}
+        with self._lock:
+            # write atomically, so readers never see a partial file
+            temporary = file.with_suffix(".tmp")
+            temporary.write_text(json.dumps(entry))
+            os.utime(temporary, (now, now))
+            temporary.replace(file)
+            if self.max_size is not None:
+                files = sorted(
+                    self.path.glob("*.json"), key=lambda f: f.stat().st_mtime
+                )
+                for stale in files[: max(0, len(files) - self.max_size)]:
+                    stale.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for file in self.path.glob("*.json"):
+                file.unlink(missing_ok=True)
+
+
+class TieredCacheStore(CacheStore):
+    """
+    Keeps the most recently used entries of a slower store, such as a SQLite
+    database, in an in-memory LRU of `max_size` entries in front of it.
+    Entries expire when they would in the slower store.
+    """
+
+    def __init__(self, store: CacheStore, max_size: Optional[int] = 1024):
+        super().__init__(max_size=max_size, ttl_seconds=store.ttl_seconds)
+        self.store = store
+        self.memory = MemoryCacheStore(max_size=max_size, ttl_seconds=store.ttl_seconds)
+
+    def get_entry(self, key: str) -> Optional[tuple[str, float]]:
+        entry = self.memory.get_entry(key)
+        if entry is None and (entry := self.store.get_entry(key)) is not None:
+            self.memory.set(key, *entry)
+        return entry
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        created = time.time() if created is None else created
+        self.memory.set(key, value, created)
+        self.store.set(key, value, created)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.store.clear()
+
+    def close(self) -> None:
+        self.store.close()
+
+
+_cache_store = SettingsSingleton(
+    lambda: (settings.memoization_max_size, settings.memoization_ttl_seconds),
+    MemoryCacheStore,
+)
+
+
+def get_cache_store() -> MemoryCacheStore:
+    """
+    Return the process-wide, in-memory store for memoized results, rebuilding
+    it if its settings have changed since it was created.
+    """
+    return _cache_store.get()
@@ -0,0 +1,177 @@
+import json
+from typing import Any
+
+WHITESPACE = " \t\n\r"
+
+LITERALS = {"true": True, "false": False, "null": None}
+
+
+class _Incomplete(Exception):
+    """
+    Raised when the document ends before a value can be represented. The
+    rest of the document is consumed.
+    """
+
+
+class _PartialJSONParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+        # whether the document ended inside a string
+        self.truncated = False
+
+    def at_end(self) -> bool:
+        return self.position >= len(self.text)
+
+    def skip_whitespace(self) -> None:
+        while not self.at_end() and self.text[self.position] in WHITESPACE:
+            self.position += 1
+
+    def error(self, message: str) -> ValueError:
+        return ValueError(f"{message} at position {self.position}")
+
+    def incomplete(self) -> _Incomplete:
+        self.position = len(self.text)
+        return _Incomplete()
+
+    def parse_value(self) -> Any:
+        self.skip_whitespace()
+        if self.at_end():
+            raise self.incomplete()
+        char = self.text[self.position]
+        if char == "{":
+            return self.parse_object()
+        if char == "[":
+            return self.parse_array()
+        if char == '"':
+            return self.parse_string()
+        if char in "-0123456789":
+            return self.parse_number()
+        return self.parse_literal()
+
+    def parse_object(self) -> dict[str, Any]:
+        self.position += 1
+        result: dict[str, Any] = {}
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                return result
+            if self.text[self.position] == "}":
+                self.position += 1
+                return result
+            if self.text[self.position] != '"':
+                raise self.error("Expected a property name")
+            key = self.parse_string()
+            if self.truncated:
+                return result
+            self.skip_whitespace()
+            if self.at_end():
+                return result
+            if self.text[self.position] != ":":
+                raise self.error("Expected ':'")
+            self.position += 1
+            try:
+                result[key] = self.parse_value()
+            except _Incomplete:
+                return result
+            self.skip_whitespace()
+            if self.at_end():
+                return result
+            if self.text[self.position] == ",":
+                self.position += 1
+            elif self.text[self.position] != "}":
+                raise self.error("Expected ',' or '}'")
+
+    def parse_array(self) -> list[Any]:
+        self.position += 1
+        result: list[Any] = []
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                return result
+            if self.text[self.position] == "]":
+                self.position += 1
+                return result
+            try:
+                result.append(self.parse_value())
+            except _Incomplete:
+                return result
+            self.skip_whitespace()
+            if self.at_end():
+                return result
+            if self.text[self.position] == ",":
+                self.position += 1
+            elif self.text[self.position] != "]":
+                raise self.error("Expected ',' or ']'")
+
+    def parse_string(self) -> str:
+        start = self.position
+        self.position += 1
+        while not self.at_end():
+            char = self.text[self.position]
+            if char == "\\":
+                self.position += 2
+            elif char == '"':
+                self.position += 1
+                return json.loads(self.text[start : self.position])
+            else:
+                self.position += 1
+
+        # the string was cut off; drop any incomplete escape sequence at the end
+        self.position = len(self.text)
+        self.truncated = True
+        raw = self.text[start + 1 :]
+        for end in range(len(raw), max(len(raw) - 6, -1), -1):
+            try:
+                return json.loads(f'"{raw[:end]}"')
+            except ValueError:
+                continue
+        raise self.error("Invalid string")
+
+    def parse_number(self) -> float:
+        start = self.position
+        while not self.at_end() and self.text[self.position] in "+-0123456789.eE":
+            self.position += 1
+        number = self.text[start : self.position]
+        if self.at_end():
+            # the number may still be growing; use the longest valid prefix
+            number = number.rstrip("+-.eE")
+            if not number or number == "-":
+                raise self.incomplete()
+        try:
+            return json.loads(number)
+        except ValueError:
+            raise self.error(f"Invalid number {number!r}")
+
+    def parse_literal(self) -> Any:
+        remaining = self.text[self.position : self.position + 5]
+        for literal, value in LITERALS.items():
+            if remaining.startswith(literal):
+                self.position += len(literal)
+                return value
+            if literal.startswith(remaining) and self.position + len(
+                remaining
+            ) == len(self.text):
+                raise self.incomplete()
+        raise self.error("Unexpected character")
+
+
+def parse_partial_json(text: str) -> Any:
+    """
+    Parse a JSON document that may have been cut off, e.g. the arguments of a
+    function call that is still being streamed.
+
+    Unterminated strings, arrays and objects are closed where the text ends,
+    while object keys without a value and incomplete literals are dropped.
+    Returns None if no value has started yet, and raises a ValueError if the
+    text can not be the beginning of a JSON document.
+    """
+    parser = _PartialJSONParser(text)
+    try:
+        value = parser.parse_value()
+    except _Incomplete:
+        return None
+    parser.skip_whitespace()
+    if not parser.at_end():
+        raise parser.error("Extra data")
+    return value
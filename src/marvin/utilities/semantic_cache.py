@@ -0,0 +1,277 @@
+import hashlib
+import inspect
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Union
+
+from marvin.settings import settings
+from marvin.utilities.singletons import SettingsSingleton
+
+if TYPE_CHECKING:
+    import numpy
+
+# an embedder turns texts into vectors; it may be a coroutine function
+Embedder = Callable[[list[str]], Union[list[list[float]], Awaitable[list[list[float]]]]]
+
+
+def import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "The numpy package is required for the semantic cache and local"
+            " classifiers. Please install it with `pip install numpy`."
+        )
+    return numpy
+
+
+async def embed_text(embed: Embedder, text: str) -> "numpy.ndarray":
+    """
+    Embed a text as a normalized vector.
+    """
+    numpy = import_numpy()
+    embeddings = embed([text])
+    if inspect.isawaitable(embeddings):
+        embeddings = await embeddings
+    vector = numpy.asarray(embeddings[0], dtype=numpy.float32)
+    if norm := float(numpy.linalg.norm(vector)):
+        vector /= norm
+    return vector
+
+
+# rows allocated for a namespace's first vectors; the matrix doubles in size
+# as it fills, up to the cache's maximum size
+INITIAL_CAPACITY = 64
+
+
+class _Index:
+    """
+    The vectors and values of one namespace. Vectors are normalized, so the
+    cosine similarity of two vectors is their dot product.
+    """
+
+    def __init__(self, max_size: int, path: Optional[Path] = None):
+        self.max_size = max_size
+        self.path = path
+        self.vectors: Optional["numpy.ndarray"] = None
+        self.values: list[str] = []
+        self.last_used: list[float] = []
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    def allocate(self, dimensions: int, capacity: Optional[int] = None) -> None:
+        """
+        Allocate room for `capacity` vectors (`INITIAL_CAPACITY` by default),
+        keeping the stored vectors if they have `dimensions` dimensions.
+        """
+        numpy = import_numpy()
+        kept = None
+        if self.vectors is not None and self.dimensions == dimensions:
+            kept = numpy.array(self.vectors[: len(self.values)])
+        # release the memory map before its file is replaced
+        self.vectors = None
+        shape = (min(capacity or INITIAL_CAPACITY, self.max_size), dimensions)
+        if self.path is None:
+            vectors = numpy.zeros(shape, dtype=numpy.float32)
+        else:
+            vectors = numpy.lib.format.open_memmap(
+                self.path, mode="w+", dtype=numpy.float32, shape=shape
+            )
+        if kept is not None:
+            vectors[: len(kept)] = kept
+        self.vectors = vectors
+
+    def search(self, vector: "numpy.ndarray") -> tuple[Optional[int], float]:
+        if self.vectors is None or not self.values:
+            return None, 0.0
+        if self.dimensions != len(vector):
+            return None, 0.0
+        similarities = self.vectors[: len(self.values)] @ vector
+        row = int(similarities.argmax())
+        return row, float(similarities[row])
+
+    def add(self, vector: "numpy.ndarray", value: str) -> tuple[int, bool]:
+        """
+        Store a vector and its value, evicting the least recently used entry
+        if the index is full. Returns the row and whether an entry was evicted.
+        """
+        if self.dimensions != len(vector):
+            self.values, self.last_used = [], []
+            self.allocate(len(vector))
+        assert self.vectors is not None
+        if len(self.values) == len(self.vectors) < self.max_size:
+            self.allocate(len(vector), 2 * len(self.vectors))
+            assert self.vectors is not None
+        evicted = len(self.values) >= self.max_size
+        if evicted:
+            row = min(range(len(self.last_used)), key=self.last_used.__getitem__)
+            self.values[row] = value
+            self.last_used[row] = time.time()
+        else:
+            row = len(self.values)
+            self.values.append(value)
+            self.last_used.append(time.time())
+        self.vectors[row] = vector
+        return row, evicted
+
+
+class SemanticCache:
+    """
+    A cache that matches keys by meaning rather than by equality. Texts are
+    embedded, and a lookup returns the value stored for the most similar text
+    if their cosine similarity is at least `threshold`.
+
+    Entries are kept in separate namespaces of up to `max_size` entries each,
+    evicting the least recently used entry when a namespace is full. If a
+    `path` is provided, each namespace's vectors are stored in a
+    memory-mapped file under it and its values in a SQLite database, so the
+    cache survives restarts. Hits, misses and evictions are counted in
+    `stats` by namespace.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Embedder] = None,
+        threshold: float = 0.95,
+        max_size: int = 10_000,
+        path: Optional[Union[str, Path]] = None,
+    ):
+        if embed is None:
+            from marvin.utilities.embeddings import create_openai_embeddings
+
+            embed = create_openai_embeddings
+        self.embed = embed
+        self.threshold = threshold
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.stats: Counter[tuple[str, str]] = Counter()
+        self._indexes: dict[str, _Index] = {}
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        if self.path:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                str(self.path / "semantic_cache.sqlite"), check_same_thread=False
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, row"
+                " INTEGER NOT NULL, value TEXT NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (namespace, row))"
+            )
+            self._connection.commit()
+
+    async def aembed(self, text: str) -> "numpy.ndarray":
+        """
+        Embed a text as a normalized vector.
+        """
+        return await embed_text(self.embed, text)
+
+    def _get_index(self, namespace: str) -> _Index:
+        if namespace in self._indexes:
+            return self._indexes[namespace]
+        index = _Index(self.max_size)
+        if self.path is not None and self._connection is not None:
+            slug = hashlib.sha256(namespace.encode()).hexdigest()[:16]
+            index.path = self.path / f"{slug}.npy"
+            rows = self._connection.execute(
+                "SELECT value, last_used FROM entries WHERE namespace = ? ORDER BY row",
+                (namespace,),
+            ).fetchall()
+            if rows and index.path.exists():
+                vectors = import_numpy().load(index.path, mmap_mode="r+")
+                if len(rows) <= min(len(vectors), self.max_size):
+                    index.vectors = vectors
+                    index.values = [value for value, _ in rows]
+                    index.last_used = [last_used for _, last_used in rows]
+            if rows and index.vectors is None:
+                # the vectors are missing or there are more than `max_size`
+                self._connection.execute(
+                    "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                )
+                self._connection.commit()
+        self._indexes[namespace] = index
+        return index
+
+    def get(self, namespace: str, vector: "numpy.ndarray") -> Optional[str]:
+        """
+        Return the value stored for the vector most similar to `vector`, if
+        it is similar enough.
+        """
+        with self._lock:
+            index = self._get_index(namespace)
+            row, similarity = index.search(vector)
+            if row is None or similarity < self.threshold:
+                self.stats[(namespace, "misses")] += 1
+                return None
+            self.stats[(namespace, "hits")] += 1
+            index.last_used[row] = time.time()
+            return index.values[row]
+
+    def set(self, namespace: str, vector: "numpy.ndarray", value: str) -> None:
+        with self._lock:
+            index = self._get_index(namespace)
+            reset = index.dimensions not in (None, len(vector))
+            row, evicted = index.add(vector, value)
+            if evicted:
+                self.stats[(namespace, "evictions")] += 1
+            if self._connection is not None:
+                if reset:
+                    self._connection.execute(
+                        "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                    )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (namespace, row, value, index.last_used[row]),
+                )
+                self._connection.commit()
+                getattr(index.vectors, "flush", lambda: None)()
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """
+        Remove the entries of a namespace, or of all namespaces.
+        """
+        with self._lock:
+            namespaces = list(self._indexes) if namespace is None else [namespace]
+            for name in namespaces:
+                if (index := self._indexes.pop(name, None)) is not None:
+                    index.vectors = None
+            if self._connection is not None:
+                if namespace is None:
+                    self._connection.execute("DELETE FROM entries")
+                else:
+                    self._connection.execute(
+                        "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                    )
+                self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_semantic_cache = SettingsSingleton(
+    lambda: (
+        settings.semantic_cache_threshold,
+        settings.semantic_cache_max_size,
+        settings.home / "semantic_cache" if settings.semantic_cache_persist else None,
+    ),
+    lambda threshold, max_size, path: SemanticCache(
+        threshold=threshold, max_size=max_size, path=path
+    ),
+)
+
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Return the process-wide semantic cache, which embeds texts with OpenAI,
+    rebuilding it if the semantic cache settings have changed since it was
+    created.
+    """
+    return _semantic_cache.get()
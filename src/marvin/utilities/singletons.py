@@ -0,0 +1,53 @@
+import threading
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def _close(value: Any) -> None:
+    if callable(close := getattr(value, "close", None)):
+        close()
+
+
+class SettingsSingleton(Generic[T]):
+    """
+    A process-wide object built from settings. `config` returns the settings
+    the object depends on, which are passed to `build`; whenever they change,
+    the old object is closed with `close` (by default, its `close` method, if
+    any) and a new one is built.
+    """
+
+    def __init__(
+        self,
+        config: Callable[[], tuple[Any, ...]],
+        build: Callable[..., T],
+        close: Callable[[T], None] = _close,
+    ):
+        self.config = config
+        self.build = build
+        self.close = close
+        self._value: Optional[T] = None
+        self._config: Optional[tuple[Any, ...]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        config = self.config()
+        with self._lock:
+            if self._value is None or config != self._config:
+                self._reset()
+                self._value = self.build(*config)
+                self._config = config
+            return self._value
+
+    def reset(self) -> None:
+        """
+        Close the object, if it was built, so the next `get` builds a new one.
+        """
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        if self._value is not None:
+            self.close(self._value)
+        self._value = None
+        self._config = None
@@ -73,10 +73,20 @@ def slice_tokens(text: str, n_tokens: int) -> str:
     return detokenize(tokens[:n_tokens])
 
 
-def split_tokens(text: str, n_tokens: int) -> list[str]:
+def split_tokens(text: str, n_tokens: int, overlap: int = 0) -> list[str]:
+    """
+    Split a text into windows of `n_tokens` tokens, each of which repeats the
+    last `overlap` tokens of the one before it.
+    """
+    if not 0 <= overlap < n_tokens:
+        raise ValueError("overlap must be at least 0 and less than n_tokens.")
     tokens = tokenize(text)
+    step = n_tokens - overlap
     return [
-        detokenize(tokens[i : i + n_tokens]) for i in range(0, len(tokens), n_tokens)
+        detokenize(tokens[i : i + n_tokens])
+        for i in range(0, len(tokens), step)
+        # skip windows that only repeat the end of the previous one
+        if i == 0 or i + overlap < len(tokens)
     ]
 
 
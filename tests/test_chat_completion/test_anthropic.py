@@ -0,0 +1,93 @@
+import asyncio
+from types import SimpleNamespace
+
+from marvin.core.ChatCompletion.providers.anthropic import (
+    AnthropicChatCompletion,
+    close_anthropic_async_clients,
+    get_anthropic_acreate,
+    get_anthropic_async_client,
+    get_anthropic_client,
+    get_anthropic_create,
+)
+
+
+class TestAnthropicClients:
+    def test_clients_are_reused(self):
+        assert get_anthropic_client(api_key="a") is get_anthropic_client(api_key="a")
+
+    def test_clients_are_keyed_by_kwargs(self):
+        assert get_anthropic_client(api_key="a") is not get_anthropic_client(
+            api_key="b"
+        )
+
+    def test_create_splits_client_kwargs(self):
+        create, params = get_anthropic_create(
+            api_key="a", model="claude-2", prompt="hi"
+        )
+        assert create.__self__._client is get_anthropic_client(api_key="a")
+        assert params == {"model": "claude-2", "prompt": "hi"}
+
+    def test_timeouts_are_sent_per_request(self):
+        create, params = get_anthropic_create(api_key="a", timeout=599.9)
+        other, _ = get_anthropic_create(api_key="a", timeout=599.8)
+        assert create.__self__._client is other.__self__._client
+        assert params == {"timeout": 599.9}
+
+    def test_repeated_calls_reuse_one_client(self, monkeypatch):
+        from marvin.core.ChatCompletion.providers import anthropic as provider
+        from marvin.settings import settings
+
+        monkeypatch.setattr(provider, "_CLIENTS", {})
+        monkeypatch.setattr(settings, "llm_attempt_timeout_seconds", None)
+        completion = AnthropicChatCompletion(model="claude-2", api_key="a")
+
+        def send_request(**serialized_request):
+            create, _ = get_anthropic_create(**serialized_request)
+            return create
+
+        monkeypatch.setattr(completion, "_send_request", send_request)
+        monkeypatch.setattr(completion, "_parse_response", lambda response: None)
+        monkeypatch.setattr(completion, "_with_usage", lambda request, r: r)
+        for _ in range(5):
+            completion._send_and_parse(completion._serialize_request())
+        assert len(provider._CLIENTS) == 1
+
+    async def test_async_clients_are_reused_on_a_loop(self):
+        _, params = get_anthropic_acreate(api_key="a", model="claude-2")
+        assert params == {"model": "claude-2"}
+        client = get_anthropic_async_client(api_key="a")
+        assert client is get_anthropic_async_client(api_key="a")
+        await close_anthropic_async_clients()
+        assert client.is_closed()
+
+    def test_asyncio_run_closes_and_forgets_async_clients(self):
+        from marvin.core.ChatCompletion.providers import anthropic as provider
+
+        async def get_client():
+            return get_anthropic_async_client(api_key="a")
+
+        clients = [asyncio.run(get_client()) for _ in range(3)]
+        assert all(client.is_closed() for client in clients)
+        assert not any(
+            client in clients
+            for _, cached, _ in provider._ASYNC_CLIENTS.values()
+            for client in cached.values()
+        )
+
+    def test_chat_completion_drops_client_kwargs(self):
+        completion = AnthropicChatCompletion(model="claude-2", base_url="x")
+        assert "base_url" not in completion.defaults
+
+
+class TestAnthropicUsage:
+    def test_usage_is_counted_locally(self):
+        completion = AnthropicChatCompletion(model="claude-2")
+        response = completion._parse_response(
+            SimpleNamespace(log_id="1", model="claude-2", completion="Hello world")
+        )
+        usage = completion._with_usage(
+            {"prompt": "\n\nHuman: Hi\n\nAssistant: "}, response
+        ).usage
+        assert usage.prompt_tokens > 0
+        assert usage.completion_tokens == completion._count_tokens("Hello world")
+        assert usage.total_tokens == usage.prompt_tokens + usage.completion_tokens
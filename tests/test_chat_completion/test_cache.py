@@ -0,0 +1,188 @@
+import pytest
+from marvin.core.ChatCompletion.cache import ResponseCache, cache_key
+from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+from openai.openai_object import OpenAIObject
+
+
+def fake_response(content: str = "hello") -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+    )
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def _send_request(self, **serialized_request):
+        calls.append(serialized_request)
+        return fake_response(f"response {len(calls)}")
+
+    async def _send_request_async(self, **serialized_request):
+        return _send_request(self, **serialized_request)
+
+    monkeypatch.setattr(OpenAIChatCompletion, "_send_request", _send_request)
+    monkeypatch.setattr(
+        OpenAIChatCompletion, "_send_request_async", _send_request_async
+    )
+    return calls
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    from marvin.core.ChatCompletion import abstract
+
+    response_cache = ResponseCache(max_size=2)
+    monkeypatch.setattr(abstract, "get_response_cache", lambda: response_cache)
+    return response_cache
+
+
+class TestCacheKey:
+    def test_key_ignores_secrets(self):
+        request = {"model": "gpt-3.5-turbo", "messages": [{"role": "user"}]}
+        assert cache_key("x", request | {"api_key": "a"}) == cache_key(
+            "x", request | {"api_key": "b"}
+        )
+
+    def test_key_depends_on_request(self):
+        assert cache_key("x", {"temperature": 0}) != cache_key(
+            "x", {"temperature": 1}
+        )
+
+    def test_streaming_requests_are_not_cached(self):
+        assert cache_key("x", {"stream_handler": print}) is None
+
+
+class TestResponseCache:
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=2)
+        cache.set("a", {"value": 1})
+        cache.set("b", {"value": 2})
+        cache.get("a")
+        cache.set("c", {"value": 3})
+        assert cache.get("a") == {"value": 1}
+        assert cache.get("b") is None
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl_seconds=-1)
+        cache.set("a", {"value": 1})
+        assert cache.get("a") is None
+
+    def test_disk_tier(self, tmp_path):
+        path = tmp_path / "cache.sqlite"
+        ResponseCache(path=path).set("a", {"value": 1})
+        assert ResponseCache(path=path).get("a") == {"value": 1}
+
+
+class TestChatCompletionCache:
+    def test_cache_hit_returns_turn(self, calls, response_cache):
+        messages = [{"role": "user", "content": "hey"}]
+        first = OpenAIChatCompletion(provider="openai").create(
+            messages=messages, cache=True
+        )
+        second = OpenAIChatCompletion(provider="openai").create(
+            messages=messages, cache=True
+        )
+        assert len(calls) == 1
+        assert second.response.choices[0].message.content == "response 1"
+        assert second.request.messages == first.request.messages
+
+    async def test_cache_bypass(self, calls, response_cache):
+        messages = [{"role": "user", "content": "hey"}]
+        await OpenAIChatCompletion(provider="openai").acreate(
+            messages=messages, cache=True
+        )
+        turn = await OpenAIChatCompletion(provider="openai").acreate(
+            messages=messages, cache=False
+        )
+        assert len(calls) == 2
+        assert turn.response.choices[0].message.content == "response 2"
+
+
+class TestCoalescing:
+    async def test_concurrent_identical_requests_share_one_call(
+        self, monkeypatch, calls
+    ):
+        import asyncio
+
+        from marvin.settings import settings
+
+        monkeypatch.setattr(settings, "llm_coalesce_requests", True)
+        messages = [{"role": "user", "content": "hey"}]
+        turns = await asyncio.gather(
+            *[
+                OpenAIChatCompletion(provider="openai").acreate(messages=messages)
+                for _ in range(5)
+            ]
+        )
+        assert len(calls) == 1
+        assert len({id(turn.response) for turn in turns}) == 5
+        assert {turn.response.choices[0].message.content for turn in turns} == {
+            "response 1"
+        }
+
+    async def test_requests_are_not_coalesced_by_default(self, calls):
+        import asyncio
+
+        messages = [{"role": "user", "content": "hey"}]
+        await asyncio.gather(
+            *[
+                OpenAIChatCompletion(provider="openai").acreate(messages=messages)
+                for _ in range(3)
+            ]
+        )
+        assert len(calls) == 3
+
+
+class TestSingleFlight:
+    async def test_cancelling_one_caller_keeps_the_call(self):
+        import asyncio
+
+        from marvin.core.ChatCompletion.coalesce import SingleFlight
+
+        flight, release = SingleFlight(), asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("key", call))
+        follower = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == "done"
+
+    async def test_call_is_cancelled_with_its_last_caller(self):
+        import asyncio
+
+        from marvin.core.ChatCompletion.coalesce import SingleFlight
+
+        flight, cancelled = SingleFlight(), asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("key", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
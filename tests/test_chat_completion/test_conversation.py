@@ -0,0 +1,127 @@
+import pytest
+from marvin.core.ChatCompletion.handlers import Response
+from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+
+
+def reply(content, function_call=None):
+    return Response(
+        id="chatcmpl-test",
+        object="chat.completion",
+        created=0,
+        model="gpt-3.5-turbo",
+        choices=[
+            {
+                "index": 0,
+                "finish_reason": "function_call" if function_call else "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": content,
+                    "function_call": function_call,
+                },
+            }
+        ],
+        usage={"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    )
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    requests = []
+
+    def send_request(self, **serialized_request):
+        requests.append(serialized_request)
+        return reply(f"reply {len(requests)}")
+
+    monkeypatch.setattr(OpenAIChatCompletion, "_send_request", send_request)
+    return requests
+
+
+class TestConversation:
+    def test_history_is_sent_with_each_turn(self, requests):
+        with OpenAIChatCompletion(provider="openai") as conversation:
+            conversation.send([{"role": "user", "content": "one"}])
+            conversation.send([{"role": "user", "content": "two"}])
+
+        assert [m["content"] for m in requests[-1]["messages"]] == [
+            "one",
+            "reply 1",
+            "two",
+        ]
+        assert [m.content for m in conversation.history] == [
+            "one",
+            "reply 1",
+            "two",
+            "reply 2",
+        ]
+
+    def test_turns_reference_the_message_log(self, requests):
+        with OpenAIChatCompletion(provider="openai") as conversation:
+            for i in range(3):
+                conversation.send([{"role": "user", "content": str(i)}])
+
+        assert len(conversation.messages) == 6
+        assert [len(turn.request.messages) for turn in conversation.turns] == [
+            1,
+            3,
+            5,
+        ]
+        assert conversation.turns[1].response.choices[0].message.content == (
+            "reply 2"
+        )
+        assert conversation.records[1].start == 2
+        assert conversation.records[1].end == 3
+        assert conversation.turns[1].request.messages[0] is conversation.messages[0]
+
+    def test_sending_does_not_mutate_previous_turns(self, requests):
+        with OpenAIChatCompletion(provider="openai") as conversation:
+            first = conversation.send([{"role": "user", "content": "one"}])
+            conversation.send([{"role": "user", "content": "two"}])
+
+        assert len(first.request.messages) == 1
+        assert len(conversation[0].request.messages) == 1
+
+    def test_max_responses(self, requests):
+        with OpenAIChatCompletion(provider="openai") as conversation:
+            conversation.max_responses = 2
+            for i in range(5):
+                conversation.send([{"role": "user", "content": str(i)}])
+
+        assert len(conversation.messages) == 10
+        assert [record.response is None for record in conversation.records] == [
+            True,
+            True,
+            True,
+            False,
+            False,
+        ]
+        assert len(conversation.turns) == 2
+        assert conversation.last_response.choices[0].message.content == "reply 5"
+
+    def test_params_are_kept_between_turns(self, requests):
+        with OpenAIChatCompletion(provider="openai") as conversation:
+            conversation.send([{"role": "user", "content": "one"}], temperature=0.1)
+            conversation.send([{"role": "user", "content": "two"}])
+
+        assert requests[-1]["temperature"] == 0.1
+
+    def test_chain_max_responses(self, monkeypatch):
+        responses = []
+
+        def count() -> int:
+            return len(responses)
+
+        def send_request(self, **serialized_request):
+            responses.append(serialized_request)
+            if len(responses) < 4:
+                return reply(None, {"name": "count", "arguments": "{}"})
+            return reply("done")
+
+        monkeypatch.setattr(OpenAIChatCompletion, "_send_request", send_request)
+        conversation = OpenAIChatCompletion(provider="openai").chain(
+            messages=[{"role": "user", "content": "count"}],
+            functions=[count],
+            max_responses=1,
+        )
+        assert len(conversation.records) == 4
+        assert len(conversation.turns) == 1
+        assert [m.content for m in conversation.history][-2:] == ["3", "done"]
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from marvin.core.ChatCompletion.handlers import Request, Response, Turn
+from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+from marvin.settings import settings
+
+
+def function_call_response(*calls):
+    return Response(
+        id="chatcmpl-test",
+        object="chat.completion",
+        created=0,
+        model="gpt-3.5-turbo",
+        choices=[
+            {
+                "index": index,
+                "finish_reason": "function_call",
+                "message": {
+                    "role": "assistant",
+                    "function_call": {"name": name, "arguments": arguments},
+                },
+            }
+            for index, (name, arguments) in enumerate(calls)
+        ],
+        usage={"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    )
+
+
+def function_call_turn(functions, *calls):
+    return Turn(
+        request=Request(functions=functions), response=function_call_response(*calls)
+    )
+
+
+class TestAsyncCallFunction:
+    async def test_calls_run_concurrently(self):
+        async def slow_add(a: int, b: int) -> int:
+            await asyncio.sleep(0.2)
+            return a + b
+
+        def slow_multiply(a: int, b: int) -> int:
+            time.sleep(0.2)
+            return a * b
+
+        turn = function_call_turn(
+            [slow_add, slow_multiply],
+            ("slow_add", '{"a": 2, "b": 3}'),
+            ("slow_multiply", '{"a": 2, "b": 3}'),
+            ("slow_add", '{"a": 1, "b": 1}'),
+        )
+        start = time.monotonic()
+        messages = await turn.acall_function()
+        assert time.monotonic() - start < 0.5
+        assert [(m.name, m.content) for m in messages] == [
+            ("slow_add", "5"),
+            ("slow_multiply", "6"),
+            ("slow_add", "2"),
+        ]
+
+    async def test_coroutines_run_on_the_callers_loop(self):
+        loops = []
+
+        async def record_loop() -> None:
+            loops.append(asyncio.get_running_loop())
+
+        await function_call_turn([record_loop], ("record_loop", "{}")).acall_function()
+        assert loops == [asyncio.get_running_loop()]
+
+    async def test_sync_functions_run_in_the_thread_pool(self):
+        def thread_name() -> str:
+            return threading.current_thread().name
+
+        message = await function_call_turn(
+            [thread_name], ("thread_name", "{}")
+        ).acall_function()
+        assert message.content.startswith("marvin-function")
+
+    async def test_timeout(self, monkeypatch):
+        monkeypatch.setattr(settings, "function_call_timeout_seconds", 0.05)
+
+        async def hang() -> None:
+            await asyncio.sleep(10)
+
+        with pytest.raises(asyncio.TimeoutError, match="'hang'"):
+            await function_call_turn([hang], ("hang", "{}")).acall_function()
+
+    async def test_unknown_function(self):
+        with pytest.raises(ValueError, match="not found"):
+            await function_call_turn([], ("missing", "{}")).acall_function()
+
+
+async def test_achain_awaits_async_functions(monkeypatch):
+    calls = []
+
+    async def get_weather(city: str) -> str:
+        calls.append(asyncio.get_running_loop())
+        return "sunny"
+
+    responses = [
+        function_call_response(("get_weather", '{"city": "Paris"}')),
+        function_call_response(),
+    ]
+
+    async def send_request_async(self, **serialized_request):
+        return responses.pop(0)
+
+    monkeypatch.setattr(
+        OpenAIChatCompletion, "_send_request_async", send_request_async
+    )
+    conversation = await OpenAIChatCompletion(provider="openai").achain(
+        messages=[{"role": "user", "content": "weather in Paris?"}],
+        functions=[get_weather],
+    )
+    assert calls == [asyncio.get_running_loop()]
+    assert len(conversation.turns) == 2
+    assert conversation.turns[1].request.messages[-1].content == "sunny"
@@ -0,0 +1,240 @@
+import asyncio
+
+import pytest
+from marvin._compat import BaseModel
+from marvin.core.ChatCompletion.handlers import (
+    ContentDelta,
+    FunctionCallDelta,
+    StreamComplete,
+)
+from marvin.core.ChatCompletion.providers import openai as openai_provider
+from marvin.core.ChatCompletion.providers.openai import (
+    OpenAIChatCompletion,
+    OpenAIStreamAccumulator,
+    close_openai_session,
+    get_openai_session,
+    openai_session,
+)
+from marvin.utilities.async_utils import run_sync
+
+from tests.utils.streaming import fake_chunk, fake_chunks, fake_function_call_chunks
+
+
+class TestOpenAISessionPool:
+    async def test_session_is_reused_on_a_loop(self):
+        assert get_openai_session() is get_openai_session()
+        await close_openai_session()
+
+    async def test_session_is_set_for_openai(self):
+        import openai
+
+        with openai_session() as session:
+            assert openai.aiosession.get() is session
+        assert openai.aiosession.get() is None
+        await close_openai_session()
+
+    async def test_closed_session_is_replaced(self):
+        session = get_openai_session()
+        await close_openai_session()
+        assert session.closed
+        assert get_openai_session() is not session
+        await close_openai_session()
+
+    def test_run_sync_closes_session(self):
+        async def get_session():
+            await asyncio.sleep(0)
+            return get_openai_session()
+
+        session = run_sync(get_session())
+        assert session.closed
+
+    def test_asyncio_run_closes_and_forgets_session(self):
+        async def get_session():
+            return get_openai_session()
+
+        sessions = [asyncio.run(get_session()) for _ in range(5)]
+        assert all(session.closed for session in sessions)
+        assert not any(
+            session in sessions for _, session, _ in openai_provider._SESSIONS.values()
+        )
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    import openai
+
+    async def acreate(**kwargs):
+        assert kwargs["stream"]
+        return fake_chunks(
+            {"role": "assistant"},
+            {"content": "Hel"},
+            {"content": "lo"},
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+
+class TestStreaming:
+    async def test_astream(self, streamed):
+        events = [
+            event
+            async for event in OpenAIChatCompletion(provider="openai").astream(
+                messages=[{"role": "user", "content": "hey"}]
+            )
+        ]
+        assert [e.content for e in events if isinstance(e, ContentDelta)] == [
+            "Hel",
+            "lo",
+        ]
+        assert isinstance(events[-1], StreamComplete)
+        assert events[-1].response.choices[0].message.content == "Hello"
+
+    def test_stream(self, streamed):
+        events = list(
+            OpenAIChatCompletion(provider="openai").stream(
+                messages=[{"role": "user", "content": "hey"}]
+            )
+        )
+        assert events[-1].response.choices[0].message.content == "Hello"
+
+    async def test_stream_handler_is_awaited(self, streamed):
+        streamed_data = []
+
+        async def handler(message):
+            await asyncio.sleep(0)
+            streamed_data.append(message.content)
+
+        turn = await OpenAIChatCompletion(
+            provider="openai", stream_handler=handler
+        ).acreate(messages=[{"role": "user", "content": "hey"}])
+        assert streamed_data == ["Hel", "Hello"]
+        assert turn.response.choices[0].message.content == "Hello"
+
+
+@pytest.fixture
+def streamed_function_call(monkeypatch):
+    import openai
+
+    async def acreate(**kwargs):
+        return fake_function_call_chunks('{"name": ', '"Ford"}')
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+
+class TestStreamingFunctionCalls:
+    def test_accumulates_function_call(self):
+        accumulator = OpenAIStreamAccumulator()
+        accumulator.add(
+            fake_chunk(
+                {
+                    "index": 0,
+                    "delta": {"role": "assistant", "function_call": {"name": "f"}},
+                    "finish_reason": None,
+                }
+            )
+        )
+        accumulator.add(
+            fake_chunk(
+                {
+                    "index": 0,
+                    "delta": {"function_call": {"arguments": '{"x": 1}'}},
+                    "finish_reason": "function_call",
+                }
+            )
+        )
+        choice = accumulator.response().choices[0]
+        assert choice.finish_reason == "function_call"
+        assert choice.message.content is None
+        assert choice.message.function_call.name == "f"
+        assert choice.message.function_call.arguments == '{"x": 1}'
+
+    def test_accumulates_multiple_choices(self):
+        accumulator = OpenAIStreamAccumulator()
+        accumulator.add(
+            fake_chunk(
+                {"index": 0, "delta": {"content": "a"}, "finish_reason": None},
+                {"index": 1, "delta": {"content": "b"}, "finish_reason": None},
+            )
+        )
+        accumulator.add(
+            fake_chunk(
+                {"index": 0, "delta": {}, "finish_reason": "stop"},
+                {"index": 1, "delta": {}, "finish_reason": "length"},
+            )
+        )
+        choices = accumulator.response().choices
+        assert [c.message.content for c in choices] == ["a", "b"]
+        assert [c.finish_reason for c in choices] == ["stop", "length"]
+
+    async def test_stream_events(self, streamed_function_call):
+        events = [
+            event
+            async for event in OpenAIChatCompletion(provider="openai").astream(
+                messages=[{"role": "user", "content": "hey"}]
+            )
+        ]
+        assert "".join(
+            e.arguments for e in events if isinstance(e, FunctionCallDelta)
+        ) == '{"name": "Ford"}'
+
+    async def test_to_model_with_stream_handler(self, streamed_function_call):
+        class Car(BaseModel):
+            name: str
+
+        streamed_calls = []
+
+        turn = await OpenAIChatCompletion(
+            provider="openai",
+            stream_handler=lambda m: streamed_calls.append(m.function_call),
+        ).acreate(messages=[{"role": "user", "content": "hey"}], response_model=Car)
+        assert turn.to_model() == Car(name="Ford")
+        assert streamed_calls[-1].arguments == '{"name": "Ford"}'
+        assert streamed_calls[-1].name == "FormatResponse"
+
+    def test_sync_to_model_with_stream_handler(self, streamed_function_call):
+        class Car(BaseModel):
+            name: str
+
+        turn = OpenAIChatCompletion(
+            provider="openai", stream_handler=lambda m: None
+        ).create(messages=[{"role": "user", "content": "hey"}], response_model=Car)
+        assert turn.to_model() == Car(name="Ford")
+
+
+class TestStreamingUsage:
+    @pytest.fixture(autouse=True)
+    def count_characters(self, monkeypatch):
+        monkeypatch.setattr(
+            OpenAIChatCompletion,
+            "_count_tokens",
+            lambda self, text, model=None: len(text),
+        )
+
+    async def test_usage_is_counted_locally(self, streamed):
+        events = [
+            event
+            async for event in OpenAIChatCompletion(provider="openai").astream(
+                messages=[{"role": "user", "content": "hey"}]
+            )
+        ]
+        # reply priming, message overhead and content, then the completion
+        assert events[-1].usage.prompt_tokens == 3 + 4 + len("hey")
+        assert events[-1].usage.completion_tokens == len("Hello")
+        assert events[-1].response.usage == events[-1].usage
+
+    async def test_stream_handler_usage(self, streamed):
+        turn = await OpenAIChatCompletion(
+            provider="openai", stream_handler=lambda message: None
+        ).acreate(messages=[{"role": "user", "content": "hey"}])
+        assert turn.response.usage.total_tokens == 10 + 5
+
+    def test_reported_usage_is_preferred(self):
+        accumulator = OpenAIStreamAccumulator()
+        accumulator.add(
+            fake_chunk({"index": 0, "delta": {"content": "a"}, "finish_reason": None})
+        )
+        usage = {"prompt_tokens": 7, "completion_tokens": 1, "total_tokens": 8}
+        accumulator.add(fake_chunk(usage=usage))
+        completion = OpenAIChatCompletion(provider="openai")
+        response = completion._with_usage({}, accumulator.response())
+        assert response.usage.total_tokens == 8
@@ -0,0 +1,80 @@
+import pytest
+from marvin.core.ChatCompletion import ChatCompletion
+from marvin.core.ChatCompletion.rate_limit import (
+    RateLimiter,
+    TokenBucket,
+    estimate_tokens,
+    get_rate_limiter,
+)
+from marvin.settings import settings
+
+
+class TestTokenBucket:
+    def test_wait_time(self):
+        bucket = TokenBucket(capacity=60)
+        bucket.consume(60)
+        assert 0.9 < bucket.wait_time(1) <= 1
+
+    def test_requests_larger_than_capacity_do_not_block_forever(self):
+        bucket = TokenBucket(capacity=10)
+        assert bucket.wait_time(100) == 0
+
+
+class TestRateLimiter:
+    async def test_requests_per_minute(self):
+        limiter = RateLimiter(requests_per_minute=2)
+        await limiter.aacquire()
+        await limiter.aacquire()
+        assert limiter._try_acquire(0) > 0
+
+    def test_tokens_per_minute(self):
+        limiter = RateLimiter(tokens_per_minute=100)
+        limiter.acquire(80)
+        assert limiter._try_acquire(50) > 0
+        assert limiter._try_acquire(10) == 0
+
+    def test_reconcile(self):
+        limiter = RateLimiter(tokens_per_minute=100)
+        limiter.acquire(90)
+        limiter.reconcile(estimated_tokens=90, actual_tokens=20)
+        assert limiter._try_acquire(70) == 0
+
+
+class TestGetRateLimiter:
+    @pytest.fixture(autouse=True)
+    def rate_limits(self, monkeypatch):
+        monkeypatch.setattr(
+            settings,
+            "llm_rate_limits",
+            {
+                "openai": {"requests_per_minute": 10},
+                "openai/gpt-4": {"tokens_per_minute": 1000},
+            },
+        )
+
+    def test_model_limits_take_precedence(self):
+        limiter = get_rate_limiter("openai", "gpt-4")
+        assert limiter.tokens is not None and limiter.requests is None
+
+    def test_provider_limits_are_shared(self):
+        limiter = get_rate_limiter("openai", "gpt-3.5-turbo")
+        assert limiter is get_rate_limiter("openai", "gpt-3.5-turbo-16k")
+
+    def test_unconfigured_provider(self):
+        assert get_rate_limiter("anthropic", "claude-2") is None
+
+    def test_provider_is_kept_by_copies(self):
+        chat_completion = ChatCompletion("openai/gpt-4")(messages=[])
+        limiter, _ = chat_completion._get_rate_limiter({"model": "gpt-4"})
+        assert limiter is get_rate_limiter("openai", "gpt-4")
+
+
+def test_estimate_tokens(monkeypatch):
+    import marvin.utilities.strings
+
+    monkeypatch.setattr(marvin.utilities.strings, "count_tokens", len)
+    request = {
+        "messages": [{"role": "user", "content": "hello"}],
+        "max_tokens": 10,
+    }
+    assert estimate_tokens(request) == 3 + 4 + 5 + 10
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from marvin.core.ChatCompletion import retry
+from marvin.core.ChatCompletion.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_retries,
+    call_with_retries_async,
+    get_retry_after,
+    is_retryable,
+)
+from marvin.settings import settings
+
+
+class TransientError(Exception):
+    http_status = 503
+    headers = {"Retry-After": "0"}
+
+
+class BadRequestError(Exception):
+    http_status = 400
+
+
+@pytest.fixture(autouse=True)
+def fresh_circuit_breakers(monkeypatch):
+    monkeypatch.setattr(retry, "_circuit_breakers", {})
+    monkeypatch.setattr(settings, "llm_max_retries", 2)
+
+
+def flaky(failures: int, exc: Exception = TransientError()):
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise exc
+        return "ok"
+
+    return fn, calls
+
+
+class TestRetryable:
+    def test_status_codes(self):
+        assert is_retryable(TransientError())
+        assert not is_retryable(BadRequestError())
+
+    def test_retry_after(self):
+        assert get_retry_after(TransientError()) == 0
+        assert get_retry_after(BadRequestError()) is None
+
+
+class TestCallWithRetries:
+    def test_retries_transient_errors(self):
+        fn, calls = flaky(failures=2)
+        assert call_with_retries(fn, key="test") == "ok"
+        assert len(calls) == 3
+
+    def test_gives_up_after_max_retries(self):
+        fn, calls = flaky(failures=5)
+        with pytest.raises(TransientError):
+            call_with_retries(fn, key="test")
+        assert len(calls) == 3
+
+    def test_does_not_retry_bad_requests(self):
+        fn, calls = flaky(failures=1, exc=BadRequestError())
+        with pytest.raises(BadRequestError):
+            call_with_retries(fn, key="test")
+        assert len(calls) == 1
+
+    async def test_async(self):
+        sync_fn, calls = flaky(failures=1)
+
+        async def fn(timeout):
+            return sync_fn(timeout)
+
+        assert await call_with_retries_async(fn, key="test") == "ok"
+        assert len(calls) == 2
+
+    def test_attempt_timeout(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_attempt_timeout_seconds", 5.0)
+        fn, calls = flaky(failures=0)
+        call_with_retries(fn, key="test")
+        assert calls == [5.0]
+
+    def test_no_attempt_timeout_by_default(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_attempt_timeout_seconds", None)
+        fn, calls = flaky(failures=0)
+        call_with_retries(fn, key="test")
+        assert calls == [None]
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+        breaker.record_failure()
+        breaker.before_request()
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        breaker.before_request()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+        breaker.record_success()
+        breaker.before_request()
+
+    def test_open_circuit_fails_fast(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_circuit_breaker_threshold", 1)
+        fn, calls = flaky(failures=5)
+        with pytest.raises(TransientError):
+            call_with_retries(fn, key="test")
+        with pytest.raises(CircuitOpenError):
+            call_with_retries(fn, key="test")
+        assert len(calls) == 1
+
+    def test_local_errors_do_not_close_the_circuit(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_circuit_breaker_threshold", 1)
+        monkeypatch.setattr(settings, "llm_circuit_breaker_reset_seconds", 0)
+        fn, _ = flaky(failures=1)
+        with pytest.raises(TransientError):
+            call_with_retries(fn, key="test")
+
+        local, calls = flaky(failures=2, exc=ValueError("bad response"))
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                call_with_retries(local, key="test")
+        assert len(calls) == 2
+        assert retry.get_circuit_breaker("test").is_open
+
+        bad_request, _ = flaky(failures=1, exc=BadRequestError())
+        with pytest.raises(BadRequestError):
+            call_with_retries(bad_request, key="test")
+        assert not retry.get_circuit_breaker("test").is_open
+
+    def test_breakers_follow_the_settings(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_circuit_breaker_threshold", 1)
+        assert retry.get_circuit_breaker("test").threshold == 1
+        monkeypatch.setattr(settings, "llm_circuit_breaker_threshold", 3)
+        assert retry.get_circuit_breaker("test").threshold == 3
+
+    async def test_cancelled_trial_releases_the_circuit(self, monkeypatch):
+        monkeypatch.setattr(settings, "llm_circuit_breaker_threshold", 1)
+        monkeypatch.setattr(settings, "llm_circuit_breaker_reset_seconds", 0)
+
+        async def fail(timeout):
+            raise TransientError()
+
+        async def hang(timeout):
+            await asyncio.sleep(60)
+
+        async def succeed(timeout):
+            return "ok"
+
+        with pytest.raises(TransientError):
+            await call_with_retries_async(fail, key="test")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(call_with_retries_async(hang, key="test"), 0.01)
+        assert await call_with_retries_async(succeed, key="test") == "ok"
@@ -1,7 +1,13 @@
+import importlib
+import json
+import math
+import re
 from enum import Enum
 
 import pytest
 from marvin import ai_classifier
+from marvin.settings import settings
+from marvin.utilities.local_classifier import LocalClassifier
 
 from tests.utils.mark import pytest_mark_class
 
@@ -107,3 +113,452 @@ class TestMapping:
             ["good", "bad"], instructions="I want the opposite of the right answer"
         )
         assert result == [Sentiment.NEGATIVE, Sentiment.POSITIVE]
+
+
+class TestMapIter:
+    def test_map_iter(self, monkeypatch):
+        @ai_classifier
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        async def acall(cls, value, **kwargs):
+            return 1 if "good" in value else 2
+
+        monkeypatch.setattr(Sentiment, "acall", classmethod(acall))
+
+        assert list(Sentiment.map_iter(["good", "bad"])) == [
+            Sentiment.POSITIVE,
+            Sentiment.NEGATIVE,
+        ]
+        assert Sentiment.map(["bad"]) == [Sentiment.NEGATIVE]
+
+
+class FakeEncoder:
+    """
+    Encodes numbers below 12 and multiples of 10 as single tokens, and other
+    numbers digit by digit.
+    """
+
+    def encode(self, text):
+        if int(text) < 12 or int(text) % 10 == 0:
+            return [1000 + int(text)]
+        return [1000 + int(digit) for digit in text]
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    """
+    Replace the tokenizer, which can't be downloaded in tests, and record
+    the models it is loaded for.
+    """
+    import marvin.prompts.base
+
+    monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+    loaded = []
+
+    def get_tiktoken_encoding(model=None):
+        loaded.append(model)
+        return FakeEncoder()
+
+    # the module is shadowed by the decorator of the same name
+    module = importlib.import_module("marvin.components.ai_classifier")
+    monkeypatch.setattr(module, "get_tiktoken_encoding", get_tiktoken_encoding)
+    monkeypatch.setattr(module, "count_tokens", len)
+    return loaded
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """
+    Answer each request with the content computed from it by the function
+    passed to the fixture, or with a function call if it computes a dict. It
+    may also compute a pair of the answer and its log probabilities.
+    """
+    from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+    from openai.openai_object import OpenAIObject
+
+    requests = []
+
+    def respond_with(respond):
+        def choice(request):
+            response, logprobs = respond(request), None
+            if isinstance(response, tuple):
+                response, logprobs = response
+            if isinstance(response, str):
+                message = {"role": "assistant", "content": response}
+            else:
+                function_call = {
+                    "name": request["functions"][0]["name"],
+                    "arguments": json.dumps(response),
+                }
+                message = {"role": "assistant", "function_call": function_call}
+            return {
+                "index": 0,
+                "message": message,
+                "logprobs": logprobs,
+                "finish_reason": "length",
+            }
+
+        def _send_request(self, **serialized_request):
+            requests.append(serialized_request)
+            return OpenAIObject.construct_from(
+                {
+                    "id": "chatcmpl-test",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-3.5-turbo",
+                    "choices": [choice(serialized_request)],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": 1,
+                        "total_tokens": 2,
+                    },
+                }
+            )
+
+        async def _send_request_async(self, **serialized_request):
+            return _send_request(self, **serialized_request)
+
+        monkeypatch.setattr(OpenAIChatCompletion, "_send_request", _send_request)
+        monkeypatch.setattr(
+            OpenAIChatCompletion, "_send_request_async", _send_request_async
+        )
+        return requests
+
+    return respond_with
+
+
+def label_of(name):
+    """
+    Answer with the label of the option that mentions `name`.
+    """
+
+    def respond(request):
+        for line in request["messages"][0]["content"].splitlines():
+            label, _, option = line.strip().partition(". ")
+            if re.search(rf"\b{name}\b", option):
+                return label
+        raise AssertionError(f"{name} is not an option")
+
+    return respond
+
+
+class TestClassifierPlan:
+    def test_plan_matches_rendered_prompt(self, encoders):
+        @ai_classifier(instructions="be careful")
+        class Sentiment(Enum):
+            """The sentiment of a review"""
+
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        for text in ["Great!", "  several\n   lines\t ", 42]:
+            rendered = Sentiment.get_prompt()(text).to_dict()
+            request = Sentiment.as_dict(text)
+            assert request["messages"] == rendered["messages"]
+            assert request["logit_bias"] == {1001: 100, 1002: 100}
+            assert request["max_tokens"] == 1
+            assert "functions" not in request
+
+    def test_plan_is_built_once(self, encoders):
+        @ai_classifier
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        for text in ["good", "bad", "ok"]:
+            Sentiment.as_dict(text)
+        assert encoders == ["gpt-3.5-turbo"]
+        assert Sentiment.get_plan() is Sentiment.get_plan()
+
+        plan = Sentiment.get_plan(instructions="it's opposite day")
+        assert plan is not Sentiment.get_plan()
+        assert plan.options == list(Sentiment)
+
+    def test_function_mode(self, encoders):
+        @ai_classifier(mode="function")
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        request = Sentiment.as_dict("Great!")
+        assert (
+            request["response_model"] is Sentiment.get_prompt()("Great!").response_model
+        )
+        assert "logit_bias" not in request
+        assert not encoders
+
+    def test_context_fn_is_called_with_each_text(self, encoders):
+        @ai_classifier(ctx={"context_fn": lambda text: {"length": len(text)}})
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        assert "length: 4" in Sentiment.as_dict("good")["messages"][0]["content"]
+        assert "length: 3" in Sentiment.as_dict("bad")["messages"][0]["content"]
+
+    def test_lookups_override_settings_for_their_own_call(self, encoders, completions):
+        @ai_classifier
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        metadata = Sentiment.__metadata__
+        seen = []
+
+        def respond(request):
+            # concurrent calls must not see each other's settings
+            seen.append(Sentiment.__metadata__)
+            return "1"
+
+        requests = completions(respond)
+        assert Sentiment("Great!", instructions="be careful") == Sentiment.POSITIVE
+        assert "be careful" in requests[0]["messages"][0]["content"]
+        assert requests[0]["max_tokens"] == 1
+        assert Sentiment("Great!", model="gpt-4") == Sentiment.POSITIVE
+        assert requests[1]["model"] == "gpt-4"
+        assert seen == [metadata, metadata]
+        assert Sentiment.__metadata__ is metadata
+
+    def test_call_uses_the_requested_mode(self, encoders, completions):
+        @ai_classifier(mode="function")
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        requests = completions(lambda request: "2")
+
+        assert Sentiment.call("bad", mode="logit_bias") == 2
+        assert requests[0]["logit_bias"] == {1001: 100, 1002: 100}
+        assert requests[0]["max_tokens"] == 1
+
+
+class TestLargeClassifiers:
+    def test_labels_are_single_tokens(self, encoders, completions):
+        Letter = ai_classifier(Enum("Letter", [chr(65 + i) for i in range(14)]))
+
+        plan = Letter.get_plan()
+        assert plan.labels == [str(i) for i in range(1, 12)] + ["20", "30", "40"]
+        assert plan.request["logit_bias"] == {
+            1000 + int(label): 100 for label in plan.labels
+        }
+        assert "14. N (14)" not in plan.messages[0]["content"]
+        assert "40. N (14)" in plan.messages[0]["content"]
+
+        completions(label_of("M"))
+        assert Letter("the letter M") == Letter.M
+
+    def test_too_many_labels(self, encoders):
+        Number = ai_classifier(Enum("Number", [f"N{i}" for i in range(301)]))
+        with pytest.raises(ValueError, match="hierarchical"):
+            Number.as_dict("one")
+
+    def test_tokenizer_runs_out_of_labels(self, encoders, monkeypatch):
+        class DigitEncoder:
+            def encode(self, text):
+                return [int(digit) for digit in text]
+
+        module = importlib.import_module("marvin.components.ai_classifier")
+        monkeypatch.setattr(
+            module, "get_tiktoken_encoding", lambda model=None: DigitEncoder()
+        )
+        Number = ai_classifier(Enum("Number", [f"N{i}" for i in range(10)]))
+        with pytest.raises(ValueError, match="9 single-token labels"):
+            Number.as_dict("one")
+
+    def test_hierarchical(self, encoders, completions, monkeypatch):
+        monkeypatch.setattr(settings, "ai_classifier_group_size", 3)
+        Letter = ai_classifier(
+            Enum("Letter", [chr(65 + i) for i in range(7)]), mode="hierarchical"
+        )
+
+        tree = Letter.get_tree()
+        assert [option.name for option in tree.enum] == [
+            "GROUP_1",
+            "GROUP_2",
+            "GROUP_3",
+        ]
+        assert tree.enum.GROUP_2.value == "one of: D, E, F"
+        assert (
+            Letter.as_dict("the letter E")["messages"]
+            == tree.enum.as_dict("the letter E")["messages"]
+        )
+
+        requests = completions(label_of("E"))
+        assert Letter("the letter E") == Letter.E
+        assert len(requests) == 2
+
+        # a group with one option needs no request
+        requests = completions(label_of("G"))
+        assert Letter("the letter G") == Letter.G
+        assert len(requests) == 3
+
+    def test_hierarchical_with_a_power_of_the_group_size(self, monkeypatch):
+        monkeypatch.setattr(settings, "ai_classifier_group_size", 5)
+        Number = ai_classifier(
+            Enum("Number", [f"N{i}" for i in range(125)]), mode="hierarchical"
+        )
+
+        tree = Number.get_tree()
+        assert len(tree.children) == 5
+        assert [len(child.children) for child in tree.children] == [5] * 5
+        assert tree.children[0].enum.GROUP_1.value == "one of: N0, N1, N2, N3, N4"
+
+    async def test_hierarchical_async(self, encoders, completions, monkeypatch):
+        monkeypatch.setattr(settings, "ai_classifier_group_size", 2)
+        Letter = ai_classifier(
+            Enum("Letter", [chr(65 + i) for i in range(7)]), mode="hierarchical"
+        )
+
+        completions(label_of("F"))
+        assert list(Letter)[await Letter.acall("the letter F") - 1] == Letter.F
+
+
+def sentiments(request, outputs=None):
+    """
+    Classify the texts of a packed request by whether they contain "good",
+    unless `outputs` is given, and single requests by their label.
+    """
+    if "functions" not in request:
+        return "1" if "good" in request["messages"][-1]["content"] else "2"
+    texts = request["messages"][-1]["content"].splitlines()[1:]
+    return {"indexes": outputs or [1 if "good" in text else 2 for text in texts]}
+
+
+class TestMapPacked:
+    @pytest.fixture
+    def Sentiment(self, encoders):
+        @ai_classifier
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        return Sentiment
+
+    def test_map_packed(self, Sentiment, completions, monkeypatch):
+        monkeypatch.setattr(settings, "map_packed_max_inputs", 2)
+        requests = completions(sentiments)
+
+        texts = ["good", "bad", "very good", "not good", "awful"]
+        assert Sentiment.map_packed(texts) == [
+            Sentiment.POSITIVE,
+            Sentiment.NEGATIVE,
+            Sentiment.POSITIVE,
+            Sentiment.POSITIVE,
+            Sentiment.NEGATIVE,
+        ]
+        assert len(requests) == 3
+        assert "2. bad" in requests[0]["messages"][-1]["content"]
+
+    def test_token_budget(self, Sentiment, completions, monkeypatch):
+        monkeypatch.setattr(settings, "map_packed_max_tokens", 10)
+        requests = completions(sentiments)
+
+        Sentiment.map_packed(["good", "bad", "a very good film", "good"])
+        assert len(requests) == 3
+
+    async def test_mismatched_outputs_are_classified_alone(
+        self, Sentiment, completions
+    ):
+        requests = completions(lambda request: sentiments(request, outputs=[1]))
+
+        assert await Sentiment.amap_packed(["good", "bad"]) == [
+            Sentiment.POSITIVE,
+            Sentiment.NEGATIVE,
+        ]
+        assert len(requests) == 3
+        assert all("functions" not in request for request in requests[1:])
+
+    async def test_invalid_outputs_are_classified_alone(self, Sentiment, completions):
+        requests = completions(lambda request: sentiments(request, outputs=[1, 3]))
+
+        assert await Sentiment.amap_packed(["good", "bad"]) == [
+            Sentiment.POSITIVE,
+            Sentiment.NEGATIVE,
+        ]
+        assert len(requests) == 2
+        assert requests[1]["messages"][-1]["content"].endswith("bad")
+
+
+class TestLocalClassifier:
+    def test_confident_texts_are_classified_locally(self, encoders, completions):
+        def embed(texts):
+            return [[text.count("good"), text.count("bad")] for text in texts]
+
+        local = LocalClassifier(embed=embed, min_examples=2, sample_rate=0)
+
+        @ai_classifier(local=local)
+        class Sentiment(Enum):
+            POSITIVE = "Positive"
+            NEGATIVE = "Negative"
+
+        requests = completions(sentiments)
+        assert Sentiment("good") == Sentiment.POSITIVE
+        assert Sentiment("bad") == Sentiment.NEGATIVE
+        assert local.store.labels == ["POSITIVE", "NEGATIVE"]
+
+        assert Sentiment("good good") == Sentiment.POSITIVE
+        assert Sentiment.map(["so bad", "good"]) == [
+            Sentiment.NEGATIVE,
+            Sentiment.POSITIVE,
+        ]
+        assert len(requests) == 2
+
+        # calls with other settings always use the LLM
+        assert Sentiment("good", instructions="be careful") == Sentiment.POSITIVE
+        assert len(requests) == 3
+        assert len(local.store) == 2
+
+    async def test_escalations_classify_the_text_they_are_given(self, monkeypatch):
+        local = LocalClassifier(embed=lambda texts: [[1.0] for _ in texts])
+
+        @ai_classifier(local=local)
+        class Parity(Enum):
+            EVEN = "Even"
+            ODD = "Odd"
+
+        classified = []
+
+        async def acall_llm(cls, value, *args):
+            classified.append(value)
+            return 1 if int(value) % 2 == 0 else 2
+
+        monkeypatch.setattr(Parity, "_acall_llm", classmethod(acall_llm))
+        assert await Parity.acall(3) == 2
+        assert classified == ["3"]
+        assert local.store.texts == ["3"]
+
+
+class TestPredictProba:
+    def test_predict_proba(self, encoders, completions):
+        Letter = ai_classifier(Enum("Letter", ["A", "B", "C"]))
+
+        def respond(request):
+            top_logprobs = [
+                {"token": "2", "logprob": math.log(0.6)},
+                {"token": "1", "logprob": math.log(0.2)},
+                {"token": " 2", "logprob": math.log(0.1)},
+                {"token": "x", "logprob": math.log(0.1)},
+            ]
+            return "2", {"content": [{"token": "2", "top_logprobs": top_logprobs}]}
+
+        requests = completions(respond)
+        probabilities = Letter.predict_proba("the letter B", top_k=4)
+
+        assert list(probabilities) == list(Letter)
+        assert probabilities[Letter.A] == pytest.approx(0.2 / 0.9)
+        assert probabilities[Letter.B] == pytest.approx(0.7 / 0.9)
+        assert probabilities[Letter.C] == 0
+        assert len(requests) == 1
+        assert requests[0]["logprobs"] is True
+        assert requests[0]["top_logprobs"] == 4
+        assert requests[0]["max_tokens"] == 1
+
+    async def test_missing_logprobs(self, encoders, completions):
+        Letter = ai_classifier(Enum("Letter", ["A", "B"]))
+        requests = completions(lambda request: "2")
+
+        with pytest.raises(ValueError, match="no log probabilities"):
+            await Letter.apredict_proba("the letter B")
+        assert requests[0]["top_logprobs"] == 2
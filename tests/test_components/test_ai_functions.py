@@ -1,4 +1,5 @@
 import inspect
+import json
 from typing import Dict, List
 
 import pytest
@@ -6,6 +7,9 @@ from marvin import ai_fn
 from pydantic import BaseModel
 
 from tests.utils.mark import pytest_mark_class
+from openai.openai_object import OpenAIObject
+
+from tests.utils.streaming import fake_function_call_chunks
 
 
 @ai_fn
@@ -167,3 +171,344 @@ class TestAIFunctionsMap:
     async def test_invalid_async_map(self):
         with pytest.raises(TypeError, match="can't be used in 'await' expression"):
             await list_fruit_color.map(n=[2], color=["orange", "red"])
+
+
+@pytest.fixture
+def stream_arguments(monkeypatch):
+    import marvin.prompts.base
+    import openai
+
+    # avoid downloading a tokenizer to render prompts
+    monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+
+    def stream(*arguments):
+        async def acreate(**kwargs):
+            return fake_function_call_chunks(*arguments)
+
+        monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    return stream
+
+
+class TestAIFunctionStreaming:
+    async def test_list_items_are_yielded_as_they_close(self, stream_arguments):
+        stream_arguments('{"output": ["app', 'le", "ban', 'ana"', "]}")
+        assert [fruit async for fruit in list_fruit.astream(2)] == [
+            "apple",
+            "banana",
+        ]
+
+    async def test_list_of_models(self, stream_arguments):
+        class Fruit(BaseModel):
+            name: str
+
+        @ai_fn
+        def get_fruit(n: int) -> list[Fruit]:
+            """Returns a list of `n` fruit"""
+
+        stream_arguments('{"output": [{"name": "apple"}, {"na', 'me": "kiwi"}]}')
+        assert [fruit async for fruit in get_fruit.astream(2)] == [
+            Fruit(name="apple"),
+            Fruit(name="kiwi"),
+        ]
+
+    async def test_scalar_outputs_grow(self, stream_arguments):
+        @ai_fn
+        def describe(fruit: str) -> str:
+            """Describes the fruit"""
+
+        stream_arguments('{"output": "A red', ' fruit"}')
+        assert [d async for d in describe.astream("apple")] == [
+            "A red",
+            "A red fruit",
+            "A red fruit",
+        ]
+
+    def test_stream(self, stream_arguments):
+        stream_arguments('{"output": ["apple", "banana"]}')
+        assert list(list_fruit.stream(2)) == ["apple", "banana"]
+
+
+class TestAIFunctionPrompt:
+    @pytest.fixture(autouse=True)
+    def no_tokenizer(self, monkeypatch):
+        import marvin.prompts.base
+
+        monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+
+    def test_prompt_is_compiled_once(self, monkeypatch):
+        @ai_fn
+        def list_animals(n: int) -> list[str]:
+            """Returns a list of `n` animals"""
+
+        getsource = inspect.getsource
+        calls = []
+
+        def counting_getsource(obj):
+            calls.append(obj)
+            return getsource(obj)
+
+        monkeypatch.setattr(inspect, "getsource", counting_getsource)
+        first = list_animals.as_dict(1)
+        second = list_animals.as_dict(2)
+
+        assert len(calls) == 1
+        assert first["response_model"] is second["response_model"]
+        assert list_animals.get_prompt() is list_animals.get_prompt()
+
+    def test_only_arguments_change_between_calls(self):
+        first = list_fruit.as_dict(1)["messages"]
+        second = list_fruit.as_dict(5)["messages"]
+
+        assert first[0] == second[0]
+        assert "- n: 1" in first[-1]["content"]
+        assert "- n: 5" in second[-1]["content"]
+
+    def test_prompt_is_recompiled_when_fields_change(self):
+        @ai_fn
+        def list_animals(n: int) -> list[str]:
+            """Returns a list of `n` animals"""
+
+        prompt = list_animals.get_prompt()
+        list_animals.ctx = {"instructions": "Only list birds."}
+
+        assert list_animals.get_prompt() is not prompt
+        assert "Only list birds." in list_animals.as_dict(1)["messages"][0]["content"]
+
+
+class TestAIFunctionMapIter:
+    @pytest.fixture(autouse=True)
+    def fake_acall(self, monkeypatch):
+        from marvin.components.ai_function import AIFunction
+
+        async def acall(self, n: int, color: str = None):
+            if n < 0:
+                raise ValueError(n)
+            return [color or "fruit"] * n
+
+        monkeypatch.setattr(AIFunction, "acall", acall)
+
+    async def test_amap_iter(self):
+        outputs = [output async for output in list_fruit.amap_iter(range(3))]
+        assert outputs == [[], ["fruit"], ["fruit", "fruit"]]
+
+    async def test_amap_iter_unordered(self):
+        outputs = [pair async for pair in list_fruit.amap_iter([1], ordered=False)]
+        assert outputs == [(0, ["fruit"])]
+
+    def test_map_iter_return_exceptions(self):
+        outputs = list(list_fruit.map_iter([1, -1], return_exceptions=True))
+        assert outputs[0] == ["fruit"]
+        assert isinstance(outputs[1], ValueError)
+
+    def test_map_is_bounded(self, monkeypatch):
+        from marvin.settings import settings
+
+        monkeypatch.setattr(settings, "map_max_concurrency", 1)
+        assert list_fruit_color.map([1, 2], color=["red", None]) == [
+            ["red"],
+            ["fruit", "fruit"],
+        ]
+
+
+@pytest.fixture
+def function_calls(monkeypatch):
+    """
+    Answer each request with a call of its function, whose arguments are
+    computed from the request by the function passed to the fixture.
+    """
+    import marvin.components.ai_function
+    import marvin.prompts.base
+    from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+
+    monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+    monkeypatch.setattr(marvin.components.ai_function, "count_tokens", len)
+    requests = []
+
+    def respond_with(respond):
+        def _send_request(self, **serialized_request):
+            requests.append(serialized_request)
+            function_call = {
+                "name": serialized_request["functions"][0]["name"],
+                "arguments": json.dumps(respond(serialized_request)),
+            }
+            return OpenAIObject.construct_from(
+                {
+                    "id": "chatcmpl-test",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-3.5-turbo",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "function_call": function_call,
+                            },
+                            "finish_reason": "function_call",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": 1,
+                        "total_tokens": 2,
+                    },
+                }
+            )
+
+        async def _send_request_async(self, **serialized_request):
+            return _send_request(self, **serialized_request)
+
+        monkeypatch.setattr(OpenAIChatCompletion, "_send_request", _send_request)
+        monkeypatch.setattr(
+            OpenAIChatCompletion, "_send_request_async", _send_request_async
+        )
+        return requests
+
+    return respond_with
+
+
+def is_packed(serialized_request):
+    return "outputs" in serialized_request["functions"][0]["parameters"]["properties"]
+
+
+def fruit_for(serialized_request):
+    """
+    Respond with `n` fruit for each input of the request.
+    """
+    content = serialized_request["messages"][-1]["content"]
+    outputs = [
+        ["fruit"] * int(line.split(":")[1])
+        for line in content.splitlines()
+        if line.strip().startswith("- n:")
+    ]
+    if is_packed(serialized_request):
+        return {"outputs": outputs}
+    return {"output": outputs[0]}
+
+
+class TestAIFunctionMapPacked:
+    def test_inputs_are_packed_into_one_request(self, function_calls):
+        requests = function_calls(fruit_for)
+        assert list_fruit_color.map_packed([1, 2, 3]) == [
+            ["fruit"],
+            ["fruit", "fruit"],
+            ["fruit", "fruit", "fruit"],
+        ]
+        assert len(requests) == 1
+        assert is_packed(requests[0])
+
+    @pytest.mark.parametrize(
+        "setting, value", [("map_packed_max_inputs", 2), ("map_packed_max_tokens", 40)]
+    )
+    def test_batches_are_limited(self, function_calls, monkeypatch, setting, value):
+        from marvin.settings import settings
+
+        monkeypatch.setattr(settings, setting, value)
+        requests = function_calls(fruit_for)
+        assert list_fruit_color.map_packed(n=[1, 2, 3]) == [
+            ["fruit"],
+            ["fruit", "fruit"],
+            ["fruit", "fruit", "fruit"],
+        ]
+        assert len(requests) == 2
+
+    async def test_invalid_outputs_are_called_on_their_own(self, function_calls):
+        def respond(serialized_request):
+            if is_packed(serialized_request):
+                # the second output is invalid and the third is missing
+                return {"outputs": [["fruit"], "fruit"]}
+            return fruit_for(serialized_request)
+
+        requests = function_calls(respond)
+        assert await list_fruit_color.amap_packed([1, 2, 3]) == [
+            ["fruit"],
+            ["fruit", "fruit"],
+            ["fruit", "fruit", "fruit"],
+        ]
+        assert [is_packed(request) for request in requests] == [True, False, False]
+
+    async def test_models_are_returned_whole(self, function_calls):
+        class Fruit(BaseModel):
+            name: str
+
+        @ai_fn
+        def get_fruit(color: str) -> Fruit:
+            """Returns a fruit with the provided `color`"""
+
+        function_calls(lambda _: {"outputs": [{"name": "apple"}, {"name": "banana"}]})
+        fruits = await get_fruit.amap_packed(["red", "yellow"])
+        assert [fruit.name for fruit in fruits] == ["apple", "banana"]
+
+
+class TestAIFunctionSemanticCache:
+    def test_similar_calls_are_served_from_the_cache(self, function_calls):
+        from marvin.utilities.semantic_cache import SemanticCache
+
+        def embed(texts):
+            words = ["apple", "banana", "red", "yellow"]
+            return [[text.lower().count(word) for word in words] for text in texts]
+
+        cache = SemanticCache(embed=embed)
+
+        @ai_fn(semantic_cache=cache)
+        def get_color(fruit: str) -> str:
+            """Returns the color of the fruit"""
+
+        requests = function_calls(lambda _: {"output": "red"})
+        assert get_color("an apple") == "red"
+        assert get_color("Apple!") == "red"
+        assert get_color("banana") == "red"
+
+        assert len(requests) == 2
+        namespace = get_color._semantic_cache_namespace()
+        assert cache.stats[(namespace, "hits")] == 1
+        assert cache.stats[(namespace, "misses")] == 2
+
+    def test_namespace_changes_with_the_docstring(self):
+        @ai_fn
+        def get_color(fruit: str) -> str:
+            """Returns the color of the fruit"""
+
+        namespace = get_color._semantic_cache_namespace()
+        get_color.fn.__doc__ = "Returns the color of the fruit's leaves"
+        assert get_color._semantic_cache_namespace() != namespace
+
+
+class TestAIFunctionCache:
+    async def test_identical_calls_are_memoized(self, function_calls):
+        from marvin.utilities.memoization import MemoryCacheStore
+
+        @ai_fn(cache=MemoryCacheStore())
+        def get_color(fruit: str) -> str:
+            """Returns the color of the fruit"""
+
+        requests = function_calls(lambda _: {"output": "red"})
+        assert get_color("apple") == "red"
+        assert await get_color.acall("apple") == "red"
+        assert get_color("banana") == "red"
+        assert len(requests) == 2
+
+    def test_changing_the_docstring_invalidates_results(self, function_calls):
+        @ai_fn(cache=True)
+        def get_color(fruit: str) -> str:
+            """Returns the color of the fruit"""
+
+        requests = function_calls(lambda _: {"output": "red"})
+        get_color("apple")
+        get_color.fn.__doc__ = "Returns the color of the fruit's leaves"
+        get_color("apple")
+        assert len(requests) == 2
+
+    def test_models_are_memoized(self, function_calls):
+        class Fruit(BaseModel):
+            name: str
+
+        @ai_fn(cache=True)
+        def get_fruit(color: str) -> Fruit:
+            """Returns a fruit with the provided `color`"""
+
+        requests = function_calls(lambda _: {"name": "apple"})
+        assert get_fruit("red").name == "apple"
+        assert get_fruit("red").name == "apple"
+        assert len(requests) == 1
@@ -1,11 +1,16 @@
+import asyncio
+import importlib
+import json
 from typing import List, Literal, Optional
 
 import pytest
 from marvin import ai_model
+from marvin.settings import settings
 from marvin.utilities.messages import Message, Role
 from pydantic import BaseModel, Field
 
 from tests.utils.mark import pytest_mark_class
+from tests.utils.streaming import fake_function_call_chunks
 
 
 @pytest_mark_class("llm")
@@ -308,3 +313,305 @@ class TestAIModelMapping:
         assert len(result) == 2
         assert result[0].text == "Bonjour"
         assert result[1].text == "Au revoir"
+
+
+@pytest.fixture
+def stream_arguments(monkeypatch):
+    import marvin.prompts.base
+    import openai
+
+    # avoid downloading a tokenizer to render prompts
+    monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+
+    def stream(*arguments):
+        async def acreate(**kwargs):
+            assert kwargs["stream"]
+            return fake_function_call_chunks(*arguments)
+
+        monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    return stream
+
+
+class TestAIModelStreaming:
+    async def test_astream_yields_partial_models(self, stream_arguments):
+        @ai_model
+        class Car(BaseModel):
+            make: str
+            year: int
+
+        stream_arguments('{"make": "Fo', 'rd", "ye', 'ar": 1908}')
+        results = [car async for car in Car.astream("a model T")]
+
+        assert results[0].make == "Fo"
+        assert results[1].make == "Ford"
+        assert not hasattr(results[1], "year")
+        assert results[-1] == Car(make="Ford", year=1908)
+
+    def test_stream(self, stream_arguments):
+        @ai_model
+        class Car(BaseModel):
+            make: str
+
+        stream_arguments('{"make": "Ford"}')
+        assert list(Car.stream("a model T"))[-1] == Car(make="Ford")
+
+
+class TestAIModelMapIter:
+    async def test_amap_iter(self, monkeypatch):
+        @ai_model
+        class Fruit(BaseModel):
+            name: str
+
+        async def acall(cls, text: str, **kwargs):
+            return cls.construct(name=text.lower())
+
+        monkeypatch.setattr(Fruit, "acall", classmethod(acall))
+
+        async def texts():
+            yield "Apple"
+            yield "Kiwi"
+
+        fruits = [fruit async for fruit in Fruit.amap_iter(texts())]
+        assert [fruit.name for fruit in fruits] == ["apple", "kiwi"]
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """
+    Answer each extraction with the function arguments computed from its text
+    by the function passed to the fixture. Tokens are characters.
+    """
+    import marvin.prompts.base
+    import marvin.utilities.strings
+    from marvin.core.ChatCompletion.providers.openai import OpenAIChatCompletion
+    from openai.openai_object import OpenAIObject
+
+    monkeypatch.setattr(marvin.prompts.base, "count_tokens", len)
+    monkeypatch.setattr(marvin.utilities.strings, "tokenize", list)
+    monkeypatch.setattr(marvin.utilities.strings, "detokenize", "".join)
+    texts = []
+
+    def respond_with(respond):
+        async def _send_request_async(self, **serialized_request):
+            text = serialized_request["messages"][-1]["content"]
+            texts.append(text.split("The text to parse:")[-1].strip())
+            function_call = {
+                "name": serialized_request["functions"][0]["name"],
+                "arguments": json.dumps(respond(texts[-1])),
+            }
+            return OpenAIObject.construct_from(
+                {
+                    "id": "chatcmpl-test",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-3.5-turbo",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "function_call": function_call,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": 1,
+                        "total_tokens": 2,
+                    },
+                }
+            )
+
+        monkeypatch.setattr(
+            OpenAIChatCompletion, "_send_request_async", _send_request_async
+        )
+        return texts
+
+    return respond_with
+
+
+class Contract(BaseModel):
+    title: Optional[str] = None
+    parties: List[str] = []
+
+
+def parse_contract(text):
+    """
+    Take the title from a "Title:" line and the parties from "Party:" lines.
+    """
+    title, parties = None, []
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        if not value.strip():
+            continue
+        if key.strip() == "Title":
+            title = title or value.strip()
+        elif key.strip() == "Party":
+            parties.append(value.strip())
+    return {"title": title, "parties": parties}
+
+
+CONTRACT = "Title: Lease\nParty: Ann\nfiller\nParty: Bob\nParty: Ann\nTitle: Other"
+
+
+class TestAIModelMapReduce:
+    @pytest.mark.parametrize(
+        "reducer, parties",
+        [("union", ["Ann", "Bob"]), ("first", ["Ann"])],
+    )
+    async def test_reducers(self, extractions, reducer, parties):
+        texts = extractions(parse_contract)
+        contract = await ai_model(Contract).amap_reduce(
+            CONTRACT, reducer=reducer, chunk_tokens=24, overlap_tokens=12
+        )
+
+        assert contract.title == "Lease"
+        assert contract.parties == parties
+        assert texts[0].startswith("Title: Lease")
+        assert len(texts) > 1
+
+    async def test_llm_reducer(self, extractions):
+        def respond(text):
+            if text.startswith("["):
+                drafts = json.loads(text)
+                return {"title": "Consolidated", "parties": [len(drafts)]}
+            return parse_contract(text)
+
+        texts = extractions(respond)
+        contract = await ai_model(Contract).amap_reduce(
+            CONTRACT, reducer="llm", chunk_tokens=40, overlap_tokens=0
+        )
+
+        assert contract.title == "Consolidated"
+        assert contract.parties == ["2"]
+        assert len(texts) == 3
+
+    async def test_function_reducer(self, extractions):
+        extractions(parse_contract)
+
+        async def last(contracts):
+            return contracts[-1]
+
+        contract = await ai_model(Contract).amap_reduce(
+            CONTRACT, reducer=last, chunk_tokens=40, overlap_tokens=0
+        )
+        assert contract.title == "Other"
+
+    async def test_long_texts_are_map_reduced(self, extractions, monkeypatch):
+        module = importlib.import_module("marvin.components.ai_model")
+        monkeypatch.setattr(module, "get_document_limit", lambda model: 40)
+        monkeypatch.setattr(settings, "ai_model_chunk_tokens", 33)
+        monkeypatch.setattr(settings, "ai_model_chunk_overlap", 11)
+        texts = extractions(parse_contract)
+
+        contract = await ai_model(Contract).acall("Title: Short")
+        assert contract.title == "Short" and len(texts) == 1
+
+        # five lines of 11 characters, parsed as two windows of three lines
+        parties = [f"P{i:02d}" for i in range(5)]
+        text = "".join(f"Party: {party}\n" for party in parties)
+        contract = await ai_model(Contract).acall(text)
+        assert contract.parties == parties
+        assert len(texts) == 3
+
+    async def test_unknown_reducer(self):
+        with pytest.raises(ValueError, match="reducer"):
+            await ai_model(Contract).amap_reduce(CONTRACT, reducer="last")
+
+    async def test_texts_for_unknown_models_are_not_split(
+        self, extractions, monkeypatch
+    ):
+        module = importlib.import_module("marvin.components.ai_model")
+        monkeypatch.setattr(module, "count_tokens", len)
+        texts = extractions(parse_contract)
+
+        assert module.get_document_limit("openai/gpt-4-1106-preview") is None
+        contract = await ai_model(Contract, model="openai/gpt-4-1106-preview").acall(
+            CONTRACT * 100
+        )
+        assert contract.title == "Lease" and len(texts) == 1
+
+    def test_document_limit_is_clamped(self, monkeypatch):
+        module = importlib.import_module("marvin.components.ai_model")
+        monkeypatch.setattr(settings, "llm_max_tokens", 4000)
+        assert module.get_document_limit("openai/gpt-3.5-turbo") == max(
+            module.MIN_DOCUMENT_TOKENS, 2 * settings.ai_model_chunk_overlap
+        )
+
+
+class TestAIModelMap:
+    @pytest.fixture
+    def Fruit(self, monkeypatch):
+        @ai_model
+        class Fruit(BaseModel):
+            name: str
+            color: Optional[str] = None
+
+        async def acall(cls, text: str, color: Optional[str] = None, **kwargs):
+            await asyncio.sleep(0.001)
+            return cls.construct(name=text.lower(), color=color)
+
+        monkeypatch.setattr(Fruit, "acall", classmethod(acall))
+        return Fruit
+
+    async def test_keyword_arguments_are_indexed_per_text(self, Fruit):
+        fruits = await Fruit.amap(["Apple", "Kiwi"], color=["red", "green"])
+        assert [(f.name, f.color) for f in fruits] == [
+            ("apple", "red"),
+            ("kiwi", "green"),
+        ]
+
+        fruits = await Fruit.amap(["Apple", "Kiwi"], color="red")
+        assert [f.color for f in fruits] == ["red", "red"]
+
+    def test_map(self, Fruit):
+        assert [f.name for f in Fruit.map(["Apple", "Kiwi"])] == ["apple", "kiwi"]
+
+    async def test_max_concurrency(self, Fruit):
+        running, most = 0, 0
+        acall = Fruit.acall
+
+        async def track(text: str, **kwargs):
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            try:
+                return await acall(text, **kwargs)
+            finally:
+                running -= 1
+
+        Fruit.acall = track
+        await Fruit.amap([str(i) for i in range(20)], max_concurrency=3)
+        assert most == 3
+
+    async def test_columns(self, Fruit):
+        columns = await Fruit.amap(
+            ["Apple", "Kiwi"], color=["red", "green"], output="columns"
+        )
+        assert columns == {"name": ["apple", "kiwi"], "color": ["red", "green"]}
+
+    async def test_arrow(self, Fruit):
+        pytest.importorskip("pyarrow")
+        table = await Fruit.amap(["Apple", "Kiwi"], output="arrow")
+        assert table.column("name").to_pylist() == ["apple", "kiwi"]
+
+    async def test_unknown_output(self, Fruit):
+        with pytest.raises(ValueError, match="output"):
+            await Fruit.amap(["Apple"], output="rows")
+
+    async def test_chunks(self, Fruit):
+        def texts():
+            for i in range(5):
+                yield f"Fruit {i}"
+
+        chunks = [chunk async for chunk in Fruit.amap_chunks(texts(), chunk_size=2)]
+        assert [chunk["name"] for chunk in chunks] == [
+            ["fruit 0", "fruit 1"],
+            ["fruit 2", "fruit 3"],
+            ["fruit 4"],
+        ]
+
+        chunks = list(Fruit.map_chunks(["Apple"], output="models", color="red"))
+        assert chunks == [[Fruit.construct(name="apple", color="red")]]
@@ -0,0 +1,48 @@
+from typing import Annotated
+
+from marvin._compat import cast_to_json, cast_to_model
+from pydantic import BaseModel, Field
+
+
+class TestCastCache:
+    def test_models_are_reused(self):
+        assert cast_to_model(list[str]) is cast_to_model(list[str])
+
+    def test_models_are_keyed_by_arguments(self):
+        assert cast_to_model(list[str], name="A") is not cast_to_model(
+            list[str], name="B"
+        )
+        assert cast_to_model(list[str], field_name="a") is not cast_to_model(
+            list[str], field_name="b"
+        )
+
+    def test_functions_are_keyed_by_identity(self):
+        def make():
+            def fn(x: int) -> int:
+                """Doubles x"""
+
+            return fn
+
+        assert cast_to_model(make()) is not cast_to_model(make())
+
+    def test_changed_docstrings_are_not_stale(self):
+        def fn(x: int) -> int:
+            """Doubles x"""
+
+        assert cast_to_json(fn)["description"] == "Doubles x"
+        fn.__doc__ = "Triples x"
+        assert cast_to_json(fn)["description"] == "Triples x"
+
+    def test_schemas_are_copies(self):
+        class Fruit(BaseModel):
+            name: str
+
+        schema = cast_to_json(Fruit)
+        schema["parameters"]["properties"].clear()
+        assert cast_to_json(Fruit)["parameters"]["properties"]
+
+    def test_annotated_types(self):
+        annotated = Annotated[str, Field(description="A fruit")]
+        schema = cast_to_json(annotated)
+        assert schema["description"] == "A fruit"
+        assert cast_to_model(str).__doc__ != "A fruit"
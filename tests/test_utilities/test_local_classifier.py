@@ -0,0 +1,93 @@
+import pytest
+from marvin.utilities.local_classifier import LocalClassifier
+
+VOCABULARY = ["apple", "banana", "red", "yellow"]
+
+
+def embed(texts):
+    return [[text.lower().count(word) for word in VOCABULARY] for text in texts]
+
+
+class Labeler:
+    """
+    Labels texts about apples and bananas as fruit, and others as colors,
+    like an LLM would.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, text):
+        self.calls += 1
+        return "FRUIT" if "apple" in text or "banana" in text else "COLOR"
+
+
+@pytest.fixture
+def classifier():
+    return LocalClassifier(embed=embed, min_examples=4, sample_rate=0)
+
+
+class TestLocalClassifier:
+    async def test_escalates_until_it_has_learned_enough(self, classifier):
+        labeler = Labeler()
+        for text in ["apple", "red", "banana"]:
+            await classifier.aclassify(text, labeler)
+        assert classifier.predict(await _embed("apple")) == (None, 0.0)
+
+        await classifier.aclassify("yellow", labeler)
+        assert labeler.calls == 4
+
+        assert await classifier.aclassify("an apple", labeler) == "FRUIT"
+        assert await classifier.aclassify("red red", labeler) == "COLOR"
+        assert labeler.calls == 4
+        assert classifier.stats == {"escalated": 4, "local": 2}
+
+    async def test_uncertain_texts_are_escalated(self, classifier):
+        labeler = Labeler()
+        for text in ["apple", "red", "banana", "yellow"]:
+            await classifier.aclassify(text, labeler)
+
+        assert await classifier.aclassify("a red apple", labeler) == "FRUIT"
+        assert labeler.calls == 5
+        assert len(classifier.store) == 5
+
+    async def test_accuracy_monitor(self):
+        classifier = LocalClassifier(
+            embed=embed, min_examples=2, sample_rate=1, min_accuracy=0.5, window=2
+        )
+        for text in ["apple", "red"]:
+            await classifier.aclassify(text, Labeler())
+
+        async def contrarian(text):
+            return "COLOR"
+
+        # every confident prediction is checked, and these disagree
+        assert await classifier.aclassify("an apple", contrarian) == "COLOR"
+        assert await classifier.aclassify("apple apple", contrarian) == "COLOR"
+        assert classifier.accuracy == 0.0
+        assert classifier.stats["disagreed"] == 2
+
+        # an untrusted classifier escalates everything
+        classifier.sample_rate = 0
+        labeler = Labeler()
+        await classifier.aclassify("apple", labeler)
+        assert labeler.calls == 1
+
+    async def test_labels_are_persisted(self, tmp_path):
+        path = tmp_path / "labels.sqlite"
+        classifier = LocalClassifier(embed=embed, min_examples=2, path=path)
+        for text in ["apple", "red"]:
+            await classifier.aclassify(text, Labeler())
+        classifier.close()
+
+        classifier = LocalClassifier(embed=embed, min_examples=2, path=path)
+        assert classifier.store.texts == ["apple", "red"]
+        label, probability = classifier.predict(await _embed("apple"))
+        assert label == "FRUIT" and probability > 0.99
+        classifier.close()
+
+
+async def _embed(text):
+    from marvin.utilities.semantic_cache import embed_text
+
+    return await embed_text(embed, text)
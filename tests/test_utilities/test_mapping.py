@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+from marvin.settings import settings
+from marvin.utilities.mapping import (
+    MapProgress,
+    amap,
+    amap_as_completed,
+    amap_ordered,
+    map_calls,
+    pack,
+)
+
+
+async def sleep_and_return(delay: float) -> float:
+    await asyncio.sleep(delay)
+    return delay
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, x: int) -> int:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.001 * (x % 3))
+        self.running -= 1
+        return x
+
+
+class TestMap:
+    async def test_results_are_ordered(self):
+        assert await amap(sleep_and_return, [0.03, 0.01, 0.02]) == [0.03, 0.01, 0.02]
+
+    async def test_as_completed_yields_indices_in_completion_order(self):
+        results = [
+            pair async for pair in amap_as_completed(sleep_and_return, [0.03, 0.01])
+        ]
+        assert results == [(1, 0.01), (0, 0.03)]
+
+    @pytest.mark.parametrize("ordered", [True, False])
+    async def test_max_concurrency(self, ordered):
+        tracker = ConcurrencyTracker()
+        if ordered:
+            results = [
+                x async for x in amap_ordered(tracker, range(50), max_concurrency=4)
+            ]
+        else:
+            results = [
+                x
+                async for _, x in amap_as_completed(
+                    tracker, range(50), max_concurrency=4
+                )
+            ]
+        assert sorted(results) == list(range(50))
+        assert tracker.max_running == 4
+
+    async def test_default_max_concurrency(self, monkeypatch):
+        monkeypatch.setattr(settings, "map_max_concurrency", 2)
+        tracker = ConcurrencyTracker()
+        await amap(tracker, range(10))
+        assert tracker.max_running == 2
+
+    async def test_invalid_max_concurrency(self):
+        with pytest.raises(ValueError):
+            await amap(sleep_and_return, [0], max_concurrency=0)
+
+    async def test_inputs_are_read_lazily(self):
+        read = []
+
+        def inputs():
+            for i in range(1000):
+                read.append(i)
+                yield i
+
+        results = amap_ordered(ConcurrencyTracker(), inputs(), max_concurrency=3)
+        async for result in results:
+            assert result == 0
+            break
+        await results.aclose()
+        assert len(read) <= 4
+
+    async def test_async_iterable_inputs(self):
+        async def inputs():
+            for i in range(5):
+                yield i
+
+        assert await amap(ConcurrencyTracker(), inputs()) == [0, 1, 2, 3, 4]
+
+    async def test_return_exceptions(self):
+        async def invert(x: int) -> float:
+            return 1 / x
+
+        results = await amap(invert, [1, 0, 2], return_exceptions=True)
+        assert results[0] == 1 and results[2] == 0.5
+        assert isinstance(results[1], ZeroDivisionError)
+
+    async def test_exceptions_cancel_pending_calls(self):
+        cancelled = []
+
+        async def fail_fast(delay: float) -> float:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            raise ValueError(delay)
+
+        with pytest.raises(ValueError):
+            await amap(fail_fast, [0.0, 1.0, 2.0])
+        assert cancelled == [1.0, 2.0]
+
+    @pytest.mark.parametrize("is_async", [True, False])
+    async def test_progress(self, is_async):
+        updates = []
+
+        def record(progress: MapProgress):
+            updates.append((progress.completed, progress.failed, progress.total))
+
+        async def arecord(progress: MapProgress):
+            record(progress)
+
+        async def check(x: int) -> int:
+            if x < 0:
+                raise ValueError(x)
+            return x
+
+        await amap(
+            check,
+            [1, -1, 2],
+            return_exceptions=True,
+            max_concurrency=1,
+            on_progress=arecord if is_async else record,
+        )
+        assert updates == [(1, 0, 3), (1, 1, 3), (2, 1, 3)]
+
+
+class TestPack:
+    def test_max_inputs(self):
+        assert pack([1] * 5, max_inputs=2) == [[0, 1], [2, 3], [4]]
+
+    def test_max_tokens(self):
+        assert pack([3, 3, 5, 1, 9, 1], max_tokens=6) == [
+            [0, 1],
+            [2, 3],
+            [4],
+            [5],
+        ]
+
+    def test_defaults(self, monkeypatch):
+        monkeypatch.setattr(settings, "map_packed_max_inputs", 3)
+        assert pack([1] * 4) == [[0, 1, 2], [3]]
+        assert pack([]) == []
+
+
+class TestMapCalls:
+    def test_lists_are_indexed_and_padded(self):
+        calls = list(map_calls(([1, 2],), {"x": ["a"]}))
+        assert calls == [([1], {"x": "a"}), ([2], {"x": None})]
+
+    def test_every_argument_must_be_a_list(self):
+        with pytest.raises(TypeError):
+            list(map_calls((2,), {"x": ["a", "b"]}))
+
+    def test_broadcast(self):
+        calls = list(map_calls(([1, 2],), {"x": ["a"], "y": "b"}, broadcast=True))
+        assert calls == [([1], {"x": "a", "y": "b"}), ([2], {"x": None, "y": "b"})]
+
+        with pytest.raises(ValueError):
+            map_calls(("a",), {}, broadcast=True)
+
+    def test_broadcast_indexes_any_sequence(self):
+        calls = list(map_calls((("a", "b"),), {"x": range(2)}, broadcast=True))
+        assert calls == [(["a"], {"x": 0}), (["b"], {"x": 1})]
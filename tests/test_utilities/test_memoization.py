@@ -0,0 +1,79 @@
+import time
+
+import pytest
+from marvin.utilities.memoization import (
+    JSONDirectoryCacheStore,
+    MemoryCacheStore,
+    SQLiteCacheStore,
+    TieredCacheStore,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite", "json"])
+def make_store(request, tmp_path):
+    def make_store(**kwargs):
+        if request.param == "memory":
+            return MemoryCacheStore(**kwargs)
+        if request.param == "sqlite":
+            return SQLiteCacheStore(tmp_path / "cache.sqlite", **kwargs)
+        return JSONDirectoryCacheStore(tmp_path / "cache", **kwargs)
+
+    return make_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+class TestCacheStores:
+    def test_get_and_set(self, make_store):
+        store = make_store()
+        assert store.get("a") is None
+        store.set("a", "1")
+        assert store.get("a") == "1"
+        store.clear()
+        assert store.get("a") is None
+
+    def test_ttl(self, make_store, clock):
+        store = make_store(ttl_seconds=10)
+        store.set("a", "1")
+        clock[0] += 5
+        assert store.get("a") == "1"
+        clock[0] += 10
+        assert store.get("a") is None
+
+    def test_least_recently_used_entries_are_evicted(self, make_store, clock):
+        store = make_store(max_size=2)
+        for key in ["a", "b"]:
+            clock[0] += 1
+            store.set(key, key)
+        clock[0] += 1
+        assert store.get("a") == "a"
+        clock[0] += 1
+        store.set("c", "c")
+
+        assert store.get("b") is None
+        assert store.get("a") == "a"
+        assert store.get("c") == "c"
+
+    def test_persistent_stores_survive_restarts(self, tmp_path):
+        SQLiteCacheStore(tmp_path / "cache.sqlite").set("a", "1")
+        JSONDirectoryCacheStore(tmp_path / "cache").set("a", "1")
+
+        assert SQLiteCacheStore(tmp_path / "cache.sqlite").get("a") == "1"
+        assert JSONDirectoryCacheStore(tmp_path / "cache").get("a") == "1"
+
+    def test_tiered_store_keeps_creation_times(self, tmp_path, clock):
+        SQLiteCacheStore(tmp_path / "cache.sqlite").set("a", "1")
+        clock[0] += 5
+
+        store = TieredCacheStore(
+            SQLiteCacheStore(tmp_path / "cache.sqlite", ttl_seconds=10)
+        )
+        assert store.get("a") == "1"
+        assert store.memory.get("a") == "1"
+        clock[0] += 6
+        assert store.get("a") is None
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from marvin.utilities.partial_json import parse_partial_json
+
+
+class TestParsePartialJSON:
+    @pytest.mark.parametrize(
+        "text,expected",
+        [
+            ("", None),
+            ("  ", None),
+            ("{", {}),
+            ('{"na', {}),
+            ('{"name"', {}),
+            ('{"name": ', {}),
+            ('{"name": "Fo', {"name": "Fo"}),
+            ('{"name": "Ford", "year": 19', {"name": "Ford", "year": 19}),
+            ('{"year": 19.', {"year": 19}),
+            ('{"year": -', {}),
+            ('{"new": tr', {}),
+            ('{"new": true, "tags": ["a", "b', {"new": True, "tags": ["a", "b"]}),
+            ('[{"a": 1}, {"a": nu', [{"a": 1}, {}]),
+            ('"escaped \\', "escaped "),
+            ('"unicode \\u00', "unicode "),
+            ('"quote \\"', 'quote "'),
+        ],
+    )
+    def test_partial_documents(self, text, expected):
+        assert parse_partial_json(text) == expected
+
+    def test_every_prefix_of_a_document(self):
+        document = json.dumps(
+            {"a": [1, 2.5, {"b": None}], "c": 'd\n"e"', "f": False}
+        )
+        for end in range(len(document)):
+            parse_partial_json(document[:end])
+        assert parse_partial_json(document) == json.loads(document)
+
+    @pytest.mark.parametrize("text", ["x", "{]", '{"a" 1', '{"a": 1} 2', "[1 2"])
+    def test_invalid_documents(self, text):
+        with pytest.raises(ValueError):
+            parse_partial_json(text)
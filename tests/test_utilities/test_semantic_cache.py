@@ -0,0 +1,100 @@
+import pytest
+from marvin.utilities import semantic_cache
+from marvin.utilities.semantic_cache import SemanticCache
+
+VOCABULARY = ["apple", "banana", "red", "yellow", "fruit"]
+
+
+def embed(texts):
+    return [[text.lower().count(word) for word in VOCABULARY] for text in texts]
+
+
+async def aembed(texts):
+    return embed(texts)
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(embed=embed, threshold=0.9)
+
+
+class TestSemanticCache:
+    async def test_similar_texts_hit(self, cache):
+        cache.set("fruit", await cache.aembed("a red apple"), "apple")
+        assert cache.get("fruit", await cache.aembed("RED apple?")) == "apple"
+        assert cache.stats[("fruit", "hits")] == 1
+
+    async def test_different_texts_miss(self, cache):
+        cache.set("fruit", await cache.aembed("a red apple"), "apple")
+        assert cache.get("fruit", await cache.aembed("a yellow banana")) is None
+        assert cache.stats[("fruit", "misses")] == 1
+
+    async def test_namespaces_are_separate(self, cache):
+        cache.set("fruit", await cache.aembed("apple"), "apple")
+        assert cache.get("other", await cache.aembed("apple")) is None
+        cache.clear("fruit")
+        assert cache.get("fruit", await cache.aembed("apple")) is None
+
+    async def test_async_embedder(self):
+        cache = SemanticCache(embed=aembed)
+        cache.set("fruit", await cache.aembed("apple"), "apple")
+        assert cache.get("fruit", await cache.aembed("apple")) == "apple"
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        cache = SemanticCache(embed=embed, max_size=2)
+        apple, banana, red = [
+            await cache.aembed(text) for text in ["apple", "banana", "red"]
+        ]
+        cache.set("fruit", apple, "apple")
+        cache.set("fruit", banana, "banana")
+        assert cache.get("fruit", apple) == "apple"
+        cache.set("fruit", red, "red")
+
+        assert cache.get("fruit", banana) is None
+        assert cache.get("fruit", apple) == "apple"
+        assert cache.get("fruit", red) == "red"
+        assert cache.stats[("fruit", "evictions")] == 1
+
+    async def test_persistence(self, tmp_path):
+        cache = SemanticCache(embed=embed, path=tmp_path, max_size=4)
+        cache.set("fruit", await cache.aembed("apple"), "apple")
+        cache.close()
+
+        cache = SemanticCache(embed=embed, path=tmp_path, max_size=4)
+        assert cache.get("fruit", await cache.aembed("an apple")) == "apple"
+        assert cache.get("fruit", await cache.aembed("banana")) is None
+        cache.close()
+
+    async def test_persisted_entries_beyond_the_max_size_are_dropped(self, tmp_path):
+        cache = SemanticCache(embed=embed, path=tmp_path, max_size=4)
+        cache.set("fruit", await cache.aembed("apple"), "apple")
+        cache.set("fruit", await cache.aembed("banana"), "banana")
+        cache.close()
+
+        cache = SemanticCache(embed=embed, path=tmp_path, max_size=8)
+        assert cache.get("fruit", await cache.aembed("apple")) == "apple"
+        cache.close()
+
+        cache = SemanticCache(embed=embed, path=tmp_path, max_size=1)
+        assert cache.get("fruit", await cache.aembed("apple")) is None
+        cache.set("fruit", await cache.aembed("banana"), "banana")
+        assert cache.get("fruit", await cache.aembed("banana")) == "banana"
+        cache.close()
+
+    @pytest.mark.parametrize("persist", [False, True])
+    async def test_vectors_grow_as_entries_are_added(
+        self, monkeypatch, tmp_path, persist
+    ):
+        monkeypatch.setattr(semantic_cache, "INITIAL_CAPACITY", 2)
+        cache = SemanticCache(
+            embed=embed, max_size=6, path=tmp_path if persist else None
+        )
+        capacities = []
+        for word in VOCABULARY:
+            cache.set("fruit", await cache.aembed(word), word)
+            capacities.append(len(cache._get_index("fruit").vectors))
+
+        assert capacities == [2, 2, 4, 4, 6]
+        for word in VOCABULARY:
+            assert cache.get("fruit", await cache.aembed(word)) == word
+        cache.close()
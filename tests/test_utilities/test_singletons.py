@@ -0,0 +1,33 @@
+from marvin.utilities.singletons import SettingsSingleton
+
+
+class Resource:
+    def __init__(self, size: int):
+        self.size = size
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestSettingsSingleton:
+    def test_rebuilt_when_settings_change(self):
+        config = {"size": 1}
+        singleton = SettingsSingleton(lambda: (config["size"],), Resource)
+
+        first = singleton.get()
+        assert singleton.get() is first
+
+        config["size"] = 2
+        second = singleton.get()
+        assert second is not first and second.size == 2
+        assert first.closed and not second.closed
+
+    def test_reset(self):
+        closed = []
+        singleton = SettingsSingleton(lambda: (1,), Resource, close=closed.append)
+
+        first = singleton.get()
+        singleton.reset()
+        assert closed == [first]
+        assert singleton.get() is not first
@@ -0,0 +1,35 @@
+from openai.openai_object import OpenAIObject
+
+
+def fake_chunk(*choices, **fields):
+    return OpenAIObject.construct_from(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": list(choices),
+            **fields,
+        }
+    )
+
+
+def fake_chunks(*deltas, finish_reason="stop"):
+    async def chunks():
+        for delta in deltas:
+            yield fake_chunk({"index": 0, "delta": delta, "finish_reason": None})
+        yield fake_chunk({"index": 0, "delta": {}, "finish_reason": finish_reason})
+
+    return chunks()
+
+
+def fake_function_call_chunks(*arguments, name="FormatResponse"):
+    """
+    Stream a function call whose arguments arrive in the given pieces.
+    """
+    return fake_chunks(
+        {"role": "assistant", "content": None},
+        {"function_call": {"name": name, "arguments": ""}},
+        *({"function_call": {"arguments": part}} for part in arguments),
+        finish_reason="function_call",
+    )